@@ -22,11 +22,49 @@ import concurrent.futures
 import argparse
 import time
 import json
+import hashlib
+import shutil
+import threading
 from typing import List, Dict
 from pathlib import Path
 
 VERSION = "2.0.0"
 
+# Build cache: sources are identified by content hash (size and mtime only
+# spare re-reading unchanged files), and the release files are joined from
+# per-file minified fragments (with their source maps) kept in FRAGMENTS_DIR,
+# minified in parallel
+CACHE_FILE = '.build_cache'
+CACHE_VERSION = 3
+FRAGMENTS_DIR = '.build_fragments'
+
+# terser arguments of every fragment (part of the cache key)
+TERSER_FLAGS = ["--source-map"]
+
+BASE64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+BASE64_VALUES = {char: value for value, char in enumerate(BASE64)}
+
+# --watch: the sources are scanned every WATCH_POLL seconds and rebuilt once
+# they stay unchanged for WATCH_DEBOUNCE seconds
+WATCH_POLL = 0.1
+WATCH_DEBOUNCE = 0.1
+
+# ES module bundles of the engine, built by `bun build` (packages stay
+# imports); its metafile gives the modules of each bundle, the sources of
+# the target in the build cache, and the bytes each of them adds
+NODE_BUNDLE_ENTRY = 'creator.mjs'
+WEB_BUNDLE_ENTRY = 'src/core.js'
+NODE_BUNDLE = 'creator.bundle.mjs'  # next to creator.mjs: it reads ./package.json from import.meta.url
+WEB_BUNDLE = 'js/creator_web.bundle.mjs'
+
+# --startup: runs of `creator --help` timed from the sources and from the bundle
+STARTUP_RUNS = 10
+
+# terser runs shared by every target, one per source file contents
+terser_pool = None
+fragment_jobs: Dict[str, concurrent.futures.Future] = {}
+fragment_lock = threading.Lock()
+
 # ANSI Colors
 class Colors:
     RED = '\033[0;31m'
@@ -51,6 +89,9 @@ def parse_args():
     parser = argparse.ArgumentParser(description='CREATOR build script')
     parser.add_argument('--debug', action='store_true', help='Build debug versions')
     parser.add_argument('--nocache', action='store_true', help='Disable build caching')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='Parallel terser processes')
+    parser.add_argument('--watch', action='store_true', help='Keep running and rebuild the targets of every changed source')
+    parser.add_argument('--startup', action='store_true', help='Measure the CLI start-up time, bundle against sources')
     return parser.parse_args()
 
 def is_deps_installation_needed() -> bool:
@@ -122,107 +163,523 @@ def get_js_files_recursively(directory: str) -> List[str]:
                 js_files.append(relative_path.replace('\\', '/'))
     return sorted(js_files)  # Sort for consistent order
 
-def get_file_hash(filepath: str) -> float:
-    """Get file modification time as a cache key"""
+def get_file_stat(filepath: str) -> List[int]:
+    """Get file size and modification time (ns), the fast pre-check"""
     try:
-        return os.path.getmtime(filepath)
+        stat = os.stat(filepath)
+        return [stat.st_size, stat.st_mtime_ns]
     except OSError:
-        return 0
+        return [0, 0]
+
+def get_file_hash(filepath: str, cache: Dict) -> str:
+    """Get the SHA-256 of the file contents, re-read only if size or mtime changed"""
+    stat = get_file_stat(filepath)
+    entry = cache['files'].get(filepath)
+    if entry and entry['stat'] == stat:
+        return entry['sha256']
 
-def load_build_cache() -> Dict:
+    try:
+        with open(filepath, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ''
+
+    # a file written within the last second may change again with the same
+    # mtime: its stat is not trusted until it is older
+    trusted = stat[1] < time.time_ns() - 1_000_000_000
+    cache['files'][filepath] = {'stat': stat if trusted else None, 'sha256': digest}
+    return digest
+
+def get_terser_version() -> str:
+    """Get the installed terser version"""
+    try:
+        with open(os.path.join('node_modules', 'terser', 'package.json')) as f:
+            return json.load(f).get('version', 'unknown')
+    except (OSError, json.JSONDecodeError):
+        return 'unknown'
+
+def get_toolchain() -> Dict:
+    """Terser version and flags: outputs and fragments are only reused with the same ones"""
+    return {'terser': get_terser_version(), 'flags': TERSER_FLAGS}
+
+def load_build_cache(toolchain: Dict) -> Dict:
     """Load the build cache from disk"""
-    cache_file = Path('.build_cache')
+    cache = {'version': CACHE_VERSION, 'toolchain': toolchain, 'files': {}, 'targets': {}}
+    cache_file = Path(CACHE_FILE)
     if cache_file.exists():
         try:
             with open(cache_file) as f:
-                return json.load(f)
+                data = json.load(f)
         except (json.JSONDecodeError, OSError):
-            pass
-    return {}
+            return cache
+
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            return cache
+
+        # file hashes do not depend on terser, built outputs do
+        cache['files'] = data.get('files', {})
+        if data.get('toolchain') == toolchain:
+            cache['targets'] = data.get('targets', {})
+        else:
+            print(f"{Colors.BLUE}Terser version or flags changed, rebuilding everything{Colors.NC}")
+            shutil.rmtree(FRAGMENTS_DIR, ignore_errors=True)
+    return cache
 
 def save_build_cache(cache: Dict):
-    """Save the build cache to disk"""
+    """Save the build cache to disk (atomically) and drop the fragments no target uses"""
+    inputs = {src: digest for target in cache['targets'].values() for src, digest in target['inputs'].items()}
+    outputs = set(cache['targets'])
+    cache['files'] = {path: entry for path, entry in cache['files'].items() if path in inputs or path in outputs}
+
     try:
-        with open('.build_cache', 'w') as f:
+        tmp = f"{CACHE_FILE}.tmp"
+        with open(tmp, 'w') as f:
             json.dump(cache, f)
+        os.replace(tmp, CACHE_FILE)
     except OSError:
         print(f"{Colors.RED}Warning: Failed to save build cache{Colors.NC}")
 
+    if os.path.isdir(FRAGMENTS_DIR):
+        live = set(inputs.values())
+        for name in os.listdir(FRAGMENTS_DIR):
+            if name.split('.')[0] not in live:
+                os.remove(os.path.join(FRAGMENTS_DIR, name))
+
 def is_rebuild_needed(target: str, source_files: List[str], cache: Dict) -> bool:
-    """Check if target needs rebuilding based on source file changes"""
+    """Check if target needs rebuilding based on source file contents"""
     if args.nocache:
         return True
         
     if not os.path.exists(target):
         return True
-        
-    target_mtime = get_file_hash(target)
-    cached_mtimes = cache.get(target, {})
-    
-    for src in source_files:
-        current_mtime = get_file_hash(src)
-        if current_mtime != cached_mtimes.get(src, 0):
-            return True
-            
-    return False
+
+    built = cache['targets'].get(target)
+    if built is None:
+        return True
+
+    # edited or replaced since it was built
+    if get_file_hash(target, cache) != built['output']:
+        return True
+
+    # a source added or removed
+    if set(built['inputs']) != set(source_files):
+        return True
+
+    return any(get_file_hash(src, cache) != built['inputs'].get(src) for src in source_files)
 
 def update_cache_for_target(target: str, source_files: List[str], cache: Dict):
     """Update cache entries for a successfully built target"""
-    cache[target] = {
-        src: get_file_hash(src) for src in source_files
+    cache['targets'][target] = {
+        'inputs': {src: get_file_hash(src, cache) for src in source_files},
+        'output': get_file_hash(target, cache)
     }
 
+def get_fragment(digest: str) -> str:
+    return os.path.join(FRAGMENTS_DIR, f"{digest}.js")
+
+def minify_fragment(src: str, digest: str) -> bool:
+    """Minify one source file into its fragment (and map) unless already there (True if terser ran)"""
+    fragment = get_fragment(digest)
+    if os.path.exists(fragment) and os.path.exists(f"{fragment}.map") and not args.nocache:
+        return False
+
+    os.makedirs(FRAGMENTS_DIR, exist_ok=True)
+    tmp = f"{fragment}.{threading.get_ident()}.tmp"
+    subprocess.run(["bun", "run", "terser", src, *TERSER_FLAGS, "-o", tmp], check=True)
+    os.replace(f"{tmp}.map", f"{fragment}.map")
+    os.replace(tmp, fragment)
+    return True
+
+def minify_fragments(sources: List[str], cache: Dict) -> int:
+    """Minify the sources in parallel (each contents once per build); number of terser runs started here"""
+    jobs = []
+    started = []
+    with fragment_lock:
+        for src in sources:
+            digest = get_file_hash(src, cache)
+            if digest not in fragment_jobs:
+                fragment_jobs[digest] = terser_pool.submit(minify_fragment, src, digest)
+                started.append(fragment_jobs[digest])
+            jobs.append(fragment_jobs[digest])
+    concurrent.futures.wait(jobs)
+    return sum(job.result() for job in started)
+
+def vlq_decode(segment: str) -> List[int]:
+    """Decode one base64 VLQ source map segment"""
+    values = []
+    value = shift = 0
+    for char in segment:
+        digit = BASE64_VALUES[char]
+        value += (digit & 31) << shift
+        if digit & 32:
+            shift += 5
+        else:
+            values.append(-(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return values
+
+def vlq_encode(values: List[int]) -> str:
+    """Encode one base64 VLQ source map segment"""
+    chars = []
+    for value in values:
+        value = (-value << 1) | 1 if value < 0 else value << 1
+        while True:
+            digit = value & 31
+            value >>= 5
+            chars.append(BASE64[digit | 32 if value else digit])
+            if not value:
+                break
+    return ''.join(chars)
+
+def merge_source_maps(parts: List, file: str) -> Dict:
+    """Compose the maps of fragments joined one after another ((first line, map) each) into one map"""
+    sources: List[str] = []
+    names: List[str] = []
+    source_ids: Dict[str, int] = {}
+    name_ids: Dict[str, int] = {}
+
+    # absolute [column, source, line, column, name] segments of every generated line
+    lines: List[List[List[int]]] = []
+    for first_line, part in parts:
+        lines.extend([] for _ in range(first_line - len(lines)))
+        source = line = column = name = 0
+        for generated in part['mappings'].split(';'):
+            segments = []
+            generated_column = 0
+            for encoded in generated.split(','):
+                if not encoded:
+                    continue
+                values = vlq_decode(encoded)
+                generated_column += values[0]
+                segment = [generated_column]
+                if len(values) >= 4:
+                    source += values[1]
+                    line += values[2]
+                    column += values[3]
+                    path = part['sources'][source]
+                    if path not in source_ids:
+                        source_ids[path] = len(sources)
+                        sources.append(path)
+                    segment += [source_ids[path], line, column]
+                if len(values) == 5:
+                    name += values[4]
+                    symbol = part['names'][name]
+                    if symbol not in name_ids:
+                        name_ids[symbol] = len(names)
+                        names.append(symbol)
+                    segment.append(name_ids[symbol])
+                segments.append(segment)
+            lines.append(segments)
+
+    # relative again, source, line and name across the whole map
+    mappings = []
+    previous = [0, 0, 0, 0]
+    for segments in lines:
+        encoded = []
+        previous_column = 0
+        for segment in segments:
+            values = [segment[0] - previous_column]
+            previous_column = segment[0]
+            for index, value in enumerate(segment[1:]):
+                values.append(value - previous[index])
+                previous[index] = value
+            encoded.append(vlq_encode(values))
+        mappings.append(','.join(encoded))
+
+    return {'version': 3, 'file': file, 'sourceRoot': '..', 'sources': sources, 'names': names, 'mappings': ';'.join(mappings)}
+
+def join_fragments(sources: List[str], cache: Dict, target: str, source_map: bool = False):
+    """Write target as the fragments of the sources in order (and its composed source map)"""
+    parts = []
+    first_line = 0
+    with open(target, 'w') as outfile:
+        for src in sources:
+            fragment = get_fragment(get_file_hash(src, cache))
+            with open(fragment, 'r') as infile:
+                code = infile.read()
+            outfile.write(code)
+            outfile.write('\n')
+            if source_map:
+                with open(f"{fragment}.map", 'r') as map_file:
+                    parts.append((first_line, json.load(map_file)))
+            first_line += code.count('\n') + 1
+
+        if source_map:
+            map_name = f"{os.path.basename(target)}.map"
+            outfile.write(f"//# sourceMappingURL={map_name}")
+
+    if source_map:
+        with open(f"{target}.map", 'w') as map_file:
+            json.dump(merge_source_maps(parts, os.path.basename(target)), map_file, separators=(',', ':'))
+
+def has_sources(target: str, source_files: List[str]) -> bool:
+    """Check that the sources of a target are in the tree (the js/ ones predate the module sources)"""
+    missing = [src for src in source_files if not os.path.exists(src)]
+    if missing:
+        print(f"• Skipping {target} ({len(missing)} of {len(source_files)} sources missing, e.g. {missing[0]})")
+    return not missing
+
 def build_web_min(web_files: List[str], cache: Dict):
     target = "js/min.creator_web.js"
+    if not has_sources(target, web_files):
+        return
     if not is_rebuild_needed(target, web_files, cache):
         print(f"• Skipping {target} (up to date)")
         return
         
     print("• Generating min.creator_web.js...")
-    concatenate_files(web_files, "js/debug.creator_web.js")
-    subprocess.run(["bun", "run", "terser", "-o", target, "js/debug.creator_web.js"], check=True)
-    if not args.debug:
-        os.remove("js/debug.creator_web.js")
+    start = time.perf_counter()
+    sources = [src for src in web_files if os.path.exists(src)]
+    minified = minify_fragments(sources, cache)
+    join_fragments(sources, cache, target)
+    print(f"  {target}: {minified} of {len(sources)} files minified in {time.perf_counter() - start:.2f}s")
     update_cache_for_target(target, web_files, cache)
 
 
 def build_web_debug(web_files: List[str], cache: Dict):
     target = "js/debug.creator_web.js"
+    if not has_sources(target, web_files):
+        return
     if not is_rebuild_needed(target, web_files, cache):
         print(f"• Skipping {target} (up to date)")
         return
         
     print("• Generating debug.creator_web.js...")
+    start = time.perf_counter()
     concatenate_files(web_files, target)
+    print(f"  {target}: concatenated in {time.perf_counter() - start:.2f}s")
     update_cache_for_target(target, web_files, cache)
 
 def build_node_min(node_files: List[str], cache: Dict):
     target = "js/min.creator_node.js"
+    if not has_sources(target, node_files):
+        return
     if not is_rebuild_needed(target, node_files, cache):
         print(f"• Skipping {target} (up to date)")
         return
         
     print("• Generating min.creator_node.js...")
-    subprocess.run([
-        "npx", "terser", *node_files,
-        "--output", target,
-        "--source-map", "filename='min.creator_node.js.map',url='min.creator_node.js.map',root='..'"
-    ], check=True)
+    start = time.perf_counter()
+    sources = [src for src in node_files if os.path.exists(src)]
+    minified = minify_fragments(sources, cache)
+    join_fragments(sources, cache, target, source_map=True)
+    print(f"  {target}: {minified} of {len(sources)} files minified in {time.perf_counter() - start:.2f}s")
     update_cache_for_target(target, node_files, cache)
 
 def build_node_debug(node_files: List[str], cache: Dict):
     target = "js/debug.creator_node.js"
+    if not has_sources(target, node_files):
+        return
     if not is_rebuild_needed(target, node_files, cache):
         print(f"• Skipping {target} (up to date)")
         return
         
     print("• Generating debug.creator_node.js...")
+    start = time.perf_counter()
     concatenate_files(node_files, target)
+    print(f"  {target}: concatenated in {time.perf_counter() - start:.2f}s")
     update_cache_for_target(target, node_files, cache)
 
+def get_module_files(entry: str, target: str, cache: Dict) -> List[str]:
+    """Modules of the bundle of entry as of its last build (a changed import changes one of them)"""
+    built = cache['targets'].get(target)
+    return list(built['inputs']) if built else [entry]
+
+def build_bundle(target: str, entry: str, module_files: List[str], cache: Dict, platform: str):
+    """Tree-shaken bundle of the module graph of entry, and the size each module adds to it"""
+    if not is_rebuild_needed(target, module_files, cache):
+        print(f"• Skipping {target} (up to date)")
+        return
+
+    print(f"• Bundling {entry} into {os.path.basename(target)}...")
+    start = time.perf_counter()
+    metafile = f"{target}.{threading.get_ident()}.meta.json"
+    try:
+        subprocess.run(["bun", "build", entry, f"--target={platform}", "--format=esm", "--packages=external",
+                        f"--outfile={target}", f"--metafile={metafile}"], check=True, capture_output=True, text=True)
+        with open(metafile) as f:
+            meta = json.load(f)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"bun build {entry} failed:\n{e.stderr.strip()}")
+    finally:
+        if os.path.exists(metafile):
+            os.remove(metafile)
+
+    output = next(output for path, output in meta['outputs'].items() if os.path.samefile(path, target))
+    modules = [path.replace('\\', '/') for path in meta['inputs']]
+    total = os.path.getsize(target)
+    lines = [f"  {target}: {len(modules)} modules, {total / 1024:.1f} KiB in {time.perf_counter() - start:.2f}s"]
+    for path in sorted(modules, key=lambda path: -output['inputs'].get(path, {}).get('bytesInOutput', 0)):
+        size = meta['inputs'][path]['bytes']
+        bundled = output['inputs'].get(path, {}).get('bytesInOutput', 0)
+        shaken = f"{Colors.BLUE}(dropped){Colors.NC}" if bundled == 0 else f"{100 * bundled / total:5.1f}%"
+        lines.append(f"    {path:<40} {bundled / 1024:7.1f} KiB of {size / 1024:7.1f} KiB  {shaken}")
+    print('\n'.join(lines))
+    update_cache_for_target(target, modules, cache)
+
+def build_node_bundle(module_files: List[str], cache: Dict):
+    build_bundle(NODE_BUNDLE, NODE_BUNDLE_ENTRY, module_files, cache, 'node')
+
+def build_web_bundle(module_files: List[str], cache: Dict):
+    build_bundle(WEB_BUNDLE, WEB_BUNDLE_ENTRY, module_files, cache, 'browser')
+
+def measure_startup():
+    """Start-up time of the CLI (creator --help) from the sources and from the node bundle"""
+    runtime = "bun" if shutil.which("bun") else "node"
+    print(f"\n{Colors.BLUE}Start-up time ({runtime} <cli> --help, best and median of {STARTUP_RUNS} runs):{Colors.NC}")
+    medians = {}
+    for label, script in [("sources", NODE_BUNDLE_ENTRY), ("bundle", NODE_BUNDLE)]:
+        times = []
+        for _ in range(STARTUP_RUNS):
+            start = time.perf_counter()
+            result = subprocess.run([runtime, script, "--help"], capture_output=True, text=True)
+            times.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                lines = result.stderr.strip().splitlines() or [f"exit status {result.returncode}"]
+                error = next((line for line in lines if 'Error' in line), lines[-1])
+                print(f"  {label:<8} {Colors.RED}failed:{Colors.NC} {error}")
+                break
+        else:
+            medians[label] = sorted(times)[len(times) // 2]
+            print(f"  {label:<8} {min(times) * 1000:7.1f} ms  {medians[label] * 1000:7.1f} ms")
+    if len(medians) == 2:
+        print(f"  bundle/sources: {medians['bundle'] / medians['sources']:.2f}")
+
+def get_web_files() -> List[str]:
+    """Web version files"""
+    web_files = [
+        "js/globals.js",
+        "js/creator_bigint.js",
+        "js/creator_ga.js",
+        "js/creator_preload.js",
+        "js/creator_util.js",
+        "js/creator_track_stack.js",
+        "js/creator_sentinel.js",
+        "js/creator_definition_api.js",
+        "js/creator_registerfile.js",
+        "js/creator_memory.js",
+        "js/creator_compiler.js",
+        "js/creator_executor.js",
+    ]
+
+    # Add all component files
+    web_files.extend(get_js_files_recursively('components'))
+
+    # Add the final files
+    web_files.extend([
+        "js/creator_ui.js",
+        "js/app.js"
+    ])
+    return web_files
+
+def get_node_files() -> List[str]:
+    """Node version files"""
+    return [
+        "js/globals.js",
+        "js/creator_bigint.js",
+        "js/creator_ga.js",
+        "js/creator_util.js",
+        "js/creator_sentinel.js",
+        "js/creator_definition_api.js",
+        "js/creator_track_stack.js",
+        "js/creator_registerfile.js",
+        "js/creator_memory.js",
+        "js/creator_compiler.js",
+        "js/creator_executor.js",
+        "js/creator_node.js"
+    ]
+
+def get_build_tasks(web_files: List[str], node_files: List[str], cache: Dict) -> List:
+    """Build tasks (function, [sources, cache]): the dependency graph of the targets"""
+    build_tasks = [(build_web_min, [web_files, cache])]
+    if args.debug:
+        build_tasks.extend([
+            (build_web_debug, [web_files, cache]),
+            (build_node_debug, [node_files, cache])
+        ])
+    build_tasks.append((build_node_min, [node_files, cache]))
+    build_tasks.extend([
+        (build_node_bundle, [get_module_files(NODE_BUNDLE_ENTRY, NODE_BUNDLE, cache), cache]),
+        (build_web_bundle, [get_module_files(WEB_BUNDLE_ENTRY, WEB_BUNDLE, cache), cache])
+    ])
+    return build_tasks
+
+def run_build_tasks(build_tasks: List, cache: Dict):
+    """Execute tasks concurrently, their terser runs on args.jobs processes, and save the cache"""
+    fragment_jobs.clear()
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        futures = [executor.submit(task, *task_args) for task, task_args in build_tasks]
+        concurrent.futures.wait(futures)
+
+        # Check for exceptions
+        for future in futures:
+            if future.exception():
+                raise future.exception()
+
+    # Save updated cache if not disabled
+    if not args.nocache:
+        save_build_cache(cache)
+
+def get_watch_state(sources: List[str]) -> Dict:
+    """Size and mtime of every source, and the component files (added or removed ones)"""
+    return {'files': {src: get_file_stat(src) for src in sources}, 'components': get_js_files_recursively('components')}
+
+def get_watch_sources(web_files: List[str], node_files: List[str], cache: Dict) -> List[str]:
+    """Sources of every target: the file lists and the modules of the bundles"""
+    return list(dict.fromkeys(web_files + node_files + get_module_files(NODE_BUNDLE_ENTRY, NODE_BUNDLE, cache) +
+                              get_module_files(WEB_BUNDLE_ENTRY, WEB_BUNDLE, cache)))
+
+def watch(cache: Dict):
+    """Rebuild the targets of the changed sources until interrupted"""
+    web_files = get_web_files()
+    node_files = get_node_files()
+    sources = get_watch_sources(web_files, node_files, cache)
+    state = get_watch_state(sources)
+    print(f"\n{Colors.BLUE}Watching {len(state['files'])} files for changes (Ctrl+C to stop)...{Colors.NC}")
+
+    while True:
+        time.sleep(WATCH_POLL)
+        current = get_watch_state(sources)
+        if current == state:
+            continue
+
+        # wait until the sources stop changing (editors write in several steps)
+        while True:
+            time.sleep(WATCH_DEBOUNCE)
+            settled = get_watch_state(sources)
+            if settled == current:
+                break
+            current = settled
+
+        start = time.perf_counter()
+        changed = {src for src, stat in current['files'].items() if stat != state['files'].get(src)}
+        listed = current['components'] != state['components']
+        if listed:
+            changed.update(set(current['components']) ^ set(state['components']))
+            web_files = get_web_files()
+
+        if listed:
+            sources = get_watch_sources(web_files, node_files, cache)
+            current = get_watch_state(sources)
+        state = current
+
+        # the targets of the changed sources (all web targets if a component was added or removed)
+        build_tasks = [(task, task_args) for task, task_args in get_build_tasks(web_files, node_files, cache)
+                       if changed & set(task_args[0]) or (listed and task_args[0] is web_files)]
+        print(f"\n{Colors.BLUE}Changed: {', '.join(sorted(changed))}{Colors.NC}")
+        try:
+            run_build_tasks(build_tasks, cache)
+            print(f"{Colors.GREEN}Rebuilt {len(build_tasks)} targets in {time.perf_counter() - start:.2f}s{Colors.NC}")
+        except Exception as e:
+            print(f"{Colors.RED}Build process failed:{Colors.NC} {str(e)}")
+
+        # an edited import may add or remove modules of a bundle (known once rebuilt)
+        sources = get_watch_sources(web_files, node_files, cache)
+        state['files'] = {src: state['files'][src] if src in state['files'] else get_file_stat(src) for src in sources}
+
 def main():
     start_time = time.perf_counter()
-    global args
+    global args, terser_pool
     args = parse_args()
     print_banner()
     
@@ -237,90 +694,44 @@ def main():
     
     if args.nocache:
         build_type.append(f"{Colors.RED}No Cache{Colors.NC}")
+
+    if args.watch:
+        build_type.append(f"{Colors.BLUE}Watch{Colors.NC}")
     
     print(f"Build configuration: {' | '.join(build_type)}\n")
 
-    if not check_environment() or not check_dependencies():
+    if not check_dependencies():
         sys.exit(1)
     print(f"\n{Colors.BLUE}Initiating build process...{Colors.NC}\n")
 
     try:
         # Load build cache if not disabled
-        cache = {} if args.nocache else load_build_cache()
-
-        # Web version files
-        web_files = [
-            "js/globals.js",
-            "js/creator_bigint.js",
-            "js/creator_ga.js",
-            "js/creator_preload.js",
-            "js/creator_util.js",
-            "js/creator_track_stack.js",
-            "js/creator_sentinel.js",
-            "js/creator_definition_api.js",
-            "js/creator_registerfile.js",
-            "js/creator_memory.js",
-            "js/creator_compiler.js",
-            "js/creator_executor.js",
-        ]
-
-        # Add all component files
-        web_files.extend(get_js_files_recursively('components'))
-
-        # Add the final files
-        web_files.extend([
-            "js/creator_ui.js",
-            "js/app.js"
-        ])
+        toolchain = get_toolchain()
+        if args.nocache:
+            cache = {'version': CACHE_VERSION, 'toolchain': toolchain, 'files': {}, 'targets': {}}
+        else:
+            cache = load_build_cache(toolchain)
 
-        # Node version files
-        node_files = [
-            "js/globals.js",
-            "js/creator_bigint.js",
-            "js/creator_ga.js",
-            "js/creator_util.js",
-            "js/creator_sentinel.js",
-            "js/creator_definition_api.js",
-            "js/creator_track_stack.js",
-            "js/creator_registerfile.js",
-            "js/creator_memory.js",
-            "js/creator_compiler.js",
-            "js/creator_executor.js",
-            "js/creator_node.js"
-        ]
+        terser_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.jobs))
+        with terser_pool:
+            run_build_tasks(get_build_tasks(get_web_files(), get_node_files(), cache), cache)
 
-        
-        # Define build tasks with cache parameter
-        build_tasks = [(build_web_min, [web_files, cache])]
-        if args.debug:
-            build_tasks.extend([
-                (build_web_debug, [web_files, cache]),
-                (build_node_debug, [node_files, cache])
-            ])
-        build_tasks.append((build_node_min, [node_files, cache]))
-
-        # Execute tasks concurrently
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = [executor.submit(task, *args) for task, args in build_tasks]
-            concurrent.futures.wait(futures)
-            
-            # Check for exceptions
-            for future in futures:
-                if future.exception():
-                    raise future.exception()
+            build_time = time.perf_counter() - start_time
+            print(f"\n{Colors.GREEN}Build completed successfully in {build_time:.2f}s{Colors.NC}")
+            if args.debug:
+                print(f"{Colors.BLUE}Debug artifacts have been generated{Colors.NC}")
 
-        # Save updated cache if not disabled
-        if not args.nocache:
-            save_build_cache(cache)
+            if args.startup:
+                measure_startup()
 
-        build_time = time.perf_counter() - start_time
-        print(f"\n{Colors.GREEN}Build completed successfully in {build_time:.2f}s{Colors.NC}")
-        if args.debug:
-            print(f"{Colors.BLUE}Debug artifacts have been generated{Colors.NC}")
+            if args.watch:
+                watch(cache)
 
+    except KeyboardInterrupt:
+        print(f"\n{Colors.BLUE}Stopped watching{Colors.NC}")
     except Exception as e:
         print(f"{Colors.RED}Build process failed:{Colors.NC} {str(e)}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -148,7 +148,11 @@
 
                         this_env = this;
                         remote_lab_enqueue(this.lab_url + "/enqueue", earg).then( function(data)  { 
-                                                                                                if (data != "-1") 
+                                                                                                if (data == "-3") 
+                                                                                                {
+                                                                                                  show_notification("Too many jobs queued for this E-mail. Please, wait for them to finish.", 'danger');
+                                                                                                }
+                                                                                                else if (data != "-1") 
                                                                                                 {
                                                                                                   this_env.request_id = data;
                                                                                                   this_env.enqueue = true;
@@ -163,11 +167,39 @@
                       },
 
                       check_status()
+                      {
+                        if (this.position == "Completed" || this.position == "Error") {
+                          return;
+                        }
+
+                        // the remote lab pushes every change of the job (Server-Sent Events)
+                        if (typeof(EventSource) !== "undefined")
+                        {
+                          this_env = this;
+                          var events = new EventSource(this.lab_url + "/events/" + this.request_id);
+                          events.onmessage = function(e) {
+                                               this_env.show_status(JSON.parse(e.data));
+                                               if (this_env.position == "Completed" || this_env.position == "Error") {
+                                                 events.close();
+                                               }
+                                             };
+                          events.onerror   = function(e) {
+                                               // stream not available: fall back to polling
+                                               events.close();
+                                               this_env.poll_status();
+                                             };
+                          return;
+                        }
+
+                        this.poll_status();
+                      },
+
+                      poll_status()
                       {
                         if (this.position != "Completed" && this.position != "Error")
                         {
                           this.get_status();
-                          setTimeout(this.check_status,20000);
+                          setTimeout(this.poll_status,20000);
                         }
                       },
 
@@ -181,28 +213,33 @@
 
                         this_env = this;
                         remote_lab_status(this.lab_url + "/status", parg).then( function(data)  { 
-                                                                                              if (data == "Completed") {
-                                                                                                this_env.enqueue = false;
-                                                                                              }
-                                                                                              if (data != "-1")
-                                                                                              {
-                                                                                                if (data == "-2")
-                                                                                                {
-                                                                                                  this_env.position = "Error";
-                                                                                                  this_env.enqueue = false;
-                                                                                                }
-                                                                                                else if (!isNaN(data)) {
-                                                                                                  this_env.position = "Queue position: " + data;
-                                                                                                }
-                                                                                                else {
-                                                                                                  this_env.position = data;
-                                                                                                }
-                                                                                              }
+                                                                                              this_env.show_status(data);
                                                                                             } ) ;
                         //Google Analytics
                         creator_ga('simulator', 'simulator.position', 'simulator.position');
                       },
 
+                      show_status ( data )
+                      {
+                        if (data == "Completed" || data == "Error") {
+                          this.enqueue = false;
+                        }
+                        if (data != "-1")
+                        {
+                          if (data == "-2")
+                          {
+                            this.position = "Error";
+                            this.enqueue = false;
+                          }
+                          else if (!isNaN(data)) {
+                            this.position = "Queue position: " + data;
+                          }
+                          else {
+                            this.position = data;
+                          }
+                        }
+                      },
+
                       do_cancel ()
                       {
                         this.save();
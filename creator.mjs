@@ -3,6 +3,7 @@
 
 
 import fs from 'fs';
+import util from 'util';
 import colors from 'colors';
 import yargs from 'yargs';
 import { hideBin } from 'yargs/helpers';
@@ -28,6 +29,9 @@ const gray_theme = {
 };
 colors.setTheme(color_theme);
 
+// architecture files kept by the worker (by path), see read_architecture()
+const architecture_files = {};
+
 // arguments
 const argv = yargs(hideBin(process.argv))
     .usage(welcome() + '\n' +
@@ -112,6 +116,11 @@ const argv = yargs(hideBin(process.argv))
         nargs: 1,
         default: ''
     })
+    .option('worker', {
+        type: 'boolean',
+        describe: 'Persistent worker: run the JSON requests read from stdin, one per line',
+        default: false
+    })
     .demandOption([], 'Please provide either a config file or both architecture and assembly files.')
     .help('h')
     .alias('h', 'help')
@@ -147,6 +156,12 @@ try {
         process.exit(0);
     }
 
+    // work: persistent worker (until stdin is closed)
+    if (argv.worker) {
+        worker_mode(limit_n_ins);
+        process.exit(0);
+    }
+
     // work: a) help and usage
     if ((argv.a != "") && (argv.describe != "")) {
         let o = help_describe(argv);
@@ -181,39 +196,10 @@ try {
 
     // work: b) commands and switches
     let hdr = '';
-    let stage = '';
-    let ret = null;
     for (let i = 0; i < file_names.length; i++) {
-        hdr = 'FileName';
-        show_result(output_format, file_names[i], file_names[i], '', true);
-
-        ret = one_file(argv.architecture, argv.library, file_names[i], limit_n_ins, argv.result);
-
-        // info: show possible errors
-        for (let j = 0; j < ret.stages.length; j++) {
-            stage = ret.stages[j];
-            hdr = hdr + ',\t' + stage;
-
-            if (ret[stage].status !== "ok")
-                show_result(output_format, stage, 'ko', ret[stage].msg.error, true);
-            else show_result(output_format, stage, 'ok', ret[stage].msg.success, false);
-        }
-
-        // info: "check differences" or "print finalmachine state"
-        if (argv.result !== '') {
-            hdr = hdr + ',\tState';
-            show_result(output_format, 'State', 'ko', ret['LastState'].msg.error, true);
-            //continue ;
-            if (ret.LastState.status != "ok") {
-                process.exit(-1);
-            }
-        }
-
-        hdr = hdr + ',\tFinalState\n';
-        ret = creator.get_state();
-        if (argv.result === '') {
-            show_result(output_format, 'FinalState', 'is', ret.msg, true);
-            console.log('');
+        hdr = run_file(output_format, argv.architecture, argv.library, file_names[i], limit_n_ins, argv.result);
+        if (hdr === null) {
+            process.exit(-1);
         }
     }
 
@@ -344,6 +330,212 @@ function show_result(output_format, stage, status, msg, show_in_min) {
     }
 }
 
+/**
+ * Runs one assembly file and shows its results (as the command line does)
+ * @param {string} output_format - Output format (NORMAL|MIN|TAB|PRETTY)
+ * @param {string} argv_architecture - Path to architecture file
+ * @param {string} argv_library - Path to library file
+ * @param {string} file_name - Path to assembly file
+ * @param {number} limit_n_ins - Maximum number of instructions to execute
+ * @param {string} argv_result - Path to result file for comparison
+ * @returns {string|null} The TAB header, or null if the final state differs from the result file
+ */
+function run_file(output_format, argv_architecture, argv_library, file_name, limit_n_ins, argv_result) {
+    let hdr = 'FileName';
+    let stage = '';
+    show_result(output_format, file_name, file_name, '', true);
+
+    let ret = one_file(argv_architecture, argv_library, file_name, limit_n_ins, argv_result);
+
+    // info: show possible errors
+    for (let j = 0; j < ret.stages.length; j++) {
+        stage = ret.stages[j];
+        hdr = hdr + ',\t' + stage;
+
+        if (ret[stage].status !== "ok")
+            show_result(output_format, stage, 'ko', ret[stage].msg.error, true);
+        else show_result(output_format, stage, 'ok', ret[stage].msg.success, false);
+    }
+
+    // info: "check differences" or "print finalmachine state"
+    if (argv_result !== '') {
+        hdr = hdr + ',\tState';
+        show_result(output_format, 'State', 'ko', ret['LastState'].msg.error, true);
+        if (ret.LastState.status != "ok") {
+            return null;
+        }
+    }
+
+    hdr = hdr + ',\tFinalState\n';
+    ret = creator.get_state();
+    if (argv_result === '') {
+        show_result(output_format, 'FinalState', 'is', ret.msg, true);
+        console.log('');
+    }
+
+    return hdr;
+}
+
+/**
+ * Reads an architecture file; the worker keeps them (re-read only if changed)
+ * @param {string} path - Path to architecture file
+ * @returns {string} The architecture file contents
+ */
+function read_architecture(path) {
+    if (!argv.worker) {
+        return fs.readFileSync(path, 'utf8');
+    }
+
+    const mtime = fs.statSync(path).mtimeMs;
+    if (!(path in architecture_files) || architecture_files[path].mtime !== mtime) {
+        architecture_files[path] = { 'mtime': mtime, 'data': fs.readFileSync(path, 'utf8') };
+    }
+
+    return architecture_files[path].data;
+}
+
+/**
+ * Persistent worker: the engine is loaded once and runs every request read
+ * from stdin, one JSON object per line:
+ *   {"id": 1, "architecture": "<file>", "assembly": "<file>", "library": "<file>", "result": "<file>", "maxins": 1000000, "output": "min"}
+ * and answers each one with a line on stdout:
+ *   {"id": 1, "status": <0, or -1 where the command line run exits with -1>, "output": "<its stdout>"}
+ * With "bench": N the program runs N times instead and the answer adds
+ * "bench": the times and instruction count of every run (see bench_file())
+ * Each program still loads a fresh copy of its architecture: the file is read once
+ * @param {number} default_limit_n_ins - Default instruction limit
+ */
+function worker_mode(default_limit_n_ins) {
+    const write = process.stdout.write.bind(process.stdout);
+    const log = console.log;
+
+    for (const line of stdin_lines()) {
+        if (line.trim() === '') {
+            continue;
+        }
+
+        let request = {};
+        let status = 0;
+        let output = '';
+        let reply = {};
+        process.stdout.write = function (chunk) { output += chunk; return true; };
+        console.log = function (...args) { output += util.format(...args) + '\n'; };
+        try {
+            request = JSON.parse(line);
+            if (request.bench) {
+                reply.bench = bench_file(request.architecture, request.library || '', request.assembly,
+                    parseInt(request.maxins || default_limit_n_ins), parseInt(request.bench));
+            }
+            else {
+                const hdr = run_file((request.output || 'min').toUpperCase(),
+                    request.architecture, request.library || '', request.assembly,
+                    parseInt(request.maxins || default_limit_n_ins), request.result || '');
+                if (hdr === null) {
+                    status = -1;
+                }
+            }
+        }
+        catch (e) {
+            console.log(e.stack);
+            status = -1;
+        }
+        finally {
+            process.stdout.write = write;
+            console.log = log;
+        }
+
+        write(JSON.stringify(Object.assign({ 'id': request.id, 'status': status, 'output': output }, reply)) + '\n');
+    }
+}
+
+/**
+ * Runs one assembly file several times in this (warm) engine, timing each stage
+ * @param {string} argv_architecture - Path to architecture file
+ * @param {string} argv_library - Path to library file
+ * @param {string} argv_assembly - Path to assembly file
+ * @param {number} limit_n_ins - Maximum number of instructions to execute
+ * @param {number} runs - Number of runs
+ * @returns {Object} Milliseconds of every run ('compile', 'execute'), instructions executed
+ *                   (the stats of executeProgramOneShot) and the status and message of the last stage
+ */
+function bench_file(argv_architecture, argv_library, argv_assembly, limit_n_ins, runs) {
+    const architecture = read_architecture(argv_architecture);
+    const library = (argv_library !== '') ? fs.readFileSync(argv_library, 'utf8') : '{}';
+    const assembly = fs.readFileSync(argv_assembly, 'utf8');
+    let ret = { 'compile': [], 'execute': [], 'instructions': 0, 'status': 'ok', 'msg': '' };
+
+    for (let i = 0; i < runs; i++) {
+        creator.load_architecture(architecture);
+        creator.load_library(library);
+        creator.reset_execution();
+
+        try {
+            let start = performance.now();
+            let ret1 = creator.assembly_compile(assembly);
+            ret.compile.push(performance.now() - start);
+            if (ret1.status !== "ok") {
+                // nothing to execute: compile time only
+                ret.status = ret1.status;
+                ret.msg = ret1.msg;
+                continue;
+            }
+
+            start = performance.now();
+            ret1 = creator.execute_program(limit_n_ins);
+            ret.execute.push(performance.now() - start);
+            ret.instructions = creator.status.totalStats;
+            ret.status = ret1.status;
+            ret.msg = ret1.msg || '';
+        }
+        catch (e) {
+            // as one_file(): the stage failed, and so will the next runs
+            ret.status = 'ko';
+            ret.msg = e.toString();
+            break;
+        }
+    }
+
+    return ret;
+}
+
+/**
+ * Lines of stdin, read synchronously until it is closed
+ * @yields {string} One line (without the line break)
+ */
+function* stdin_lines() {
+    const buffer = Buffer.alloc(1 << 16);
+    const decoder = new TextDecoder();
+    let pending = '';
+    while (true) {
+        let n = 0;
+        try {
+            n = fs.readSync(0, buffer, 0, buffer.length, null);
+        }
+        catch (e) {
+            if (e.code === 'EAGAIN') {
+                Atomics.wait(new Int32Array(new SharedArrayBuffer(4)), 0, 0, 10);
+                continue;
+            }
+            if (e.code === 'EOF') {
+                break;
+            }
+            throw e;
+        }
+        if (n === 0) {
+            break;
+        }
+
+        pending += decoder.decode(buffer.subarray(0, n), { stream: true });
+        const lines = pending.split('\n');
+        pending = lines.pop();
+        yield* lines;
+    }
+
+    if (pending !== '') {
+        yield pending;
+    }
+}
+
 /**
  * Processes a single assembly file through all stages
  * @param {string} argv_architecture - Path to architecture file
@@ -373,13 +565,13 @@ function one_file(argv_architecture, argv_library, argv_assembly, limit_n_ins, a
 
     // (a) load architecture
     try {
-        const architecture = fs.readFileSync(argv_architecture, 'utf8');
+        const architecture = read_architecture(argv_architecture);
         ret = creator.load_architecture(architecture);
         if (ret.status !== "ok") {
             throw ret.errorcode;
         }
 
-        ret1.Architecture = { 'status': 'ok', 'msg': "Architecture '" + argv.a + "' loaded successfully." };
+        ret1.Architecture = { 'status': 'ok', 'msg': "Architecture '" + argv_architecture + "' loaded successfully." };
     }
     catch (e) {
         ret1.Architecture = { 'status': 'ko', 'msg': e.toString() };
@@ -395,17 +587,25 @@ function one_file(argv_architecture, argv_library, argv_assembly, limit_n_ins, a
                 throw ret.msg;
             }
 
-            ret1.Library = { 'status': 'ok', 'msg': "Code '" + argv.l + "' linked successfully." };
+            ret1.Library = { 'status': 'ok', 'msg': "Code '" + argv_library + "' linked successfully." };
         }
         catch (e) {
             ret1.Library = { 'status': 'ko', 'msg': e.toString() };
             return ret1;
         }
     }
+    else if (argv.worker) {
+        // unlink the library of the previous program
+        creator.load_library('{}');
+    }
+
+    // the worker starts each program as a new process would
+    if (argv.worker) {
+        creator.reset_execution();
+    }
 
     // (c) compile
     try {
-        const architecture = fs.readFileSync(argv_architecture, 'utf8');
         const assembly = fs.readFileSync(argv_assembly, 'utf8');
         ret = creator.assembly_compile(assembly);
         if (ret.status !== "ok") {
@@ -415,7 +615,7 @@ function one_file(argv_architecture, argv_library, argv_assembly, limit_n_ins, a
             throw msg1;
         }
 
-        ret1.Compile = { 'status': 'ok', 'msg': "Code '" + argv.s + "' compiled successfully." };
+        ret1.Compile = { 'status': 'ok', 'msg': "Code '" + argv_assembly + "' compiled successfully." };
     }
     catch (e) {
         ret1.Compile = { 'status': 'ko', 'msg': e.toString() };
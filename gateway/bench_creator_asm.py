@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Check and benchmark of creator_asm.py: the output must be byte-identical
+# to the former per-gateway creator_build() (kept below, frozen) for the
+# programs in esp32-rv/tests and for generated programs, then both are timed
+# on a large generated program (file to file, and rewrite() in memory).
+#
+# Use: python3 bench_creator_asm.py [--lines N] [--repeat N]
+#
+
+
+import argparse, glob, os, random, sys, tempfile, time
+
+import creator_asm
+
+
+
+
+## Former esp32-rv/gateway.py creator_build() ##
+
+def legacy_riscv_build(file_in, file_out):
+  try:
+    # open input + output files
+    fin  = open(file_in, "rt")
+    fout = open(file_out, "wt")
+
+    # write header
+    fout.write(".text\n");
+    fout.write(".type main, @function\n")
+    fout.write(".globl main\n")
+
+    data = []
+    # for each line in the input file...
+    for line in fin:
+      data = line.strip().split()
+      if (len(data) > 0):
+        if (data[0] == 'rdcycle'):
+          fout.write("#### rdcycle" + data[1] + "####\n")
+          fout.write("addi sp, sp, -8\n")
+          fout.write("sw ra, 4(sp)\n")
+          fout.write("sw a0, 0(sp)\n")
+
+          fout.write("jal ra, _rdcycle\n")
+          fout.write("mv "+ data[1] +", a0\n")
+
+          if data[1] != "a0":
+            fout.write("lw a0, 0(sp)\n")
+          fout.write("lw ra, 4(sp)\n")
+          fout.write("addi sp, sp, 8\n")
+          fout.write("####################\n")
+          continue
+
+        if (data[0] == 'ecall'):
+          fout.write("#### ecall ####\n")
+          fout.write("addi sp, sp, -128\n")
+          fout.write("sw x1,  120(sp)\n")
+          fout.write("sw x3,  112(sp)\n")
+          fout.write("sw x4,  108(sp)\n")
+          fout.write("sw x5,  104(sp)\n")
+          fout.write("sw x6,  100(sp)\n")
+          fout.write("sw x7,  96(sp)\n")
+          fout.write("sw x8,  92(sp)\n")
+          fout.write("sw x9,  88(sp)\n")
+          fout.write("sw x18, 52(sp)\n")
+          fout.write("sw x19, 48(sp)\n")
+          fout.write("sw x20, 44(sp)\n")
+          fout.write("sw x21, 40(sp)\n")
+          fout.write("sw x22, 36(sp)\n")
+          fout.write("sw x23, 32(sp)\n")
+          fout.write("sw x24, 28(sp)\n")
+          fout.write("sw x25, 24(sp)\n")
+          fout.write("sw x26, 20(sp)\n")
+          fout.write("sw x27, 16(sp)\n")
+          fout.write("sw x28, 12(sp)\n")
+          fout.write("sw x29, 8(sp)\n")
+          fout.write("sw x30, 4(sp)\n")
+          fout.write("sw x31, 0(sp)\n")
+
+          fout.write("jal _myecall\n")
+
+          fout.write("lw x1,  120(sp)\n")
+          fout.write("lw x3,  112(sp)\n")
+          fout.write("lw x4,  108(sp)\n")
+          fout.write("lw x5,  104(sp)\n")
+          fout.write("lw x6,  100(sp)\n")
+          fout.write("lw x7,  96(sp)\n")
+          fout.write("lw x8,  92(sp)\n")
+          fout.write("lw x9,  88(sp)\n")
+          fout.write("lw x18, 52(sp)\n")
+          fout.write("lw x19, 48(sp)\n")
+          fout.write("lw x20, 44(sp)\n")
+          fout.write("lw x21, 40(sp)\n")
+          fout.write("lw x22, 36(sp)\n")
+          fout.write("lw x23, 32(sp)\n")
+          fout.write("lw x24, 28(sp)\n")
+          fout.write("lw x25, 24(sp)\n")
+          fout.write("lw x26, 20(sp)\n")
+          fout.write("lw x27, 16(sp)\n")
+          fout.write("lw x28, 12(sp)\n")
+          fout.write("lw x29, 8(sp)\n")
+          fout.write("lw x30, 4(sp)\n")
+          fout.write("lw x31, 0(sp)\n")
+          fout.write("addi sp, sp, 128\n")
+          fout.write("###############\n")
+          continue
+
+      fout.write(line)
+
+    # close input + output files
+    fin.close()
+    fout.close()
+    return 0
+
+  except Exception as e:
+    print("Error adapting assembly file: ", str(e))
+    return -1
+
+
+
+
+## Former esp32-tensilica/gateway.py creator_build() ##
+
+def legacy_xtensa_build(file_in, file_out):
+  try:
+    # open input + output files
+    fin  = open(file_in, "rt")
+    fout = open(file_out, "wt")
+
+    # write header
+    fout.write(".text\n");
+    fout.write(".type main, @function\n")
+    fout.write(".globl main\n")
+
+    data = []
+    # for each line in the input file...
+    for line in fin:
+      data = line.strip().split()
+      if (len(data) > 0):
+        if (data[0] == 'rdcycle'):
+          fout.write("#### rdcycle" + data[1] + "####\n")
+          fout.write("addi $sp, $sp, -8\n")
+          fout.write("sw $ra, 4($sp)\n")
+          fout.write("sw $a0, 0($sp)\n")
+
+          fout.write("jal _esp_cpu_get_cycle_count\n")
+          fout.write("mv "+ data[1] +", $a0\n")
+
+          fout.write("lw $a0, 0($sp)\n")
+          fout.write("lw $ra, 4($sp)\n")
+          fout.write("addi $sp, $sp, 8\n")
+          fout.write("####################\n")
+          continue
+
+        if (data[0] == 'syscall'):
+          fout.write("#### ecall ####\n")
+          fout.write("addi $sp, $sp, -128\n")
+          fout.write("sw 1,  120($sp)\n")
+          fout.write("sw 3,  112($sp)\n")
+          fout.write("sw 4,  108($sp)\n")
+          fout.write("sw 5,  104($sp)\n")
+          fout.write("sw 6,  100($sp)\n")
+          fout.write("sw 7,  96($sp)\n")
+          fout.write("sw 8,  92($sp)\n")
+          fout.write("sw 9,  88($sp)\n")
+          fout.write("sw 10, 84($sp)\n")
+          fout.write("sw 11, 80($sp)\n")
+          fout.write("sw 12, 76($sp)\n")
+          fout.write("sw 13, 72($sp)\n")
+          fout.write("sw 14, 68($sp)\n")
+          fout.write("sw 15, 64($sp)\n")
+          fout.write("sw 16, 60($sp)\n")
+          fout.write("sw 17, 56($sp)\n")
+          fout.write("sw 18, 52($sp)\n")
+          fout.write("sw 19, 48($sp)\n")
+          fout.write("sw 20, 44($sp)\n")
+          fout.write("sw 21, 40($sp)\n")
+          fout.write("sw 22, 36($sp)\n")
+          fout.write("sw 23, 32($sp)\n")
+          fout.write("sw 24, 28($sp)\n")
+          fout.write("sw 25, 24($sp)\n")
+          fout.write("sw 26, 20($sp)\n")
+          fout.write("sw 27, 16($sp)\n")
+          fout.write("sw 28, 12($sp)\n")
+          fout.write("sw 29, 8($sp)\n")
+          fout.write("sw 30, 4($sp)\n")
+          fout.write("sw 31, 0($sp)\n")
+
+          fout.write("jal _myecall\n")
+
+          fout.write("lw 1,  120($sp)\n")
+          fout.write("lw 3,  112($sp)\n")
+          fout.write("lw 4,  108($sp)\n")
+          fout.write("lw 5,  104($sp)\n")
+          fout.write("lw 6,  100($sp)\n")
+          fout.write("lw 7,  96($sp)\n")
+          fout.write("lw 8,  92($sp)\n")
+          fout.write("lw 9,  88($sp)\n")
+          fout.write("lw 10, 84($sp)\n")
+          fout.write("lw 11, 80($sp)\n")
+          fout.write("lw 12, 76($sp)\n")
+          fout.write("lw 13, 72($sp)\n")
+          fout.write("lw 14, 68($sp)\n")
+          fout.write("lw 15, 64($sp)\n")
+          fout.write("lw 16, 60($sp)\n")
+          fout.write("lw 17, 56($sp)\n")
+          fout.write("lw 18, 52($sp)\n")
+          fout.write("lw 19, 48($sp)\n")
+          fout.write("lw 20, 44($sp)\n")
+          fout.write("lw 21, 40($sp)\n")
+          fout.write("lw 22, 36($sp)\n")
+          fout.write("lw 23, 32($sp)\n")
+          fout.write("lw 24, 28($sp)\n")
+          fout.write("lw 25, 24($sp)\n")
+          fout.write("lw 26, 20($sp)\n")
+          fout.write("lw 27, 16($sp)\n")
+          fout.write("lw 28, 12($sp)\n")
+          fout.write("lw 29, 8($sp)\n")
+          fout.write("lw 30, 4($sp)\n")
+          fout.write("lw 31, 0($sp)\n")
+          fout.write("addi $sp, $sp, 128\n")
+          fout.write("###############\n")
+          continue
+
+      fout.write(line)
+
+    # close input + output files
+    fin.close()
+    fout.close()
+    return 0
+
+  except Exception as e:
+    print("Error adapting assembly file: ", str(e))
+    return -1
+
+
+
+
+LEGACY = {'riscv': legacy_riscv_build, 'xtensa': legacy_xtensa_build}
+
+# a few lines of everything a CREATOR program has
+EDGE_CASES = [
+  "",
+  "\n",
+  "rdcycle a0\n",
+  "rdcycle t0\nrdcycle a0",
+  "   rdcycle   s1   # cycles\n",
+  ".data\n  msg: .string \"ecall\"\n.text\nmain:\n  li a7, 4\n  ecall\n  syscall\n  jr ra\n",
+  "main:\r\n  li a0, 1\r\n  ecall\r\n  rdcycle t1\r\n",
+  "main:\r  ecall\r  syscall\r",
+  "# ecall in a comment\n\tecall\t# and after\n  syscall  \n",
+  "loop: rdcycle t0\n  ecall_wrapper: nop\n  rdcycle\ta0\n",
+  "no trailing newline\n  ecall",
+  "\t \n   \n\x0c\n",
+]
+
+
+def generate(lines, seed=1):
+  # a program mixing the lines the rewriter keeps and the ones it expands
+  rnd  = random.Random(seed)
+  body = ['.text', 'main:']
+  ops  = ['  li a0, {0}', '  addi t0, t0, {0}', '  add a1, a2, a3', 'label_{0}:', '  # comment {0}', '',
+          '  beq t0, t1, label_{0}', '  sw a0, {0}(sp)', '  ecall', '  syscall', '  rdcycle t{1}', '  rdcycle a0']
+  weights = [20, 20, 15, 5, 5, 5, 10, 10, 4, 2, 3, 1]
+  for i in range(lines - 2):
+    body.append(rnd.choices(ops, weights)[0].format(i, rnd.randint(0, 6)))
+
+  return '\n'.join(body) + '\n'
+
+
+def legacy_output(isa, text, tmp):
+  fin, fout = os.path.join(tmp, 'in.s'), os.path.join(tmp, 'out.s')
+  with open(fin, 'w', newline='') as f:
+    f.write(text)
+  if LEGACY[isa](fin, fout) != 0:
+    return None
+  with open(fout, 'rb') as f:
+    return f.read()
+
+def new_output(isa, text, tmp):
+  fin, fout = os.path.join(tmp, 'in.s'), os.path.join(tmp, 'out.s')
+  with open(fin, 'w', newline='') as f:
+    f.write(text)
+  if creator_asm.creator_build(fin, fout, isa) != 0:
+    return None
+  with open(fout, 'rb') as f:
+    return f.read()
+
+
+def check(tmp):
+  # legacy vs creator_build() vs rewrite() (written as the gateway does)
+  programs = [('edge case ' + str(i), text) for i, text in enumerate(EDGE_CASES)]
+  for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'esp32-rv', 'tests', '*.s'))):
+    with open(path, newline='') as f:
+      programs.append((os.path.basename(path), f.read()))
+  for seed in range(20):
+    programs.append(('generated ' + str(seed), generate(500, seed)))
+
+  failures = 0
+  for isa in sorted(LEGACY):
+    for name, text in programs:
+      expected = legacy_output(isa, text, tmp)
+      got      = new_output(isa, text, tmp)
+
+      memory = None
+      with open(os.path.join(tmp, 'program.s'), 'w') as f:
+        f.write(creator_asm.rewrite(text, isa))
+      with open(os.path.join(tmp, 'program.s'), 'rb') as f:
+        memory = f.read()
+
+      if expected != got or expected != memory:
+        failures = failures + 1
+        print("  DIFFERENT  " + isa + "  " + name)
+
+    print("%-7s %4d programs checked" % (isa, len(programs)))
+
+  # a rdcycle without destination fails on both
+  for isa in sorted(LEGACY):
+    if legacy_output(isa, "rdcycle\n", tmp) != None or new_output(isa, "rdcycle\n", tmp) != None:
+      failures = failures + 1
+      print("  DIFFERENT  " + isa + "  rdcycle without destination")
+
+  return failures
+
+
+def best(fn, repeat):
+  times = []
+  for i in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+  return min(times)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='creator_asm.py check and benchmark')
+  parser.add_argument('--lines', type=int, default=100000, help='Lines of the generated program')
+  parser.add_argument('--repeat', type=int, default=5, help='Runs of each version (best is shown)')
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    failures = check(tmp)
+    if failures > 0:
+      print(str(failures) + " programs differ from the former creator_build()")
+      sys.exit(1)
+    print("Byte-identical to the former creator_build()")
+    print("")
+
+    text = generate(args.lines)
+    fin, fout = os.path.join(tmp, 'in.s'), os.path.join(tmp, 'out.s')
+    with open(fin, 'w') as f:
+      f.write(text)
+
+    print("Program: " + str(args.lines) + " lines, " + str(len(text)) + " bytes (best of " + str(args.repeat) + ", ms)")
+    print("%-7s %10s %10s %10s" % ('isa', 'legacy', 'file', 'memory'))
+    for isa in sorted(LEGACY):
+      old    = best(lambda: LEGACY[isa](fin, fout), args.repeat)
+      new    = best(lambda: creator_asm.creator_build(fin, fout, isa), args.repeat)
+      memory = best(lambda: creator_asm.rewrite(text, isa), args.repeat)
+      print("%-7s %10.1f %10.1f %10.1f" % (isa, old * 1000, new * 1000, memory * 1000))
+
+
+if __name__ == "__main__":
+  main()
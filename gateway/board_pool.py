@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Boards attached to a gateway, shared by every gateway: the serial ports of
+# ESP32 boards are discovered through their USB bridges, the outcome of the
+# jobs of every port is recorded, and a port failing QUARANTINE_FAILURES
+# jobs in a row is quarantined for a time that doubles with every new
+# quarantine. Simulated boards (sim://<n> ports) stand in for the hardware.
+#
+
+
+import hashlib, threading, time
+
+try:
+  import serial
+  from serial.tools import list_ports
+except ImportError:
+  serial = None
+  list_ports = None
+
+
+# USB vendor ids of the boards and their serial bridges
+USB_VIDS = {
+  0x303a: 'Espressif USB',
+  0x10c4: 'CP210x',
+  0x1a86: 'CH34x',
+  0x0403: 'FTDI',
+}
+
+# quarantine after QUARANTINE_FAILURES failures in a row, for
+# QUARANTINE_SECONDS doubled with every quarantine up to QUARANTINE_MAX; after
+# a quarantine one more failure is enough (probation) until a job succeeds
+QUARANTINE_FAILURES = 3
+QUARANTINE_SECONDS  = 60
+QUARANTINE_MAX      = 3600
+
+
+
+
+## Pool ##
+
+def new_pool(simulate=''):
+  # simulate: the simulated boards, e.g. "esp32c3,esp32c3:dead,esp32c6:flaky"
+  pool = {'ports': {}, 'lock': threading.Lock(), 'simulated': {}}
+
+  specs = [spec.strip() for spec in simulate.split(',') if spec.strip() != '']
+  for index, spec in enumerate(specs):
+    board, sep, mode = spec.partition(':')
+    name = 'sim://' + str(index)
+    pool['simulated'][name] = new_sim_board(name, board, mode or 'ok')
+
+  return pool
+
+def new_port_state():
+  return {'failures': 0, 'quarantines': 0, 'until': 0, 'jobs': 0, 'last_ok': None, 'last_error': None}
+
+def port_state(pool, port):
+  # must be called with pool['lock'] held
+  state = pool['ports'].get(port)
+  if state == None:
+    state = new_port_state()
+    pool['ports'][port] = state
+
+  return state
+
+def port_health(state, now):
+  if state['until'] > now:
+    return 'quarantined'
+  if state['quarantines'] > 0:
+    return 'probation'
+  if state['failures'] > 0:
+    return 'failing'
+  return 'ok'
+
+def port_available(pool, port):
+  # False while the port is quarantined
+  with pool['lock']:
+    state = pool['ports'].get(port)
+    return state == None or state['until'] <= time.time()
+
+def port_ok(pool, port):
+  # a job reached the board and the board answered
+  with pool['lock']:
+    state = port_state(pool, port)
+    state['jobs']        = state['jobs'] + 1
+    state['failures']    = 0
+    state['quarantines'] = 0
+    state['last_ok']     = time.time()
+
+def port_failed(pool, port, error):
+  # a job failed because of the board (not of the program): True when the
+  # port is quarantined now
+  with pool['lock']:
+    state = port_state(pool, port)
+    state['jobs']       = state['jobs'] + 1
+    state['failures']   = state['failures'] + 1
+    state['last_error'] = error
+
+    if state['failures'] < QUARANTINE_FAILURES and state['quarantines'] == 0:
+      return False
+
+    seconds = min(QUARANTINE_MAX, QUARANTINE_SECONDS * 2 ** state['quarantines'])
+    state['quarantines'] = state['quarantines'] + 1
+    state['failures']    = 0
+    state['until']       = time.time() + seconds
+    return True
+
+def discover(pool):
+  # the boards attached now: [{'port', 'description', 'board'}]; the board
+  # model is only known for the simulated ones
+  found = []
+  if list_ports != None:
+    for info in list_ports.comports():
+      if info.vid in USB_VIDS:
+        found.append({'port': info.device, 'description': info.description or USB_VIDS[info.vid], 'board': None})
+
+  for name, sim in pool['simulated'].items():
+    found.append({'port': name, 'description': 'simulated ' + sim['board'] + ' (' + sim['mode'] + ')', 'board': sim['board']})
+
+  return found
+
+def pool_report(pool, busy):
+  # the attached boards plus every port used before ('attached': False when
+  # it is not discovered, e.g. socket:// ports), with their health and
+  # whether busy(port)
+  now   = time.time()
+  ports = {}
+  for entry in discover(pool):
+    entry['attached'] = True
+    ports[entry['port']] = entry
+
+  with pool['lock']:
+    for port in pool['ports']:
+      ports.setdefault(port, {'port': port, 'description': None, 'board': None, 'attached': False})
+
+    for port, entry in ports.items():
+      state = pool['ports'].get(port) or new_port_state()
+      entry['health']          = port_health(state, now)
+      entry['failures']        = state['failures']
+      entry['quarantine_left'] = round(max(0, state['until'] - now), 1)
+      entry['jobs']            = state['jobs']
+      entry['last_error']      = state['last_error']
+
+  for entry in ports.values():
+    entry['busy'] = busy(entry['port'])
+
+  return sorted(ports.values(), key=lambda entry: entry['port'])
+
+
+
+
+## Simulated boards ##
+
+# A simulated board opens as a serial port and, reset through RTS, prints
+# the boot messages and, once flashed, the run of the program. 'dead' boards
+# never answer, 'flaky' ones fail one flash out of three
+SIM_OUTPUT = (b'ESP-ROM:{board}\r\nbuild: sim\r\nrst:0x1 (POWERON),boot:0xc (SPI_FAST_FLASH_BOOT)\r\n',
+              b'Started program... \r\n-------------------\r\nimage {image}\r\nFinished program: 1000 cycles \r\n-------------------\r\n')
+
+def new_sim_board(name, board, mode):
+  return {'name': name, 'board': board, 'mode': mode, 'image': None, 'flashes': 0, 'lock': threading.Lock()}
+
+def simulated(pool, port):
+  return port in pool['simulated']
+
+def sim_flash(pool, port, images, baud, write):
+  # write [offset, image] on a simulated board, at baud (10 bits a byte);
+  # 0 when done, -1 as esptool when the board does not answer
+  sim = pool['simulated'][port]
+  with sim['lock']:
+    sim['flashes'] = sim['flashes'] + 1
+    write('Connecting...\n')
+    if sim['mode'] == 'dead' or (sim['mode'] == 'flaky' and sim['flashes'] % 3 == 0):
+      write('A fatal error occurred: Failed to connect to ' + sim['board'] + ': No serial data received.\n')
+      return -1
+
+    digest = hashlib.sha256()
+    for offset, image in images:
+      with open(image, 'rb') as image_file:
+        data = image_file.read()
+      digest.update(data)
+      time.sleep(len(data) * 10.0 / baud)
+      write('Wrote ' + str(len(data)) + ' bytes at ' + offset + '\n')
+
+    sim['image'] = digest.hexdigest()[:16]
+    write('Hard resetting via RTS pin...\n')
+    return 0
+
+class SimPort:
+  # the part of serial.Serial used to read a board
+  def __init__(self, sim, timeout):
+    self.sim     = sim
+    self.timeout = timeout
+    self.data    = b''
+    self.dtr     = False
+    self.reset   = False
+
+  def open(self):
+    self.data = b''
+
+  @property
+  def rts(self):
+    return self.reset
+
+  @rts.setter
+  def rts(self, value):
+    # EN goes back up: the board boots
+    if self.reset and not value and self.sim['mode'] != 'dead':
+      self.data = SIM_OUTPUT[0].replace(b'{board}', self.sim['board'].encode('utf-8'))
+      if self.sim['image'] != None:
+        self.data += SIM_OUTPUT[1].replace(b'{image}', self.sim['image'].encode('utf-8'))
+    self.reset = value
+
+  @property
+  def in_waiting(self):
+    return len(self.data)
+
+  def read(self, size=1):
+    if len(self.data) == 0:
+      time.sleep(self.timeout or 0)
+    data, self.data = self.data[:size], self.data[size:]
+    return data
+
+  def close(self):
+    self.data = b''
+
+def open_port(pool, url, **kwargs):
+  # serial.serial_for_url(), or the port of a simulated board
+  if simulated(pool, url):
+    return SimPort(pool['simulated'][url], kwargs.get('timeout'))
+
+  return serial.serial_for_url(url, **kwargs)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# CREATOR assembly to ESP-IDF assembly, shared by every gateway: each
+# rdcycle and ecall (syscall) becomes a call to the support code of the
+# project (main/*.s, creator-esp.c), saving the registers CREATOR programs
+# expect to be preserved. One table per ISA drives the expansions.
+#
+
+
+import re
+
+
+# Per-ISA templates: the registers, the frame of the ecall expansion and how
+# the cycle counter is read
+ISAS = {
+  'riscv': {
+    'ecall':    'ecall',
+    'sp':       'sp',
+    'ra':       'ra',
+    'a0':       'a0',
+    'rdcycle':  'jal ra, _rdcycle',
+    'restore':  False,      # rdcycle a0 keeps the cycles in a0
+    'saved':    ['x1'] + ['x' + str(n) for n in range(3, 10)] + ['x' + str(n) for n in range(18, 32)],
+  },
+  'xtensa': {
+    'ecall':    'syscall',
+    'sp':       '$sp',
+    'ra':       '$ra',
+    'a0':       '$a0',
+    'rdcycle':  'jal _esp_cpu_get_cycle_count',
+    'restore':  True,       # a0 is always restored
+    'saved':    ['1'] + [str(n) for n in range(3, 32)],
+  },
+}
+
+FRAME  = 128
+HEADER = ".text\n.type main, @function\n.globl main\n"
+
+
+def ecall_template(isa):
+  # register n is saved at FRAME - 4 - 4n, registers aligned as in the
+  # hand-written expansion
+  sp    = isa['sp']
+  width = max(len(reg) for reg in isa['saved']) + 1
+  saves = [(reg + ',').ljust(width) + ' ' + str(FRAME - 4 - 4 * int(reg.lstrip('x'))) + '(' + sp + ')\n' for reg in isa['saved']]
+
+  return ("#### ecall ####\n" +
+          "addi " + sp + ", " + sp + ", -" + str(FRAME) + "\n" +
+          ''.join('sw ' + save for save in saves) +
+          "jal _myecall\n" +
+          ''.join('lw ' + save for save in saves) +
+          "addi " + sp + ", " + sp + ", " + str(FRAME) + "\n" +
+          "###############\n")
+
+def rdcycle_templates(isa):
+  # (template, template when the destination is a0) to format with the
+  # destination register
+  sp, ra, a0 = isa['sp'], isa['ra'], isa['a0']
+  head = ("#### rdcycle{0}####\n" +
+          "addi " + sp + ", " + sp + ", -8\n" +
+          "sw " + ra + ", 4(" + sp + ")\n" +
+          "sw " + a0 + ", 0(" + sp + ")\n" +
+          isa['rdcycle'] + "\n" +
+          "mv {0}, " + a0 + "\n")
+  restore = "lw " + a0 + ", 0(" + sp + ")\n"
+  tail = ("lw " + ra + ", 4(" + sp + ")\n" +
+          "addi " + sp + ", " + sp + ", 8\n" +
+          "####################\n")
+
+  return head + restore + tail, head + (restore if isa['restore'] else '') + tail
+
+def line_pattern(isa):
+  # the lines whose first word is rdcycle or the ecall of the ISA (with
+  # their newline); \s is the whitespace of str.split()
+  return re.compile(r'^[^\S\n]*(?:rdcycle|' + re.escape(isa['ecall']) + r')(?!\S)[^\n]*\n?', re.M)
+
+templates = {}
+
+def isa_templates(name):
+  if name not in templates:
+    isa = ISAS[name]
+    templates[name] = (line_pattern(isa), ecall_template(isa)) + rdcycle_templates(isa)
+
+  return templates[name]
+
+
+def rewrite(text, isa):
+  """Rewrite the CREATOR program text (as read from a file in text mode)
+  for the given ISA ('riscv' or 'xtensa') and return it.
+
+  A single pass over the text expands the rdcycle and ecall / syscall lines;
+  every other line goes through unchanged. A rdcycle without a destination
+  raises IndexError.
+  """
+  pattern, ecall_text, rdcycle_text, rdcycle_a0_text = isa_templates(isa)
+  a0 = ISAS[isa]['a0']
+
+  def expand(match):
+    data = match.group(0).split(None, 2)
+    if data[0] != 'rdcycle':
+      return ecall_text
+    if data[1] == a0:
+      return rdcycle_a0_text.format(data[1])
+    return rdcycle_text.format(data[1])
+
+  # universal newlines, as the former file round-trip did
+  if '\r' in text:
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+  return HEADER + pattern.sub(expand, text)
+
+
+def creator_build(file_in, file_out, isa):
+  # file to file version of rewrite(): 0 if done, -1 on error
+  try:
+    with open(file_in, "rt") as fin:
+      text = fin.read()
+    with open(file_out, "wt") as fout:
+      fout.write(rewrite(text, isa))
+    return 0
+
+  except Exception as e:
+    print("Error adapting assembly file: ", str(e))
+    return -1
@@ -10,4 +10,9 @@ fi
   kill -9 $$
 } &
 
-idf.py -p $1 monitor &> monitor_output.txt
+# with a target board, monitor its warm build directory (see esp_gateway.py)
+if [ $# -gt 2 ]; then
+  idf.py -B build-$3 -D SDKCONFIG=sdkconfig.$3 -p $1 monitor &> monitor_output.txt
+else
+  idf.py -p $1 monitor &> monitor_output.txt
+fi
@@ -0,0 +1,683 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Gateway of the ESP32 boards, shared by every board folder: each gateway.py
+# only tells the ISA of its boards to create_app(). Builds are warm (a build
+# directory per target board in the port workspace), the images are flashed
+# by esptool from the firmware cache when the program was built before, and
+# the board output is read from its serial port.
+#
+
+
+from flask import Flask, request, jsonify, send_file, Response
+from flask_cors import CORS, cross_origin
+import os, sys, re, time, hashlib, threading, json, codecs
+
+try:
+  import serial
+except ImportError:
+  serial = None
+
+try:
+  import esptool
+except ImportError:
+  esptool = None
+
+import creator_asm
+import board_pool
+import firmware_cache
+from gateway_jobs import (jobs, jobs_lock, port_job, sync_workspace, port_busy, stop_job, new_output, emit, emit_stage,
+                          output_close, output_read, output_text, do_cmd, do_cmd_output, do_stage)
+
+# set by create_app()
+ISA        = None
+cache      = None
+pool       = None
+job_stdout = None
+
+
+# (1) Get form values
+def do_get_form(request):
+  try:
+    return send_file(os.path.abspath('gateway.html'))
+  except Exception as e:
+    return str(e)
+
+
+def run_job(job, do, req_data, output=None):
+  # one request per port at a time; the job output ends in req_data['status']
+  with job['lock']:
+    job['cancelled'] = False
+    job['output']    = output if output != None else new_output()
+    try:
+      if board_pool.port_available(pool, job['port']):
+        sync_workspace(job)
+        req_data = do(job, req_data)
+      else:
+        emit(job, 'The board on ' + job['port'] + ' is quarantined, see /boards\n')
+        req_data['error']       = -1
+        req_data['quarantined'] = True
+    finally:
+      output_close(job['output'])
+      req_data['status'] += output_text(job['output'])
+
+  return req_data
+
+def board_failed(req_data, job, error):
+  # the board failed the job (not the program): a few in a row quarantine it
+  req_data['board_error'] = error
+  if board_pool.port_failed(pool, job['port'], error):
+    emit(job, 'The board on ' + job['port'] + ' failed again (' + error + '): quarantined\n')
+    req_data['quarantined'] = True
+
+
+# Warm builds: one build directory (and sdkconfig) per target board is kept
+# in the workspace between jobs, so a job only assembles main/program.s and
+# relinks. Builds are CPU bound: at most cpu_count() of them run at once
+# (flashing and monitoring only wait on their serial port)
+build_slots = threading.BoundedSemaphore(os.cpu_count() or 1)
+
+def build_dir(target_board):
+  return 'build-' + target_board
+
+def idf_cmd(target_board, *args):
+  return ['idf.py', '-B', build_dir(target_board), '-D', 'SDKCONFIG=sdkconfig.' + target_board] + list(args)
+
+def build_target(job, target_board):
+  # IDF target the build directory is configured for (None if not configured)
+  try:
+    with open(os.path.join(job['workspace'], build_dir(target_board), 'CMakeCache.txt'), 'r') as cache:
+      for line in cache:
+        if line.startswith('IDF_TARGET:'):
+          return line.strip().split('=', 1)[1]
+  except OSError:
+    pass
+
+  return None
+
+# Build failures: the assembler errors of main/program.s are the student's
+# and go back as they are; only a failed configure (CMake, or a build
+# directory ninja cannot use) is retried with a clean build, as set-target
+# throws the warm build directory away
+PROGRAM_ERROR   = re.compile(r'program\.s:\d+(:\d+)?: [Ee]rror:')
+CONFIGURE_ERROR = re.compile(r'CMake Error|Configuring incomplete|ninja: error:')
+
+def build_failure(job, target_board, lines):
+  # 'program', 'configure' or None (any other failure); without the build
+  # output (do_cmd) only a missing build.ninja tells a failed configure
+  if any(PROGRAM_ERROR.search(line) for line in lines):
+    return 'program'
+  if any(CONFIGURE_ERROR.search(line) for line in lines):
+    return 'configure'
+  if not os.path.isfile(os.path.join(job['workspace'], build_dir(target_board), 'build.ninja')):
+    return 'configure'
+
+  return None
+
+def build_once(req_data, target_board, do, job, clean):
+  # set-target (which cleans the build directory) only for a new target;
+  # both take a build slot, as CMake runs in either
+  with build_slots:
+    if clean or build_target(job, target_board) != target_board:
+      error = do_stage(req_data, 'set-target', do, idf_cmd(target_board, 'set-target', target_board), job)
+      if error != 0:
+        return error
+
+    return do_stage(req_data, 'build', do, idf_cmd(target_board, 'build'), job)
+
+def do_build(req_data, target_board, do, job, clean=False):
+  cursor = job['output']['next']
+  error  = build_once(req_data, target_board, do, job, clean)
+  if error == 0 or job['cancelled']:
+    return error
+
+  entries, cursor, skipped, closed = output_read(job['output'], cursor, 0)
+  lines   = [entry['line'] for entry in entries if 'line' in entry]
+  failure = build_failure(job, target_board, lines)
+
+  if failure == 'program':
+    req_data['build_error'] = 'program'
+    emit(job, 'main/program.s does not assemble:\n')
+    for line in lines:
+      if PROGRAM_ERROR.search(line):
+        emit(job, '  ' + line[line.rindex('program.s:'):] + '\n')
+
+  # a stale build directory must not fail the job: retry once from scratch
+  elif failure == 'configure' and not clean:
+    emit(job, 'Configuring the build failed, building from scratch...\n')
+    error = build_once(req_data, target_board, do, job, True)
+
+  return error
+
+
+# Fast flash: the images listed in flash_args are written by esptool, run in
+# this process (no idf.py nor CMake start-up), at their offsets, compressed
+# and at FLASH_BAUD. The bootloader, partition table and OTA data only change
+# with the toolchain, so when a port already has the same ones only the app
+# partition is written. idf.py flash stays as the fallback
+FLASH_BAUD    = 921600
+FLASH_SUPPORT = ['bootloader.bin', 'partition-table.bin', 'ota_data_initial.bin']
+
+class Cancelled(Exception):
+  pass
+
+class JobStdout:
+  # sys.stdout while esptool runs in-process: what a job thread prints goes
+  # to its job output (and stops esptool once the job is cancelled), the
+  # rest to the real stdout
+  def __init__(self, stdout):
+    self.stdout = stdout
+    self.local  = threading.local()
+
+  def write(self, text):
+    job = getattr(self.local, 'job', None)
+    if job == None:
+      return self.stdout.write(text)
+    if job['cancelled']:
+      raise Cancelled()
+    emit(job, text)
+    return len(text)
+
+  def flush(self):
+    self.stdout.flush()
+
+  def isatty(self):
+    # esptool prints its progress a line at a time
+    return False
+
+  def __getattr__(self, name):
+    return getattr(self.stdout, name)
+
+def flash_images(flash_args):
+  # (write_flash options, [offset, image] of the bootloader, partition table
+  # and OTA data, [offset, image] of the app) of an esptool argument file,
+  # whose image paths are relative to the file (cached ones: '<n>-<name>')
+  with open(flash_args, 'r') as args_file:
+    lines = args_file.read().split('\n')
+
+  base    = os.path.dirname(os.path.abspath(flash_args))
+  support = []
+  app     = []
+  for line in lines[1:]:
+    if line.strip() == '':
+      continue
+    offset, image = line.split(None, 1)
+    image = os.path.join(base, image.strip())
+    if re.sub(r'^[0-9]+-', '', os.path.basename(image)) in FLASH_SUPPORT:
+      support.append([offset, image])
+    else:
+      app.append([offset, image])
+
+  return lines[0].split(), support, app
+
+def images_digest(target_board, images):
+  digest = hashlib.sha256(target_board.encode('utf-8'))
+  for offset, image in images:
+    with open(image, 'rb') as image_file:
+      digest.update(b'\0' + offset.encode('utf-8') + b'\0' + image_file.read())
+
+  return digest.hexdigest()
+
+def do_esptool(req_data, argv, job):
+  # esptool.main(argv) in this thread, its output to the job output
+  if job['cancelled']:
+    emit(job, 'Cancelled\n')
+    req_data['error'] = -1
+    return req_data['error']
+
+  job_stdout.local.job = job
+  try:
+    esptool.main(argv)
+    req_data['error'] = 0
+  except Cancelled:
+    emit(job, 'Cancelled\n')
+    req_data['error'] = -1
+  except (Exception, SystemExit) as e:
+    emit(job, 'esptool: ' + str(e) + '\n')
+    req_data['error'] = -1
+  finally:
+    job_stdout.local.job = None
+
+  return req_data['error']
+
+def do_sim_flash(req_data, arg, job):
+  target_device, images = arg
+  req_data['error'] = board_pool.sim_flash(pool, target_device, images, FLASH_BAUD, lambda text: emit(job, text))
+  return req_data['error']
+
+def do_fast_flash(req_data, target_board, target_device, flash_args, do, job):
+  # the whole firmware the first time a port gets it, then the app alone
+  try:
+    options, support, app = flash_images(flash_args)
+    flashed = images_digest(target_board, support)
+  except (OSError, ValueError) as e:
+    emit(job, 'Error reading ' + flash_args + ': ' + str(e) + '\n')
+    return -1
+
+  images = app
+  mode   = 'app'
+  if job.get('flashed') != flashed:
+    images = support + app
+    mode   = 'full'
+
+  argv = ['--chip', target_board, '-p', target_device, '-b', str(FLASH_BAUD), '--before', 'default_reset',
+          '--after', 'hard_reset', 'write_flash', '--compress'] + options + [arg for image in images for arg in image]
+
+  # until it is done, the port may hold anything
+  job['flashed'] = None
+  start = time.time()
+  if board_pool.simulated(pool, target_device):
+    error = do_stage(req_data, 'flash', do_sim_flash, [target_device, images], job)
+  elif esptool != None:
+    error = do_stage(req_data, 'flash', do_esptool, argv, job)
+  else:
+    error = do_stage(req_data, 'flash', do, [sys.executable, '-m', 'esptool'] + argv, job)
+
+  if error == 0:
+    job['flashed']    = flashed
+    req_data['flash'] = {'mode': mode, 'bytes': sum(os.path.getsize(image) for offset, image in images), 'baud': FLASH_BAUD,
+                         'seconds': round(time.time() - start, 3)}
+    emit(job, 'Flashed ' + str(req_data['flash']['bytes']) + ' bytes (' + mode + ') in ' + str(req_data['flash']['seconds']) + ' s\n')
+
+  return error
+
+def do_build_flash(req_data, target_board, target_device, do, job, clean=False):
+  # flash the cached images of this very program, or build and flash it
+  key   = firmware_cache.firmware_key(cache, job, target_board)
+  image = None
+  if not clean:
+    image = firmware_cache.cache_lookup(cache, key)
+
+  req_data['cache'] = 'miss'
+  if image != None:
+    req_data['cache'] = 'hit'
+    error = do_fast_flash(req_data, target_board, target_device, image, do, job)
+    if error == 0 or job['cancelled']:
+      return error
+    emit(job, 'Flashing the cached firmware failed, building it again...\n')
+
+  error = do_build(req_data, target_board, do, job, clean)
+  if error != 0:
+    return error
+
+  build = os.path.join(job['workspace'], build_dir(target_board))
+  firmware_cache.cache_store(cache, key, build)
+  error = do_fast_flash(req_data, target_board, target_device, os.path.join(build, 'flash_args'), do, job)
+  if error != 0 and not job['cancelled'] and not board_pool.simulated(pool, target_device):
+    emit(job, 'Fast flash failed, flashing with idf.py...\n')
+    req_data['flash'] = {'mode': 'idf.py'}
+    error = do_stage(req_data, 'flash', do, idf_cmd(target_board, '-p', target_device, 'flash'), job)
+
+  if error != 0 and not job['cancelled']:
+    board_failed(req_data, job, 'flash')
+
+  return error
+
+# Serial capture: the board output is read straight from its serial port
+# (pyserial, installed with esptool) after a reset, as idf.py monitor does,
+# until the program ends (creator-esp.c prints "Finished program:"), the
+# board panics, nothing arrives for MONITOR_IDLE seconds, MONITOR_BYTES are
+# read or MONITOR_SECONDS pass. Without pyserial gateway_monitor.sh (of the
+# board folder, the working directory) is used
+MONITOR         = os.path.abspath('gateway_monitor.sh')
+MONITOR_BAUD    = 115200
+MONITOR_SECONDS = 50
+MONITOR_IDLE    = 10
+MONITOR_BYTES   = 64 * 1024
+MONITOR_END     = [b'Finished program:', b'abort() was called', b'Guru Meditation Error', b'Rebooting...']
+
+def monitor_end(output, start):
+  # a complete line with an end sentinel after output[start:]
+  for sentinel in MONITOR_END:
+    found = output.find(sentinel, start)
+    if found != -1 and output.find(b'\n', found) != -1:
+      return True
+
+  return False
+
+def do_serial(req_data, target_device, job):
+  if serial == None and not board_pool.simulated(pool, target_device):
+    error = do_cmd_output(req_data, [MONITOR, target_device, str(MONITOR_SECONDS), req_data['target_board']], job)
+    error = do_cmd_output(req_data, ['cat', 'monitor_output.txt'], job)
+    error = do_cmd_output(req_data, ['rm', 'monitor_output.txt'], job)
+    return error
+
+  output  = bytearray()
+  reason  = 'timeout'
+  decoder = codecs.getincrementaldecoder('utf-8')('replace')
+  try:
+    port = board_pool.open_port(pool, target_device, baudrate=MONITOR_BAUD, timeout=0.1, do_not_open=True)
+    port.dtr = False
+    port.rts = False
+    port.open()
+
+    # reset the board (EN through RTS), so the output is read from the start
+    port.rts = True
+    time.sleep(0.1)
+    port.rts = False
+
+    start = last = time.time()
+    while True:
+      if job['cancelled']:
+        reason = 'cancelled'
+        break
+
+      data = port.read(max(1, port.in_waiting))
+      now  = time.time()
+      if len(data) > 0:
+        scan = max(0, len(output) - 64)
+        output += data
+        last = now
+        emit(job, decoder.decode(data).replace('\r', ''))
+        if monitor_end(output, scan):
+          reason = 'end'
+          break
+        if len(output) >= MONITOR_BYTES:
+          reason = 'bytes'
+          break
+      elif now - last > MONITOR_IDLE:
+        reason = 'idle'
+        break
+
+      if now - start > MONITOR_SECONDS:
+        break
+
+    port.close()
+    req_data['error'] = 0
+
+    # not even the boot messages after the reset
+    if len(output) == 0 and reason != 'cancelled':
+      board_failed(req_data, job, 'no output')
+
+  except Exception as e:
+    emit(job, 'Error reading ' + target_device + ': ' + str(e) + '\n')
+    req_data['error'] = -1
+    board_failed(req_data, job, 'serial')
+
+  emit(job, decoder.decode(b'', True) + '\n')
+  req_data['monitor'] = reason
+
+  return req_data['error']
+
+def do_adapt(req_data, job):
+  # write the assembly program as main/program.s of the job workspace
+  emit_stage(job, 'adapt')
+  start = time.time()
+
+  # transform the assembly program (in memory)
+  try:
+    program = creator_asm.rewrite(req_data['assembly'], ISA)
+    with open(os.path.join(job['workspace'], 'main', 'program.s'), 'w') as program_file:
+      program_file.write(program)
+    error = 0
+  except Exception as e:
+    print("Error adapting assembly file: ", str(e))
+    emit(job, 'Error adapting assembly file...\n')
+    error = -1
+
+  req_data['timings']['adapt'] = round(time.time() - start, 3)
+
+  return error
+
+
+# (2) Flasing assembly program into target board
+def do_flash(job, req_data):
+  target_device = req_data['target_port']
+  target_board  = req_data['target_board']
+  clean_build   = req_data.get('clean_build', False)
+
+  error = do_adapt(req_data, job)
+
+  # flashing steps...
+  if error == 0:
+    error = do_build_flash(req_data, target_board, target_device, do_cmd, job, clean_build)
+  if error == 0:
+    board_pool.port_ok(pool, target_device)
+
+  return req_data
+
+def do_flash_request(request):
+  try:
+    req_data = request.get_json()
+    target_device      = req_data['target_port']
+    req_data['status'] = ''
+    req_data['timings'] = {}
+
+    req_data = run_job(port_job(target_device), do_flash, req_data)
+
+  except Exception as e:
+    req_data['status'] += str(e) + '\n'
+
+  return jsonify(req_data)
+
+
+# (3) Run program into the target board
+def do_monitor(job, req_data):
+  target_device = req_data['target_port']
+
+  if 'target_board' in req_data:
+    do_cmd(req_data, idf_cmd(req_data['target_board'], '-p', target_device, 'monitor'), job)
+  else:
+    do_cmd(req_data, ['idf.py', '-p', target_device, 'monitor'], job)
+
+  return req_data
+
+def do_monitor_request(request):
+  try:
+    req_data = request.get_json()
+    target_device      = req_data['target_port']
+    req_data['status'] = ''
+
+    req_data = run_job(port_job(target_device), do_monitor, req_data)
+
+  except Exception as e:
+    req_data['status'] += str(e) + '\n'
+
+  return jsonify(req_data)
+
+
+# (4) Flasing assembly program into target board
+def do_job(job, req_data):
+  target_device = req_data['target_port']
+  target_board  = req_data['target_board']
+  clean_build   = req_data.get('clean_build', False)
+
+  error = do_adapt(req_data, job)
+
+  # flashing steps...
+  if error == 0:
+    error = do_build_flash(req_data, target_board, target_device, do_cmd_output, job, clean_build)
+  if error == 0:
+    error = do_stage(req_data, 'monitor', do_serial, target_device, job)
+  if error == 0 and 'board_error' not in req_data:
+    board_pool.port_ok(pool, target_device)
+
+  return req_data
+
+def do_job_request(request):
+  try:
+    req_data = request.get_json()
+    target_device      = req_data['target_port']
+    req_data['status'] = ''
+    req_data['timings'] = {}
+
+    req_data = run_job(port_job(target_device), do_job, req_data)
+
+  except Exception as e:
+    req_data['status'] += str(e) + '\n'
+
+  return jsonify(req_data)
+
+
+# (5) Stop flashing: the job of 'target_port' (every job if not given)
+def do_stop_flash_request(request):
+  try:
+    req_data = request.get_json()
+    req_data['status'] = ''
+
+    with jobs_lock:
+      if 'target_port' in req_data:
+        stopped = [jobs[req_data['target_port']]] if req_data['target_port'] in jobs else []
+      else:
+        stopped = list(jobs.values())
+
+    for job in stopped:
+      stop_job(job)
+      req_data['status'] += 'Stopping job on ' + job['port'] + '\n'
+
+  except Exception as e:
+    req_data['status'] += str(e) + '\n'
+
+  return jsonify(req_data)
+
+
+# (6) Flash or job with the output as server-sent events while it runs:
+# {"stage": name} markers, {"line": text} lines, {"skipped": n} if the reader
+# fell more than OUTPUT_LINES behind, and last {"result": reply}
+def do_stream_request(request, do):
+  # a bad request gets the reply of the other endpoints at once, not a stream
+  req_data = request.get_json(silent=True)
+  if not isinstance(req_data, dict):
+    return jsonify({'status': 'Expected a JSON object\n', 'error': -1}), 400
+  if not isinstance(req_data.get('target_port'), str):
+    req_data['status'] = 'Missing target_port\n'
+    req_data['error']  = -1
+    return jsonify(req_data), 400
+
+  req_data['status'] = ''
+  req_data['timings'] = {}
+
+  job    = port_job(req_data['target_port'])
+  output = new_output()
+  reply  = {}
+
+  def run():
+    try:
+      reply['result'] = run_job(job, do, req_data, output)
+    except Exception as e:
+      req_data['status'] += str(e) + '\n'
+      reply['result'] = req_data
+      output_close(output)
+
+  runner = threading.Thread(target=run, daemon=True)
+  runner.start()
+
+  def stream():
+    cursor = 0
+    try:
+      while True:
+        entries, cursor, skipped, closed = output_read(output, cursor, 15)
+        if skipped > 0:
+          yield 'data: ' + json.dumps({'skipped': skipped}) + '\n\n'
+        for entry in entries:
+          yield 'data: ' + json.dumps(entry) + '\n\n'
+        if closed:
+          break
+        if len(entries) == 0:
+          yield ': keep-alive\n\n'
+
+      runner.join()
+      yield 'data: ' + json.dumps({'result': reply['result']}) + '\n\n'
+
+    except GeneratorExit:
+      # the client is gone: so is the reason to run the job
+      if job.get('output') is output:
+        stop_job(job)
+      raise
+
+  return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Setup firmware cache, board pool (GATEWAY_SIMULATE: simulated boards, e.g.
+# "esp32c3,esp32c3:dead"), esptool output, flask and cors for the boards of
+# isa ('riscv', 'xtensa'):
+def create_app(isa):
+  global ISA, cache, pool, job_stdout
+
+  ISA   = isa
+  cache = firmware_cache.new_cache(firmware_cache.CACHE_DIR, firmware_cache.CACHE_MAX_BYTES)
+  pool  = board_pool.new_pool(os.environ.get('GATEWAY_SIMULATE', ''))
+
+  job_stdout = JobStdout(sys.stdout)
+  if esptool != None:
+    sys.stdout = job_stdout
+
+  app  = Flask(__name__)
+  cors = CORS(app)
+  app.config['CORS_HEADERS'] = 'Content-Type'
+
+  # (1) GET / -> send gateway.html
+  @app.route("/", methods=["GET"])
+  @cross_origin()
+  def get_form():
+    return do_get_form(request)
+
+  # (2) POST /flash -> flash
+  @app.route("/flash", methods=["POST"])
+  @cross_origin()
+  def post_flash():
+    return do_flash_request(request)
+
+  # (3) POST /monitor -> flash
+  @app.route("/monitor", methods=["POST"])
+  @cross_origin()
+  def post_monitor():
+    return do_monitor_request(request)
+
+  # (4) POST /job -> flash + monitor
+  @app.route("/job", methods=["POST"])
+  @cross_origin()
+  def post_job():
+    return do_job_request(request)
+
+  # (5) POST /stop -> cancel
+  @app.route("/stop", methods=["POST"])
+  @cross_origin()
+  def post_stop_flash():
+    return do_stop_flash_request(request)
+
+  # (6) POST /flash/stream, /job/stream -> flash, flash + monitor (event stream)
+  @app.route("/flash/stream", methods=["POST"])
+  @cross_origin()
+  def post_flash_stream():
+    return do_stream_request(request, do_flash)
+
+  @app.route("/job/stream", methods=["POST"])
+  @cross_origin()
+  def post_job_stream():
+    return do_stream_request(request, do_job)
+
+  # (7) GET /cache -> firmware cache counters
+  @app.route("/cache", methods=["GET"])
+  @cross_origin()
+  def get_cache():
+    return jsonify(firmware_cache.cache_stats(cache))
+
+  # (8) GET /boards -> attached boards, their health and busy state
+  @app.route("/boards", methods=["GET"])
+  @cross_origin()
+  def get_boards():
+    return jsonify({'boards': board_pool.pool_report(pool, port_busy)})
+
+  return app
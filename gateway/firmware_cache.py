@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Firmware cache, shared by every gateway: the flash images of every build
+# are kept in firmware_cache/<key>/, where key hashes main/program.s, the
+# target board and the toolchain, so a resubmitted program is flashed without
+# building. The least recently used images are evicted above CACHE_MAX_BYTES,
+# and all of them once the toolchain changes (firmware_cache/toolchain keeps
+# the one they were built with)
+#
+
+
+import subprocess, os, hashlib, shutil, threading
+from collections import OrderedDict
+
+from gateway_jobs import template_files
+
+
+CACHE_DIR       = 'firmware_cache'
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+idf_version = None
+toolchain   = {'files': None, 'version': None}
+toolchain_lock = threading.Lock()
+
+def toolchain_version():
+  # ESP-IDF version (asked once) plus every template file linked with the
+  # programs, hashed again whenever one of them changes (size or mtime)
+  global idf_version
+  with toolchain_lock:
+    if idf_version == None:
+      try:
+        result = subprocess.run(['idf.py', '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60)
+        idf_version = result.stdout
+      except Exception as e:
+        idf_version = os.environ.get('IDF_PATH', '').encode('utf-8')
+
+    files = [(name, os.path.getsize(name), os.path.getmtime(name)) for name in template_files()]
+    if files != toolchain['files']:
+      digest = hashlib.sha256(idf_version)
+      for name, size, mtime in files:
+        with open(name, 'rb') as source:
+          digest.update(b'\0' + name.encode('utf-8') + b'\0' + source.read())
+
+      toolchain['files']   = files
+      toolchain['version'] = digest.hexdigest()
+
+    return toolchain['version']
+
+def firmware_key(cache, job, target_board):
+  version = toolchain_version()
+  cache_toolchain(cache, version)
+
+  digest = hashlib.sha256()
+  with open(os.path.join(job['workspace'], 'main', 'program.s'), 'rb') as program:
+    digest.update(program.read())
+  digest.update(b'\0' + target_board.encode('utf-8') + b'\0' + version.encode('utf-8'))
+
+  return digest.hexdigest()
+
+def entry_size(entry):
+  return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+def new_cache(path, max_bytes):
+  # entries (key -> bytes) in LRU order, oldest first; on start-up the
+  # directory modification times give that order back
+  os.makedirs(path, exist_ok=True)
+
+  cache = {'path': path, 'max_bytes': max_bytes, 'entries': OrderedDict(), 'bytes': 0, 'lock': threading.Lock(),
+           'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+  entries = [name for name in os.listdir(path) if os.path.isfile(os.path.join(path, name, 'flash_args'))]
+  for key in sorted(entries, key=lambda name: os.path.getmtime(os.path.join(path, name))):
+    cache['entries'][key] = entry_size(os.path.join(path, key))
+    cache['bytes'] += cache['entries'][key]
+
+  try:
+    with open(os.path.join(path, 'toolchain'), 'r') as version_file:
+      cache['toolchain'] = version_file.read().strip()
+  except OSError:
+    cache['toolchain'] = None
+
+  return cache
+
+def cache_toolchain(cache, version):
+  # the images built with another toolchain are of no use any more: drop them
+  with cache['lock']:
+    if cache['toolchain'] == version:
+      return
+
+    for key in cache['entries']:
+      shutil.rmtree(os.path.join(cache['path'], key), ignore_errors=True)
+    cache['entries'].clear()
+    cache['bytes'] = 0
+
+    with open(os.path.join(cache['path'], 'toolchain'), 'w') as version_file:
+      version_file.write(version + '\n')
+    cache['toolchain'] = version
+
+def cache_lookup(cache, key):
+  # esptool argument file of the cached images (None on a miss)
+  with cache['lock']:
+    if key not in cache['entries']:
+      cache['misses'] += 1
+      return None
+
+    cache['hits'] += 1
+    cache['entries'].move_to_end(key)
+    entry = os.path.join(cache['path'], key)
+    os.utime(entry)
+
+    return os.path.abspath(os.path.join(entry, 'flash_args'))
+
+def cache_store(cache, key, build):
+  # copy the images listed in <build>/flash_args; a failure only loses the entry
+  entry = os.path.join(cache['path'], key)
+  tmp   = entry + '.tmp' + str(threading.get_ident())
+  try:
+    with open(os.path.join(build, 'flash_args'), 'r') as args_file:
+      lines = args_file.read().split('\n')
+
+    os.makedirs(tmp, exist_ok=True)
+    flash_args = [lines[0]]
+    for index, line in enumerate(lines[1:]):
+      if line.strip() == '':
+        continue
+      offset, image = line.split(None, 1)
+      name = str(index) + '-' + os.path.basename(image)
+      shutil.copyfile(os.path.join(build, image), os.path.join(tmp, name))
+      flash_args.append(offset + ' ' + os.path.abspath(os.path.join(entry, name)))
+
+    with open(os.path.join(tmp, 'flash_args'), 'w') as args_file:
+      args_file.write('\n'.join(flash_args) + '\n')
+
+    with cache['lock']:
+      if key in cache['entries']:
+        shutil.rmtree(tmp)
+        return
+
+      os.rename(tmp, entry)
+      cache['entries'][key] = entry_size(entry)
+      cache['bytes'] += cache['entries'][key]
+      cache['stores'] += 1
+
+      while cache['bytes'] > cache['max_bytes'] and len(cache['entries']) > 1:
+        old, size = cache['entries'].popitem(last=False)
+        shutil.rmtree(os.path.join(cache['path'], old), ignore_errors=True)
+        cache['bytes'] -= size
+        cache['evictions'] += 1
+
+  except Exception as e:
+    print("Error caching firmware: ", str(e))
+    shutil.rmtree(tmp, ignore_errors=True)
+
+def cache_stats(cache):
+  with cache['lock']:
+    stats = {key: cache[key] for key in ('hits', 'misses', 'stores', 'evictions', 'bytes', 'max_bytes')}
+    stats['entries'] = len(cache['entries'])
+
+  return stats
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Jobs of a gateway, shared by every gateway: every serial port gets its own
+# copy of the project in workspaces/<port>/, so requests for different boards
+# never share files and build, flash and monitor in parallel, while the
+# requests for one port run one after another. The output of the running job
+# is kept in a ring that the replies and the event streams read.
+#
+
+
+import subprocess, os, re, signal, time, shutil, threading
+from collections import deque
+from itertools import islice
+
+
+# Workspaces: the template files (relative to the board folder, the working
+# directory) are copied into workspaces/<port>/, main/program.s aside
+WORKSPACES = 'workspaces'
+TEMPLATE   = ['CMakeLists.txt', 'sdkconfig', 'main', 'creator']
+
+jobs      = {}
+jobs_lock = threading.Lock()
+
+def port_job(target_port):
+  # the job slot of a serial port: its workspace, lock and running command
+  with jobs_lock:
+    job = jobs.get(target_port)
+    if job == None:
+      name = re.sub(r'[^A-Za-z0-9_.-]', '_', target_port.strip('/'))
+      job  = {'port': target_port, 'workspace': os.path.abspath(os.path.join(WORKSPACES, name)),
+              'lock': threading.Lock(), 'process': None, 'cancelled': False}
+      jobs[target_port] = job
+
+  return job
+
+def template_files():
+  # every file of the template but main/program.s (written by each job)
+  files = []
+  for item in TEMPLATE:
+    if os.path.isdir(item):
+      files += sorted(os.path.join(root, name) for root, dirs, names in os.walk(item) for name in names)
+    elif os.path.isfile(item):
+      files.append(item)
+
+  return [name for name in files if name != os.path.join('main', 'program.s')]
+
+def sync_workspace(job):
+  # copy the template files that are missing or changed (build dirs are kept)
+  for name in template_files():
+    target = os.path.join(job['workspace'], name)
+    stat   = os.stat(name)
+    if not os.path.isfile(target) or os.path.getsize(target) != stat.st_size or os.path.getmtime(target) != stat.st_mtime:
+      os.makedirs(os.path.dirname(target), exist_ok=True)
+      shutil.copy2(name, target)
+
+def stop_process(process, sig):
+  try:
+    os.killpg(process.pid, sig)
+  except OSError:
+    pass
+
+def port_busy(target_port):
+  with jobs_lock:
+    job = jobs.get(target_port)
+
+  return job != None and job['lock'].locked()
+
+def stop_job(job):
+  # cancel the running command and every step left of the job
+  job['cancelled'] = True
+  process = job['process']
+  if process != None:
+    stop_process(process, signal.SIGTERM)
+
+
+# Job output: the lines of the running job are kept in a ring of the last
+# OUTPUT_LINES lines, so memory stays flat however chatty a build is. Every
+# entry is {'line': text} or a stage marker {'stage': name}; the final reply
+# takes the lines left in the ring and /job/stream, /flash/stream follow it
+OUTPUT_LINES     = 5000
+OUTPUT_LINE_SIZE = 4096
+
+def new_output():
+  # 'next' is the sequence number of the next entry
+  return {'entries': deque(maxlen=OUTPUT_LINES), 'next': 0, 'partial': '', 'done': False, 'cond': threading.Condition()}
+
+def output_add(output, entry):
+  # must be called with output['cond'] held
+  output['entries'].append(entry)
+  output['next'] += 1
+  output['cond'].notify_all()
+
+def output_flush(output):
+  # must be called with output['cond'] held
+  if output['partial'] != '':
+    output_add(output, {'line': output['partial']})
+    output['partial'] = ''
+
+def emit(job, text):
+  # add text to the job output, line by line
+  output = job['output']
+  with output['cond']:
+    lines = (output['partial'] + text).split('\n')
+    output['partial'] = lines.pop()
+    for line in lines:
+      output_add(output, {'line': line})
+    while len(output['partial']) > OUTPUT_LINE_SIZE:
+      output_add(output, {'line': output['partial'][:OUTPUT_LINE_SIZE]})
+      output['partial'] = output['partial'][OUTPUT_LINE_SIZE:]
+
+def emit_stage(job, stage):
+  output = job['output']
+  with output['cond']:
+    output_flush(output)
+    output_add(output, {'stage': stage})
+
+def output_close(output):
+  with output['cond']:
+    output_flush(output)
+    output['done'] = True
+    output['cond'].notify_all()
+
+def output_read(output, cursor, timeout):
+  # entries from sequence number cursor on, waiting up to timeout for one:
+  # (entries, next cursor, entries lost to the ring, output closed)
+  with output['cond']:
+    output['cond'].wait_for(lambda: output['next'] > cursor or output['done'], timeout)
+    first   = output['next'] - len(output['entries'])
+    entries = list(islice(output['entries'], max(0, cursor - first), None))
+    return entries, output['next'], max(0, first - cursor), output['done']
+
+def output_text(output):
+  # the lines still in the ring
+  with output['cond']:
+    text = ''
+    if output['next'] > len(output['entries']):
+      text = '[... ' + str(output['next'] - len(output['entries'])) + ' earlier lines dropped ...]\n'
+    return text + ''.join(entry['line'] + '\n' for entry in output['entries'] if 'line' in entry)
+
+
+def run_cmd(req_data, cmd_array, job, stdout):
+  # run cmd_array in the job workspace, where /stop can cancel it
+  if job['cancelled']:
+    emit(job, 'Cancelled\n')
+    req_data['error'] = -1
+    return req_data['error']
+
+  try:
+    process = subprocess.Popen(cmd_array, stdout=stdout, stderr=subprocess.STDOUT if stdout != None else None,
+                               cwd=job['workspace'], start_new_session=True)
+    job['process'] = process
+    timer = threading.Timer(60, stop_process, [process, signal.SIGKILL])
+    timer.start()
+
+    # the output goes to the job output as it comes
+    if process.stdout != None:
+      for line in process.stdout:
+        emit(job, line.decode('utf-8', 'replace'))
+      emit(job, '\n')
+
+    process.wait()
+    timer.cancel()
+    req_data['error'] = process.returncode
+    if job['cancelled']:
+      emit(job, 'Cancelled\n')
+
+  except Exception as e:
+    emit(job, str(e) + '\n')
+    req_data['error'] = -1
+
+  job['process'] = None
+
+  return req_data['error']
+
+def do_cmd(req_data, cmd_array, job):
+  return run_cmd(req_data, cmd_array, job, None)
+
+def do_cmd_output(req_data, cmd_array, job):
+  return run_cmd(req_data, cmd_array, job, subprocess.PIPE)
+
+
+def do_stage(req_data, stage, do, arg, job):
+  # run one step and add its wall time to req_data['timings'][stage]
+  emit_stage(job, stage)
+  start = time.time()
+  error = do(req_data, arg, job)
+  req_data['timings'][stage] = round(req_data['timings'].get(stage, 0) + time.time() - start, 3)
+
+  return error
@@ -14,12 +14,17 @@ echo "  * Gateway zipping..."
 cd gateway
 rm *.zip
 
-zip -9rq esp32c2.zip esp32c2/
-zip -9rq esp32c3.zip esp32c3/
-zip -9rq esp32c6.zip esp32c6/
-zip -9rq esp32h2.zip esp32h2/
-zip -9rq esp32s2.zip esp32s2/
-zip -9rq esp32s3.zip esp32s3/
+# every board folder gets a copy of the modules shared by the gateways
+SHARED="creator_asm.py board_pool.py gateway_jobs.py firmware_cache.py esp_gateway.py"
+
+for BOARD in esp32c2 esp32c3 esp32c6 esp32h2 esp32s2 esp32s3; do
+  zip -9rq ${BOARD}.zip ${BOARD}/
+
+  mkdir -p .shared/${BOARD}
+  cp ${SHARED} .shared/${BOARD}/
+  (cd .shared && zip -9rq ../${BOARD}.zip ${BOARD}/)
+  rm -rf .shared
+done
 cd ..
 
 
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Enqueue-to-dispatch latency benchmark: runs the remote lab workers against
+# a stub gateway and measures the time from enqueue_request() until the job
+# reaches the gateway.
+#
+# Use: python3 bench_dispatch.py [--jobs N] [--boards N] [--legacy-poll SECONDS]
+#
+
+
+import argparse, random, statistics, threading, time
+
+from job_queue import new_queue, enqueue_request, dequeue_request
+from stub_gateway import StubGateway
+import worker as lab_worker
+
+
+
+
+def legacy_worker(deployment, item, queue_incoming, queue_outgoing, notify, poll):
+  # the former polling loop, kept only for comparison
+  target  = deployment[item]
+  session = lab_worker.gateway_session()
+
+  while 1:
+    ret = dequeue_request (queue_incoming, target['target_board'])
+    if ret == None:
+      time.sleep(poll)
+      continue
+
+    lab_worker.post_job(session, target, ret)
+    enqueue_request (queue_outgoing, ret)
+
+
+def percentile(values, p):
+  values = sorted(values)
+  index  = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+  return values[index]
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Remote lab enqueue-to-dispatch latency benchmark')
+  parser.add_argument('--jobs', type=int, default=200, help='Number of jobs to enqueue')
+  parser.add_argument('--boards', type=int, default=4, help='Number of deployment entries')
+  parser.add_argument('--gap', type=float, default=0.005, help='Mean seconds between enqueues')
+  parser.add_argument('--legacy-poll', type=float, default=0, help='Use the old polling worker with this sleep (seconds)')
+  args = parser.parse_args()
+
+  gateway = StubGateway().start()
+
+  # two board models, spread over the deployment entries
+  deployment = {}
+  for i in range(args.boards):
+    deployment['target_' + str(i)] = {
+      'target_board': ['esp32c3', 'esp32c6'][i % 2],
+      'target_port':  '/dev/ttyUSB' + str(i),
+      'target_url':   gateway.url,
+      'status':       'free'
+    }
+
+  queue_incoming = new_queue()
+  queue_outgoing = new_queue()
+
+  for item in deployment:
+    if args.legacy_poll > 0:
+      target = legacy_worker
+      wargs  = (deployment, item, queue_incoming, queue_outgoing, None, args.legacy_poll)
+    else:
+      target = lab_worker.worker
+      wargs  = (deployment, item, queue_incoming, queue_outgoing, lambda ret: None)
+    threading.Thread(target=target, args=wargs, daemon=True).start()
+
+  # let every worker block on (or poll) its queue first
+  time.sleep(0.2)
+
+  enqueued = {}
+  for i in range(args.jobs):
+    asm = '# bench job ' + str(i) + '\n'
+    enqueued[asm] = time.perf_counter()
+    enqueue_request (queue_incoming, {'request_id': str(i), 'result_email': 'bench@localhost', 'target_board': ['esp32c3', 'esp32c6'][i % 2], 'asm_code': asm})
+    time.sleep(random.expovariate(1.0 / args.gap))
+
+  while queue_outgoing['size'] < args.jobs:
+    time.sleep(0.01)
+
+  latencies = [ (t - enqueued[req['assembly']]) * 1000.0 for t, path, req in gateway.received ]
+
+  print("Mode:     " + ("polling every " + str(args.legacy_poll) + "s" if args.legacy_poll > 0 else "event-driven"))
+  print("Jobs:     " + str(len(latencies)) + " over " + str(args.boards) + " boards")
+  print("Latency from enqueue to gateway (ms):")
+  print("  min  %8.3f" % min(latencies))
+  print("  p50  %8.3f" % percentile(latencies, 50))
+  print("  p99  %8.3f" % percentile(latencies, 99))
+  print("  max  %8.3f" % max(latencies))
+  print("  mean %8.3f" % statistics.mean(latencies))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Result e-mail delivery against stub_smtp.py: the former one-connection-per-
+# message sending compared with the pooled, batched Mailer, plus runs with
+# injected transient failures, to check that every message is retried, and
+# permanent (5xx) rejections, to check that these are dropped without retries.
+#
+# Use: python3 bench_mailer.py [--messages N] [--latency SECONDS]
+#
+
+
+import argparse, smtplib, time
+from email.message import EmailMessage
+
+from mailer import Mailer
+from stub_smtp import StubSMTP
+
+
+
+
+def make_email(i):
+  email = EmailMessage()
+  email["From"] = 'lab@localhost'
+  email["To"] = 'student' + str(i) + '@localhost'
+  email["Subject"] = "[CREATOR] Remote device results"
+  email.set_content("Remote device ID=" + str(i) + " has been successfully completed.", subtype="plain")
+  email.add_attachment(b"result\n" * 64, filename="remote_device_" + str(i) + ".txt", maintype="text", subtype="txt")
+  return email
+
+
+def run_legacy(server, messages):
+  # connect, login, send and quit for every message (as the worker used to)
+  t0 = time.perf_counter()
+  for i in range(messages):
+    email   = make_email(i)
+    smtpObj = smtplib.SMTP('127.0.0.1', server.port)
+    smtpObj.login('lab@localhost', 'secret')
+    smtpObj.sendmail('lab@localhost', email["To"], email.as_string())
+    smtpObj.quit()
+  return time.perf_counter() - t0
+
+
+def run_mailer(server, messages, backoff):
+  mailer = Mailer('lab@localhost', 'secret', host='127.0.0.1', port=server.port, use_ssl=False, backoff=backoff).start()
+
+  # what the worker pays: only the submit
+  t0 = time.perf_counter()
+  for i in range(messages):
+    mailer.submit(make_email(i))
+  submit = time.perf_counter() - t0
+
+  mailer.stop()
+  return submit, time.perf_counter() - t0, mailer
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Remote lab e-mail delivery benchmark')
+  parser.add_argument('--messages', type=int, default=100, help='Number of result e-mails')
+  parser.add_argument('--latency', type=float, default=0.002, help='Stub server seconds per message')
+  args = parser.parse_args()
+
+  server = StubSMTP(message_seconds=args.latency).start()
+  legacy = run_legacy(server, args.messages)
+  print("one connection per e-mail: %8.3f s, %d connections, %d logins" % (legacy, server.stats['connections'], server.stats['logins']))
+
+  server = StubSMTP(message_seconds=args.latency).start()
+  submit, total, mailer = run_mailer(server, args.messages, 0.1)
+  print("pooled mailer:             %8.3f s, %d connections, %d logins (workers blocked %.4f s)" % (total, server.stats['connections'], server.stats['logins'], submit))
+
+  server = StubSMTP(message_seconds=args.latency).start()
+  server.fail_next = 3
+  submit, total, mailer = run_mailer(server, args.messages, 0.1)
+  print("with 3 transient failures: %8.3f s, %d connections, %d/%d delivered, %d failed" % (total, server.stats['connections'], len(server.messages), args.messages, mailer.failed))
+
+  if len(server.messages) != args.messages:
+    return 1
+
+  server = StubSMTP(message_seconds=args.latency).start()
+  server.reject_next = 3
+  submit, total, mailer = run_mailer(server, args.messages, 1.0)
+  print("with 3 permanent failures: %8.3f s, %d connections, %d/%d delivered, %d failed" % (total, server.stats['connections'], len(server.messages), args.messages, mailer.failed))
+
+  # dropped at once: no back-off sleep
+  if len(server.messages) != args.messages - 3 or mailer.failed != 3 or total >= 1.0:
+    return 1
+  return 0
+
+
+if __name__ == "__main__":
+  exit(main())
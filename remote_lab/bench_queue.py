@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Micro-benchmark of the remote lab queues: the indexed per-board queues in
+# job_queue.py against the former list-based queue functions.
+#
+# Use: python3 bench_queue.py [--jobs N] [--polls N]
+#
+
+
+import argparse, random, threading, time
+
+import job_queue
+
+
+
+
+## Former list-based queue ##
+
+def list_new_queue ():
+  return {'queue': [], 'lock': threading.Lock(), 'size': 0}
+
+def list_enqueue_request (queue, request):
+  with queue['lock']:
+    queue['queue'].append(request)
+    queue['size'] = queue['size'] + 1
+  return request['request_id']
+
+def list_dequeue_request (queue, target_board):
+  with queue['lock']:
+    for index, item in enumerate(queue['queue']):
+      if item['target_board'] == target_board:
+        del queue['queue'][index]
+        queue['size'] = queue['size'] - 1
+        return item
+  return None
+
+def list_delete_request (queue, request_id):
+  with queue['lock']:
+    for index, item in enumerate(queue['queue']):
+      if item['request_id'] == request_id:
+        del queue['queue'][index]
+        return 0
+  return -1
+
+def list_position_request (queue, request_id):
+  for index, item in enumerate(queue['queue']):
+    if item['request_id'] == request_id:
+      return index + 1
+  return -1
+
+
+implementations = {
+  'list':    (list_new_queue, list_enqueue_request, list_dequeue_request, list_delete_request, list_position_request),
+  'indexed': (job_queue.new_queue, job_queue.enqueue_request, job_queue.dequeue_request, job_queue.delete_request, job_queue.position_request),
+}
+
+
+
+
+def run(impl, jobs, polls, boards, seed):
+  new_queue, enqueue, dequeue, delete, position = implementations[impl]
+  rnd     = random.Random(seed)
+  queue   = new_queue()
+  ids     = [str(i) for i in range(jobs)]
+  timings = {}
+
+  t0 = time.perf_counter()
+  for i in ids:
+    enqueue(queue, {'request_id': i, 'result_email': 'user' + i + '@localhost', 'target_board': boards[int(i) % len(boards)], 'asm_code': ''})
+  timings['enqueue'] = time.perf_counter() - t0
+
+  # students polling /position (and /status for still-queued jobs)
+  t0 = time.perf_counter()
+  for _ in range(polls):
+    position(queue, rnd.choice(ids))
+  timings['position'] = time.perf_counter() - t0
+
+  # a tenth of the jobs are cancelled
+  cancelled = rnd.sample(ids, jobs // 10)
+  t0 = time.perf_counter()
+  for i in cancelled:
+    delete(queue, i)
+  timings['cancel'] = time.perf_counter() - t0
+
+  # workers drain the queues, last board first (worst case for the list)
+  t0 = time.perf_counter()
+  for board in reversed(boards):
+    while dequeue(queue, board) != None:
+      pass
+  timings['dequeue'] = time.perf_counter() - t0
+
+  return timings
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Remote lab queue micro-benchmark')
+  parser.add_argument('--jobs', type=int, default=2000, help='Number of queued jobs')
+  parser.add_argument('--polls', type=int, default=20000, help='Number of /position lookups')
+  parser.add_argument('--boards', type=int, default=4, help='Number of target boards')
+  parser.add_argument('--seed', type=int, default=1, help='Random seed')
+  args = parser.parse_args()
+
+  boards  = ['board_' + str(i) for i in range(args.boards)]
+  results = {impl: run(impl, args.jobs, args.polls, boards, args.seed) for impl in implementations}
+
+  print("%d jobs, %d polls, %d boards (seconds)" % (args.jobs, args.polls, args.boards))
+  print("%-10s %12s %12s %9s" % ("operation", "list", "indexed", "speedup"))
+  for op in results['list']:
+    old, new = results['list'][op], results['indexed'][op]
+    print("%-10s %12.6f %12.6f %8.1fx" % (op, old, new, old / new if new > 0 else float('inf')))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Job store benchmark: /enqueue-style durable inserts from concurrent
+# threads with group commit (JobStore) against one commit per insert, and
+# the time needed to rebuild the queues from a large store at start-up.
+#
+# Use: python3 bench_store.py [--threads N] [--jobs N] [--rows N]
+#
+
+
+import argparse, os, sqlite3, tempfile, threading, time
+
+from job_store import JobStore
+
+
+
+
+def job(request_id):
+  return { "request_id": str(request_id), "result_email": 'user@localhost', "target_board": 'esp32c3', "asm_code": '.text\nmain:\n  li a0, 1\n' }
+
+
+def run_threads(threads, jobs, insert):
+  def client(first):
+    for i in range(first, first + jobs):
+      insert(job(i))
+
+  t0 = time.perf_counter()
+  pool = [threading.Thread(target=client, args=(n * jobs,)) for n in range(threads)]
+  for t in pool:
+    t.start()
+  for t in pool:
+    t.join()
+  return time.perf_counter() - t0
+
+
+def bench_group_commit(path, threads, jobs):
+  store = JobStore(path)
+  return run_threads(threads, jobs, store.add)
+
+
+def bench_commit_each(path, threads, jobs):
+  # same schema and pragmas, but every insert is its own transaction
+  JobStore(path)
+  conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+  conn.execute("PRAGMA synchronous=FULL")
+  lock = threading.Lock()
+
+  def insert(request):
+    with lock:
+      conn.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, 'Queued', NULL, ?, ?)",
+                   (int(request['request_id']), request['result_email'], request['target_board'], request['asm_code'], time.time(), time.time()))
+
+  return run_threads(threads, jobs, insert)
+
+
+def bench_restart(path, rows):
+  store = JobStore(path)
+  for i in range(rows):
+    store.write("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, NULL, 0, 0)",
+                (i, 'user@localhost', 'esp32c3', '.text\n', JobStore.EXPIRED if i % 10 else JobStore.QUEUED))
+  store.flush()
+
+  t0 = time.perf_counter()
+  store    = JobStore(path)
+  incoming, outgoing = store.load()
+  return time.perf_counter() - t0, len(incoming), store.next_id
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Remote lab job store benchmark')
+  parser.add_argument('--threads', type=int, default=16, help='Concurrent /enqueue clients')
+  parser.add_argument('--jobs', type=int, default=200, help='Jobs per client')
+  parser.add_argument('--rows', type=int, default=100000, help='Jobs in the store for the restart test')
+  args = parser.parse_args()
+
+  tmp   = tempfile.mkdtemp()
+  total = args.threads * args.jobs
+
+  seconds = bench_commit_each(os.path.join(tmp, 'each.db'), args.threads, args.jobs)
+  print("commit per insert: %8.3f s  %10.0f jobs/s" % (seconds, total / seconds))
+
+  seconds = bench_group_commit(os.path.join(tmp, 'group.db'), args.threads, args.jobs)
+  print("group commit:      %8.3f s  %10.0f jobs/s" % (seconds, total / seconds))
+
+  seconds, queued, next_id = bench_restart(os.path.join(tmp, 'restart.db'), args.rows)
+  print("restart with %d jobs: %.3f s (%d queued again, next id %d)" % (args.rows, seconds, queued, next_id))
+
+
+if __name__ == "__main__":
+  main()
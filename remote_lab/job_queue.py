@@ -0,0 +1,355 @@
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+import threading, time
+from itertools import islice
+from collections import OrderedDict
+
+from scheduler import FifoPolicy
+
+
+
+
+## Change notification ##
+
+# Every change of a queue bumps 'version' and wakes whoever waits in
+# wait_change() (long-poll and event stream clients). Several queues can
+# share one changes object, so a job moving between them is one stream
+def new_changes ():
+  return {'cond': threading.Condition(), 'version': 0}
+
+def notify_change (changes):
+  with changes['cond']:
+    changes['version'] = changes['version'] + 1
+    changes['cond'].notify_all()
+
+def change_version (changes):
+  with changes['cond']:
+    return changes['version']
+
+def wait_change (changes, version, timeout):
+  # Block until something changed after version (or timeout expires)
+  with changes['cond']:
+    changes['cond'].wait_for(lambda: changes['version'] != version, timeout)
+    return changes['version']
+
+
+
+
+## Queues ##
+
+# Queue variables
+def new_queue (changes=None, policy=None):
+  # 'boards' keeps, per target board, the queued jobs in arrival order
+  # (request_id -> request) plus the state of the scheduling 'policy' that
+  # picks the next one (FIFO by default), and 'index' maps request_id ->
+  # board, so lookup, dequeue and cancel never scan the queue.
+  # 'users' counts the queued jobs of each result_email (quotas).
+  # 'ready' holds one condition per target board, all of them sharing the
+  # queue lock, so an enqueue only wakes workers waiting for that board.
+  # 'running' keeps the requests taken by a worker until finish_request().
+  # 'added' counts every enqueue and 'rate' the enqueues of each of the
+  # last 60 minutes ([minute, count] ring), for queue_stats()
+  if changes == None:
+    changes = new_changes()
+  if policy == None:
+    policy = FifoPolicy()
+
+  return {'boards': {}, 'index': {}, 'lock': threading.Lock(), 'size': 0, 'ready': {}, 'running': {}, 'changes': changes,
+          'added': 0, 'rate': [[0, 0] for minute in range(60)], 'policy': policy, 'users': {}}
+
+def board_condition (queue, target_board):
+  # must be called with queue['lock'] held
+  cond = queue['ready'].get(target_board)
+  if cond == None:
+    cond = threading.Condition(queue['lock'])
+    queue['ready'][target_board] = cond
+
+  return cond
+
+def board_queue (queue, target_board):
+  # must be called with queue['lock'] held
+  board = queue['boards'].get(target_board)
+  if board == None:
+    board = {'jobs': OrderedDict(), 'sched': queue['policy'].new_state()}
+    queue['boards'][target_board] = board
+
+  return board
+
+def remove_request (queue, request_id, taken=False):
+  # must be called with queue['lock'] held; taken when the policy already
+  # dropped the request (take_request)
+  target_board = queue['index'].pop(request_id, None)
+  if target_board == None:
+    return None
+
+  board   = queue['boards'][target_board]
+  request = board['jobs'].pop(request_id)
+  queue['size'] = queue['size'] - 1
+  if not taken:
+    queue['policy'].remove(board['sched'], request)
+
+  user = request.get('result_email')
+  queue['users'][user] = queue['users'][user] - 1
+  if queue['users'][user] == 0:
+    del queue['users'][user]
+
+  notify_change(queue['changes'])
+
+  return request
+
+
+# Queue functions
+def enqueue_request (queue, request, restore=False, max_user=0):
+  # restore: a job counted already (reloaded from the job store at start-up,
+  # or given back by a worker), left out of the throughput ('added', 'rate').
+  # max_user: the quota of queued jobs per result_email (0: no limit), checked
+  # under the same lock hold as the insert; -3 when it is full
+  queue['lock'].acquire()
+
+  if max_user > 0 and queue['users'].get(request.get('result_email'), 0) >= max_user:
+    queue['lock'].release()
+    return -3
+
+  board = board_queue(queue, request['target_board'])
+  board['jobs'][request['request_id']] = request
+  queue['index'][request['request_id']] = request['target_board']
+  queue['size'] = queue['size'] + 1
+  queue['users'][request.get('result_email')] = queue['users'].get(request.get('result_email'), 0) + 1
+  request.setdefault('enqueued', time.time())
+  queue['policy'].add(board['sched'], request)
+
+  if not restore:
+    minute = int(time.time() // 60)
+    bucket = queue['rate'][minute % 60]
+    if bucket[0] != minute:
+      bucket[0], bucket[1] = minute, 0
+    bucket[1] = bucket[1] + 1
+    queue['added'] = queue['added'] + 1
+
+  # wake up one free worker of this board (if any is waiting)
+  board_condition(queue, request['target_board']).notify()
+  notify_change(queue['changes'])
+
+  queue['lock'].release()
+
+  return request['request_id']
+
+def take_request (queue, target_board):
+  # must be called with queue['lock'] held
+  board = queue['boards'].get(target_board)
+  if board == None or len(board['jobs']) == 0:
+    return None
+
+  request_id = queue['policy'].take(board['sched'])
+  queue['running'][request_id] = board['jobs'][request_id]
+
+  return remove_request(queue, request_id, taken=True)
+
+def dequeue_request (queue, target_board):
+  queue['lock'].acquire()
+
+  request = take_request(queue, target_board)
+
+  queue['lock'].release()
+
+  return request
+
+def wait_request (queue, target_board, timeout=None):
+  # Block until a request for target_board is enqueued (or timeout expires)
+  queue['lock'].acquire()
+
+  request = take_request(queue, target_board)
+  if request == None:
+    board_condition(queue, target_board).wait(timeout)
+    request = take_request(queue, target_board)
+
+  queue['lock'].release()
+
+  return request
+
+def dequeue_request_byid (queue, request_id):
+  queue['lock'].acquire()
+
+  request = remove_request(queue, request_id)
+
+  queue['lock'].release()
+
+  return request
+
+def delete_request (queue, request_id):
+  queue['lock'].acquire()
+
+  request = remove_request(queue, request_id)
+
+  queue['lock'].release()
+
+  if request == None:
+    return -1
+
+  return 0
+
+def position_request (queue, request_id):
+  # position among the requests queued for the same target board, in the
+  # order the scheduling policy would dispatch them
+  queue['lock'].acquire()
+
+  position = -1
+  target_board = queue['index'].get(request_id)
+  if target_board != None:
+    board    = queue['boards'][target_board]
+    position = queue['policy'].position(board['sched'], board['jobs'][request_id])
+
+  queue['lock'].release()
+
+  return position
+
+def finish_request (queue, request_id):
+  # the worker is done with a request taken from this queue
+  queue['lock'].acquire()
+
+  request = queue['running'].pop(request_id, None)
+  notify_change(queue['changes'])
+
+  queue['lock'].release()
+
+  return request
+
+def user_requests (queue, user):
+  # number of requests of this result_email in the queue (O(1))
+  queue['lock'].acquire()
+
+  count = queue['users'].get(user, 0)
+
+  queue['lock'].release()
+
+  return count
+
+def running_request (queue, request_id):
+  queue['lock'].acquire()
+
+  request = queue['running'].get(request_id)
+
+  queue['lock'].release()
+
+  return request
+
+def peek_request (queue, request_id):
+  # lookup without removing the request from the queue
+  queue['lock'].acquire()
+
+  request = None
+  target_board = queue['index'].get(request_id)
+  if target_board != None:
+    request = queue['boards'][target_board]['jobs'][request_id]
+
+  queue['lock'].release()
+
+  return request
+
+def expire_requests (queue, max_age):
+  # Remove the requests 'completed' more than max_age seconds ago; each board
+  # FIFO is in completion order, so only the expired heads are visited
+  expired = []
+  limit   = time.time() - max_age
+
+  queue['lock'].acquire()
+
+  for board in queue['boards'].values():
+    while len(board['jobs']) > 0:
+      request = next(iter(board['jobs'].values()))
+      if request.get('completed', 0) > limit:
+        break
+      expired.append(remove_request(queue, request['request_id']))
+
+  queue['lock'].release()
+
+  return expired
+
+
+
+
+## Status ##
+
+def queue_stats (queue):
+  # Incrementally kept counters only: O(boards), whatever the queue length
+  now    = time.time()
+  minute = int(now // 60)
+
+  queue['lock'].acquire()
+
+  boards = {}
+  for target_board, board in queue['boards'].items():
+    oldest = 0
+    if len(board['jobs']) > 0:
+      oldest = now - next(iter(board['jobs'].values()))['enqueued']
+    boards[target_board] = {'queued': len(board['jobs']), 'running': 0, 'oldest_age': round(oldest, 3)}
+
+  for request in queue['running'].values():
+    boards.setdefault(request['target_board'], {'queued': 0, 'running': 0, 'oldest_age': 0})['running'] += 1
+
+  stats = {
+    'size':        queue['size'],
+    'running':     len(queue['running']),
+    'added':       queue['added'],
+    'last_minute': sum(count for m, count in queue['rate'] if m == minute - 1),
+    'last_hour':   sum(count for m, count in queue['rate'] if minute - m < 60),
+    'boards':      boards
+  }
+
+  queue['lock'].release()
+
+  return stats
+
+def list_requests (queue, target_board=None, offset=0, limit=50, fields=('request_id', 'target_board', 'status', 'enqueued', 'completed')):
+  # One page of the queue (per board in arrival order, boards sorted by
+  # name), copying only the given fields so no assembly or results are
+  # serialised; 'position' is the dispatch order of the policy
+  jobs = []
+
+  queue['lock'].acquire()
+
+  if target_board == None:
+    boards = sorted(queue['boards'])
+  else:
+    boards = [target_board] if target_board in queue['boards'] else []
+
+  skip = offset
+  for name in boards:
+    board = queue['boards'][name]
+    if skip >= len(board['jobs']):
+      skip = skip - len(board['jobs'])
+      continue
+
+    for request in islice(board['jobs'].values(), skip, None):
+      if len(jobs) == limit:
+        break
+      job = {key: request[key] for key in fields if key in request}
+      job['position'] = queue['policy'].position(board['sched'], request)
+      jobs.append(job)
+
+    skip = 0
+    if len(jobs) == limit:
+      break
+
+  queue['lock'].release()
+
+  return jobs
@@ -0,0 +1,181 @@
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+import sqlite3, threading, time
+
+
+
+
+## Job store ##
+
+class JobStore:
+  """Crash-safe record of every remote lab job, kept in SQLite (WAL mode).
+
+  Writes are queued and a single writer thread commits everything queued so
+  far in one transaction (group commit): callers that need the job to be on
+  disk before answering (/enqueue) wait for the commit that includes their
+  write, while concurrent callers share that commit. If the transaction
+  fails, the batch is written again statement by statement, so one bad
+  write never loses the others; a waiting caller gets its own error raised.
+  Rows of expired and cancelled jobs are deleted.
+  """
+
+  # job states
+  QUEUED    = 'Queued'
+  RUNNING   = 'Running'
+  COMPLETED = 'Completed'
+  CANCELLED = 'Cancelled'
+  EXPIRED   = 'Expired'
+  ERROR     = 'Error'
+
+  def __init__(self, path='remote_lab.db'):
+    self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    self.conn.execute("PRAGMA journal_mode=WAL")
+    self.conn.execute("PRAGMA synchronous=FULL")
+    self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                           request_id   INTEGER PRIMARY KEY,
+                           result_email TEXT,
+                           target_board TEXT,
+                           asm_code     TEXT,
+                           status       TEXT,
+                           result       TEXT,
+                           enqueued     REAL,
+                           updated      REAL)""")
+    self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    row = self.conn.execute("SELECT MAX(request_id) FROM jobs").fetchone()
+    self.next_id = 0 if row[0] == None else row[0] + 1
+
+    self.cond      = threading.Condition()
+    self.pending   = []
+    self.submitted = 0
+    self.committed = 0
+    self.errors    = {}
+    self.thread    = threading.Thread(target=self.run, name='JobStore', daemon=True)
+    self.thread.start()
+
+  def new_request_id(self):
+    # ids are never reused, not even across restarts
+    with self.cond:
+      request_id   = self.next_id
+      self.next_id = self.next_id + 1
+    return str(request_id)
+
+  def load(self):
+    # Rebuild the queues in a single pass: jobs that were running when the
+    # service stopped are queued again, completed ones are kept until expired
+    incoming = []
+    outgoing = []
+
+    cursor = self.conn.execute("SELECT request_id, result_email, target_board, asm_code, status, result, enqueued, updated FROM jobs "
+                               "WHERE status IN (?, ?, ?, ?) ORDER BY request_id",
+                               (self.QUEUED, self.RUNNING, self.COMPLETED, self.ERROR))
+    for request_id, result_email, target_board, asm_code, status, result, enqueued, updated in cursor:
+      job = { "request_id": str(request_id), "result_email": result_email, "target_board": target_board, "asm_code": asm_code, "enqueued": enqueued }
+      if status in (self.COMPLETED, self.ERROR):
+        job['status'] = status
+        job['result'] = result
+        job['completed'] = updated
+        outgoing.append(job)
+      else:
+        incoming.append(job)
+
+    # expire_requests() expects completion order
+    outgoing.sort(key=lambda job: job['completed'])
+
+    return incoming, outgoing
+
+  def add(self, request):
+    now = time.time()
+    self.write("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, NULL, ?, ?)",
+               (int(request['request_id']), request['result_email'], request['target_board'], request['asm_code'], self.QUEUED, now, now),
+               wait=True)
+
+  def set_status(self, request_id, status):
+    self.write("UPDATE jobs SET status = ?, updated = ? WHERE request_id = ?", (status, time.time(), int(request_id)))
+
+  def complete(self, request_id, result, status=COMPLETED):
+    self.write("UPDATE jobs SET status = ?, result = ?, updated = ? WHERE request_id = ?", (status, result, time.time(), int(request_id)))
+
+  def remove(self, request_id, status):
+    # a job nobody can ask about any more (expired, cancelled): its row is
+    # deleted, but for the highest id, only marked with status, which
+    # new_request_id() after a restart must not reuse
+    self.write("DELETE FROM jobs WHERE request_id = ? AND request_id < (SELECT MAX(request_id) FROM jobs)", (int(request_id),))
+    self.set_status(request_id, status)
+
+  def write(self, sql, params, wait=False):
+    with self.cond:
+      self.submitted = self.submitted + 1
+      ticket = self.submitted
+      self.pending.append((ticket, sql, params, wait))
+      self.cond.notify_all()
+
+      if wait:
+        while self.committed < ticket:
+          self.cond.wait()
+        if ticket in self.errors:
+          raise self.errors.pop(ticket)
+
+  def flush(self):
+    with self.cond:
+      ticket = self.submitted
+      while self.committed < ticket:
+        self.cond.wait()
+
+  def run(self):
+    while 1:
+      with self.cond:
+        while len(self.pending) == 0:
+          self.cond.wait()
+        batch, self.pending = self.pending, []
+        ticket = self.submitted
+
+      # one transaction (and one fsync) for the whole batch
+      errors = {}
+      try:
+        self.conn.execute("BEGIN")
+        for number, sql, params, wait in batch:
+          self.conn.execute(sql, params)
+        self.conn.execute("COMMIT")
+      except sqlite3.Error as e:
+        print("Error writing job store: " + str(e) + ", writing the " + str(len(batch)) + " statements one by one")
+        if self.conn.in_transaction:
+          self.conn.execute("ROLLBACK")
+        errors = self.write_each(batch)
+
+      with self.cond:
+        self.errors.update(errors)
+        self.committed = ticket
+        self.cond.notify_all()
+
+  def write_each(self, batch):
+    # each statement in its own transaction: errors of the waiting writers
+    errors = {}
+    for number, sql, params, wait in batch:
+      try:
+        self.conn.execute(sql, params)
+      except sqlite3.Error as e:
+        print("Error writing job store: " + str(e) + " (" + sql.split(' ')[0] + " " + str(params) + ")")
+        if wait:
+          errors[number] = e
+
+    return errors
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Load test for the remote lab HTTP front end. Every client enqueues a job
+# and then polls /position and /status until it completes, as the web UI
+# does; the latency of each endpoint is reported as p50/p99.
+#
+# With --streams N, N more students follow their job over /events as the web
+# UI does, each holding a server thread while the stream is open. Streams
+# beyond --max-streams of the lab are refused (503) and these students poll
+# /status instead; the polling clients show whether the short requests still
+# get a thread.
+#
+# Without --lab-url, a stub gateway and a remote_lab.py (--no-email) are
+# started in a temporary directory.
+#
+# Use: python3 load_test.py [--clients N] [--streams N] [--server waitress|flask] [--lab-url URL]
+#
+
+
+import argparse, json, os, socket, statistics, subprocess, sys, tempfile, threading, time
+import requests
+
+from stub_gateway import StubGateway
+
+
+
+
+def percentile(values, p):
+  values = sorted(values)
+  index  = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+  return values[index]
+
+
+def free_port():
+  s = socket.socket()
+  s.bind(('127.0.0.1', 0))
+  port = s.getsockname()[1]
+  s.close()
+  return port
+
+
+def start_lab(args, gateway):
+  tmp = tempfile.mkdtemp()
+  deployment = {}
+  for i in range(args.boards):
+    deployment['target_' + str(i)] = {'target_board': 'esp32c3', 'target_port': '/dev/ttyUSB' + str(i), 'target_url': gateway.url}
+  with open(os.path.join(tmp, 'deployment.json'), 'w') as f:
+    json.dump(deployment, f)
+
+  port = free_port()
+  script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'remote_lab.py')
+  command = [sys.executable, script, 'deployment.json', str(port), '--no-email', '--server', args.server, '--threads', str(args.threads)]
+  if args.max_streams > 0:
+    command += ['--max-streams', str(args.max_streams)]
+  proc = subprocess.Popen(command, cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+  url = 'http://127.0.0.1:' + str(port)
+  for _ in range(100):
+    try:
+      requests.get(url + '/target_boards', timeout=1)
+      return proc, url
+    except requests.RequestException:
+      time.sleep(0.1)
+
+  proc.kill()
+  raise RuntimeError("remote_lab.py did not start")
+
+
+def client(url, n, poll, latencies, lock, stream=False, refused=None):
+  session = requests.Session()
+
+  def call(endpoint, body):
+    t0  = time.perf_counter()
+    res = session.post(url + endpoint, json=body, timeout=30)
+    elapsed = (time.perf_counter() - t0) * 1000.0
+    with lock:
+      latencies[endpoint].append(elapsed)
+    return res.json()['status']
+
+  req_id = call('/enqueue', {'target_board': 'esp32c3', 'result_email': 'student' + str(n) + '@localhost', 'assembly': '# load test ' + str(n) + '\n'})
+
+  if stream:
+    t0  = time.perf_counter()
+    res = session.get(url + '/events/' + str(req_id), stream=True, timeout=30)
+    elapsed = (time.perf_counter() - t0) * 1000.0
+    with lock:
+      latencies['/events'].append(elapsed)
+
+    if res.status_code == 200:
+      for line in res.iter_lines(decode_unicode=True):
+        if line.startswith('data: ') and json.loads(line[6:]) in ('Completed', 'Error', -1):
+          break
+      res.close()
+      return
+
+    # refused: poll as the web UI does
+    res.close()
+    with lock:
+      refused.append(n)
+
+  while 1:
+    call('/position', {'req_id': req_id})
+    if call('/status', {'req_id': req_id}) in ('Completed', 'Error'):
+      return
+    time.sleep(poll)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Remote lab HTTP load test')
+  parser.add_argument('--clients', type=int, default=200, help='Concurrent students')
+  parser.add_argument('--boards', type=int, default=4, help='Boards in the generated deployment')
+  parser.add_argument('--job-seconds', type=float, default=0.05, help='Stub gateway seconds per job')
+  parser.add_argument('--poll', type=float, default=0.05, help='Seconds between polls of each client')
+  parser.add_argument('--streams', type=int, default=0, help='Students following their job over /events')
+  parser.add_argument('--server', choices=['waitress', 'flask'], default='waitress', help='Server mode of the spawned remote lab')
+  parser.add_argument('--threads', type=int, default=128, help='HTTP worker threads of the spawned remote lab')
+  parser.add_argument('--max-streams', type=int, default=0, help='Stream cap of the spawned remote lab (default: its own)')
+  parser.add_argument('--lab-url', default='', help='Test an already running remote lab instead')
+  args = parser.parse_args()
+
+  proc = None
+  url  = args.lab_url
+  if url == '':
+    gateway   = StubGateway(job_seconds=args.job_seconds).start()
+    proc, url = start_lab(args, gateway)
+
+  latencies = {'/enqueue': [], '/position': [], '/status': [], '/events': []}
+  refused   = []
+  lock      = threading.Lock()
+  try:
+    t0 = time.perf_counter()
+    threads  = [threading.Thread(target=client, args=(url, n, args.poll, latencies, lock, True, refused)) for n in range(args.streams)]
+    threads += [threading.Thread(target=client, args=(url, n, args.poll, latencies, lock)) for n in range(args.streams, args.streams + args.clients)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    elapsed = time.perf_counter() - t0
+  finally:
+    if proc != None:
+      proc.terminate()
+      proc.wait()
+
+  total = sum(len(v) for v in latencies.values())
+  print("%d clients, %d requests in %.2f s (%.0f req/s)" % (args.clients, total, elapsed, total / elapsed))
+  if args.streams > 0:
+    print("%d streams, %d refused (503)" % (args.streams, len(refused)))
+  print("%-10s %8s %9s %9s %9s" % ("endpoint", "requests", "p50 ms", "p99 ms", "max ms"))
+  for endpoint, values in latencies.items():
+    if len(values) == 0:
+      continue
+    print("%-10s %8d %9.2f %9.2f %9.2f" % (endpoint, len(values), statistics.median(values), percentile(values, 99), max(values)))
+
+
+if __name__ == "__main__":
+  main()
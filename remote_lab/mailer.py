@@ -0,0 +1,156 @@
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+import queue, smtplib, threading, time
+
+
+
+
+## Mail delivery ##
+
+def permanent_error(error):
+  # a 5xx reply: the server will not take this message, retrying will not
+  # help (refused recipients are, if every one of them got a 5xx)
+  if isinstance(error, smtplib.SMTPRecipientsRefused):
+    return len(error.recipients) > 0 and all(code >= 500 for code, message in error.recipients.values())
+  return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+class Mailer:
+  """Delivery stage for the result e-mails.
+
+  Workers only submit() messages; a single thread sends them in batches over
+  one authenticated SMTP connection, which is reused until it has been idle
+  for idle_timeout seconds. Failed deliveries are retried with exponential
+  back-off, so a slow or flaky mail server never holds a board; messages
+  refused with a 5xx reply are dropped at once.
+  """
+
+  def __init__(self, sender, password, host='smtp.gmail.com', port=465, use_ssl=True,
+               batch_size=20, max_retries=5, backoff=1.0, idle_timeout=60):
+    self.sender       = sender
+    self.password     = password
+    self.host         = host
+    self.port         = port
+    self.use_ssl      = use_ssl
+    self.batch_size   = batch_size
+    self.max_retries  = max_retries
+    self.backoff      = backoff
+    self.idle_timeout = idle_timeout
+
+    self.pending = queue.Queue()
+    self.smtp    = None
+    self.sent    = 0
+    self.failed  = 0
+    self.thread  = threading.Thread(target=self.run, name='Mailer', daemon=True)
+
+  def start(self):
+    self.thread.start()
+    return self
+
+  def stop(self):
+    # deliver what is already queued, then close the connection
+    self.pending.put(None)
+    self.thread.join()
+
+  def submit(self, email):
+    self.pending.put(email)
+
+  def connect(self):
+    if self.use_ssl:
+      self.smtp = smtplib.SMTP_SSL(self.host, self.port)
+    else:
+      self.smtp = smtplib.SMTP(self.host, self.port)
+
+    if self.password:
+      try:
+        self.smtp.login(self.sender, self.password)
+      except (smtplib.SMTPException, OSError):
+        self.close()
+        raise
+
+  def close(self):
+    if self.smtp == None:
+      return
+
+    try:
+      self.smtp.quit()
+    except (smtplib.SMTPException, OSError):
+      pass
+    self.smtp = None
+
+  def run(self):
+    while 1:
+      try:
+        email = self.pending.get(timeout=self.idle_timeout)
+      except queue.Empty:
+        self.close()
+        continue
+
+      # take whatever else is already waiting, up to batch_size
+      batch = []
+      while email != None:
+        batch.append(email)
+        if len(batch) == self.batch_size:
+          break
+        try:
+          email = self.pending.get_nowait()
+        except queue.Empty:
+          break
+
+      if len(batch) > 0:
+        self.deliver(batch)
+
+      if email == None:
+        self.close()
+        return
+
+  def deliver(self, batch):
+    delay = self.backoff
+
+    for attempt in range(self.max_retries + 1):
+      while len(batch) > 0:
+        try:
+          if self.smtp == None:
+            self.connect()
+          self.smtp.send_message(batch[0])
+          self.sent = self.sent + 1
+
+        except (smtplib.SMTPException, OSError) as e:
+          if not permanent_error(e):
+            # drop the connection and retry the rest of the batch later
+            print("Error sending e-mail (attempt " + str(attempt + 1) + "): " + str(e))
+            self.close()
+            break
+
+          # permanent: retrying will not help
+          print("Error sending e-mail to " + str(batch[0]["To"]) + ": " + str(e))
+          self.failed = self.failed + 1
+
+        del batch[0]
+
+      if len(batch) == 0:
+        return
+
+      time.sleep(delay)
+      delay = delay * 2
+
+    print("Giving up on " + str(len(batch)) + " e-mail(s)")
+    self.failed = self.failed + len(batch)
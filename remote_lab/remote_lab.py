@@ -25,147 +25,77 @@ from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS, cross_origin
 from getpass import getpass
 from email.message import EmailMessage
-import subprocess, os, signal, sys, json, threading, time, requests, smtplib
+import subprocess, os, signal, sys, json, threading, time, argparse
 
+from job_queue import new_queue, new_changes, change_version, wait_change, enqueue_request, delete_request, position_request, running_request, peek_request, expire_requests, queue_stats, list_requests, user_requests
+from scheduler import POLICIES, new_policy
+from worker import worker, pool_manager, POOL_INTERVAL
+from mailer import Mailer
+from job_store import JobStore
 
 
 
-## Queues ##
 
-# Queue variables
-queue_incoming = {'queue': [], 'lock': None, 'size': 0}
-queue_outgoing = {'queue': [], 'lock': None, 'size': 0}
+## Job state ##
 
+# final states reported by /status
+FINAL_STATES = ('Completed', 'Error')
 
-# Queue functions
-def enqueue_request (queue, request):
-  global request_id
+def job_state(req_id):
+  # Checked in the order a job moves (queued, running, completed), so a job
+  # moving meanwhile is never missed: queue position, 'Running' (with the
+  # gateway stage once known) or the final status; -1 when unknown or expired
+  position = position_request (queue_incoming, req_id)
+  if position != -1:
+    return position
 
-  queue['lock'].acquire()
+  running = running_request (queue_incoming, req_id)
+  if running != None:
+    if 'stage' in running:
+      return 'Running (' + running['stage'] + ')'
+    return 'Running'
 
-  queue['queue'].append(request)
-  queue['size'] = queue['size'] + 1
-
-  queue['lock'].release()
-
-  return request_id
-
-def dequeue_request (queue, target_board):
-  request = None
-
-  queue['lock'].acquire()
-
-  for index, item in enumerate(queue['queue']):
-    if item['target_board'] == target_board:
-
-      request = queue['queue'][index]
-      del queue['queue'][index]
-      queue['size'] = queue['size'] - 1
-
-      queue['lock'].release()
-      return request
-
-  queue['lock'].release()
-
-  return request
-
-def dequeue_request_byid (queue, request_id):
-  request = None
-
-  queue['lock'].acquire()
-
-  for index, item in enumerate(queue['queue']):
-    if item['request_id'] == request_id:
-
-      request = queue['queue'][index]
-      del queue['queue'][index]
-      queue['size'] = queue['size'] - 1
-
-      queue['lock'].release()
-      return request
-
-  queue['lock'].release()
-
-  return request
-
-def delete_request (queue, request_id):
-  queue['lock'].acquire()
-
-  for index, item in enumerate(queue['queue']):
-    if item['request_id'] == request_id:
-
-      del queue['queue'][index]
-
-      queue['lock'].release()
-      return 0
-
-  queue['lock'].release()
+  ret = peek_request (queue_outgoing, req_id)
+  if ret != None:
+    return ret['status']
 
   return -1
 
-def position_request (queue, request_id):
-  for index, item in enumerate(queue['queue']):
-    if item['request_id'] == request_id:
-      return index + 1
-
-  return -1
-
-
-
-
-## Thread ##
-
-def worker(item):
-  global deployment, queue_incoming, queue_outgoing
-
+def expire_results():
+  # completed results stay readable through /status for result_ttl seconds
   while 1:
+    time.sleep(60)
+    for ret in expire_requests (queue_outgoing, args.result_ttl):
+      store.remove(ret['request_id'], store.EXPIRED)
 
-    ret = dequeue_request (queue_incoming, deployment[item]['target_board'])
-
-    if ret == None:
-      time.sleep(20)
-    else:
-      deployment[item]['status'] = 'busy'
 
-      # Sent to the target post
-      url = deployment[item]['target_url']  + "/job"
-      msg = {'target_port': deployment[item]['target_port'], 'target_board': ret['target_board'], 'assembly': ret['asm_code']}
 
-      res = requests.post(url, json = msg)
-      jres = res.json()
 
-      file = open("results/" + ret['request_id'] + ".txt", "w")
-      file.write(jres['status'])
-      file.close()
+## Results ##
 
-      # Sent email with the results
-      receivers = ret['result_email']
+def send_results(ret):
+  # Queue an email with the results
+  receivers = ret['result_email']
 
-      email = EmailMessage()
-      email["From"] = sender
-      email["To"] = receivers
-      email["Subject"] = "[CREATOR] Remote device results"
-      message = "Remote device ID=" + ret['request_id'] + " has been successfully completed, the execution results are attached. \n\nSincerely,\nCREATOR Team\n\nhttps://creatorsim.github.io/"
-      email.set_content(message, subtype="plain")
+  email = EmailMessage()
+  email["From"] = sender
+  email["To"] = receivers
+  email["Subject"] = "[CREATOR] Remote device results"
+  if ret.get('status') == 'Completed':
+    outcome = " has been successfully completed, the execution results are attached."
+  else:
+    outcome = " could not be completed (" + str(ret.get('status')) + "), the error details are attached."
+  message = "Remote device ID=" + ret['request_id'] + outcome + " \n\nSincerely,\nCREATOR Team\n\nhttps://creatorsim.github.io/"
+  email.set_content(message, subtype="plain")
 
-      with open("results/" + ret['request_id'] + ".txt", "rb") as f:
-        email.add_attachment(
-            f.read(),
-            filename="remote_device_" + ret['request_id'] + ".txt",
-            maintype="text",
-            subtype="txt"
-        )
+  email.add_attachment(
+      ret['result'].encode('utf-8'),
+      filename="remote_device_" + ret['request_id'] + ".txt",
+      maintype="text",
+      subtype="txt"
+  )
 
-      smtpObj = smtplib.SMTP_SSL('smtp.gmail.com', 465)
-      smtpObj.login(sender, password)
-      smtpObj.sendmail(sender, receivers, email.as_string())
-      smtpObj.quit()
-
-
-      ret["status"] = 'Completed'
-      deployment[item]['status'] = 'free'
-
-      enqueue_request (queue_outgoing, ret)
+  mailer.submit(email)
 
 
 
@@ -174,67 +104,139 @@ def worker(item):
 
 #Variables initialization
 deployment = []
-request_id = 0
+start_time = time.time()
 
 # (1) Check params
-if len(sys.argv) < 2:
-  print("Use: python3 remote_lab.py <deployment_file> [port]");
-  exit(-1)
-
-port = 5000
-if len(sys.argv) == 3:
-  port = int(sys.argv[2])
+parser = argparse.ArgumentParser(usage='python3 remote_lab.py <deployment_file> [port]')
+parser.add_argument('deployment_file')
+parser.add_argument('port', nargs='?', type=int, default=5000)
+parser.add_argument('--server', choices=['waitress', 'flask'], default='waitress',
+                    help='HTTP server: waitress (production WSGI server) or the Flask development server')
+parser.add_argument('--threads', type=int, default=128, help='HTTP worker threads (waitress); each open /events stream or /wait holds one')
+parser.add_argument('--max-streams', type=int, default=0,
+                    help='Open /events streams and /wait long-polls (default: 3/4 of --threads); beyond it they answer 503 and clients poll /status')
+parser.add_argument('--no-email', action='store_true', help='Do not send the results by e-mail')
+parser.add_argument('--result-ttl', type=float, default=86400, help='Seconds completed results stay readable')
+parser.add_argument('--policy', choices=POLICIES, default='fifo',
+                    help='Scheduling: fifo, fair (round-robin per e-mail) or priority (--priority-users first, then fair)')
+parser.add_argument('--priority-users', default=None, help='File with the e-mails (one per line) of the priority class, e.g. instructors')
+parser.add_argument('--quota', type=int, default=0, help='Maximum queued jobs per e-mail (0: no limit)')
+parser.add_argument('--pool-interval', type=float, default=POOL_INTERVAL,
+                    help='Seconds between GET /boards of the gateways, for "target_port": "auto" entries and quarantined boards (0: never)')
+args = parser.parse_args()
+
+port = args.port
+if args.max_streams <= 0:
+  args.max_streams = max(1, args.threads * 3 // 4)
 
 
 # (2) Get Deployment configuration
-print("Enter E-mail:")
-sender = input()
-password = getpass()
+sender = password = None
+if not args.no_email:
+  print("Enter E-mail:")
+  sender = input()
+  password = getpass()
 
 try:
-  deployment_file = open(sys.argv[1], 'r')
+  deployment_file = open(args.deployment_file, 'r')
 except Exception as e:
-  print("Error opening file " + sys.argv[1])
+  print("Error opening file " + args.deployment_file)
   exit(-1)
 
 try:
   deployment = json.loads(deployment_file.read())
 except Exception as e:
-  print("Error reading file " + sys.argv[1])
+  print("Error reading file " + args.deployment_file)
   deployment_file.close()
   exit(-1)
 
 deployment_file.close()
 
+priority_users = []
+if args.priority_users != None:
+  try:
+    with open(args.priority_users, 'r') as users_file:
+      priority_users = [line.strip() for line in users_file if line.strip() != '']
+  except Exception as e:
+    print("Error reading file " + args.priority_users)
+    exit(-1)
 
-# (3)Create result directory
-try:
-  os.mkdir('results')
-except Exception as e:
-  pass
 
+# (3) Open the job store
+store = JobStore('remote_lab.db')
 
-# (4) Queue management
-queue_incoming['lock'] = threading.Lock()
-queue_outgoing['lock'] = threading.Lock()
 
-for index, item in enumerate(deployment):
+# (4) Queue management
+notify = lambda ret: None
+if not args.no_email:
+  mailer = Mailer(sender, password).start()
+  notify = send_results
+
+changes = new_changes()
+queue_incoming = new_queue(changes, new_policy(args.policy, priority_users))
+queue_outgoing = new_queue(changes)
+
+incoming, outgoing = store.load()
+for job in incoming:
+  enqueue_request (queue_incoming, job, restore=True)
+for job in outgoing:
+  enqueue_request (queue_outgoing, job, restore=True)
+
+def start_worker(item):
   deployment[item]['status'] = 'free'
-  t = threading.Thread(target=worker, name='Daemon', args=(item,))
+  t = threading.Thread(target=worker, name='Daemon', args=(deployment, item, queue_incoming, queue_outgoing, notify, store))
   t.start()
 
+# "target_port": "auto" entries get one worker per board of their gateway
+for item in list(deployment):
+  if deployment[item]['target_port'] == 'auto':
+    deployment[item]['status'] = 'pool'
+  else:
+    start_worker(item)
+
+if args.pool_interval > 0:
+  threading.Thread(target=pool_manager, name='Pool', args=(deployment, start_worker, args.pool_interval), daemon=True).start()
+
+threading.Thread(target=expire_results, name='Expire', daemon=True).start()
+
 
 # (5) Setup flask and cors:
 app  = Flask(__name__)
 cors = CORS(app)
 app.config['CORS_HEADERS'] = 'Content-Type'
 
-# (5a) GET / -> send remote_lab.html
+# Every /events stream and /wait long-poll holds a server thread while open:
+# at most --max-streams of them, so the rest of the threads always serve
+# /enqueue, /status and the other short requests
+streams = threading.BoundedSemaphore(args.max_streams)
+
+def streams_full():
+  return jsonify({'status': 'busy'}), 503, {'Retry-After': '5'}
+
+# (5a) GET / -> status snapshot (counters only, O(boards))
 @app.route("/", methods=["GET"])
 @cross_origin()
 def get_status():
-  ret = { 'incoming': queue_incoming, 'outgoing': queue_outgoing }
-  return json.dumps(ret)
+  incoming = queue_stats(queue_incoming)
+  outgoing = queue_stats(queue_outgoing)
+
+  # the pool manager may add entries meanwhile
+  targets = list(deployment.items())
+
+  boards = incoming['boards']
+  for item, target in targets:
+    boards.setdefault(target['target_board'], {'queued': 0, 'running': 0, 'oldest_age': 0})
+
+  ret = {
+    'uptime':     round(time.time() - start_time, 3),
+    'queued':     incoming['size'],
+    'running':    incoming['running'],
+    'completed':  outgoing['size'],
+    'boards':     boards,
+    'deployment': { item: { 'target_board': target['target_board'], 'target_port': target['target_port'], 'status': target['status'], 'health': target.get('health', 'unknown') } for item, target in targets },
+    'throughput': { 'total': outgoing['added'], 'last_minute': outgoing['last_minute'], 'last_hour': outgoing['last_hour'] }
+  }
+  return jsonify(ret)
 
 # (5b) GET /targets -> send available targets
 @app.route("/target_boards", methods=["GET"])
@@ -242,8 +244,7 @@ def get_status():
 def get_target_boards():
   target_boards = []
 
-  for index, item in enumerate(deployment):
-    val = deployment[item]
+  for item, val in list(deployment.items()):
     if not val['target_board'] in target_boards:
       target_boards.append(val['target_board'])
 
@@ -253,7 +254,7 @@ def get_target_boards():
 @app.route("/enqueue", methods=["POST"])
 @cross_origin()
 def post_enqueue():
-  global request_id, queue_incoming
+  global queue_incoming
 
   try:
     req_data = request.get_json()
@@ -262,9 +263,19 @@ def post_enqueue():
     asm_code           = req_data['assembly']
     req_data['status'] = ''
 
-    new_request = { "request_id": str(request_id), "result_email": result_email, "target_board": target_board, "asm_code": asm_code }
-    req_data['status'] = enqueue_request (queue_incoming, new_request)
-    request_id = request_id + 1
+    # over quota -> -3 (checked again when queued: concurrent requests)
+    if args.quota > 0 and user_requests(queue_incoming, result_email) >= args.quota:
+      req_data['status'] = -3
+      return jsonify(req_data)
+
+    request_id  = store.new_request_id()
+    new_request = { "request_id": request_id, "result_email": result_email, "target_board": target_board, "asm_code": asm_code }
+    store.add(new_request)
+    if enqueue_request (queue_incoming, new_request, max_user=args.quota) == -3:
+      store.remove(request_id, store.CANCELLED)
+      req_data['status'] = -3
+      return jsonify(req_data)
+    req_data['status'] = int(request_id)
 
   except Exception as e:
     req_data['status'] += str(e) + '\n'
@@ -283,6 +294,8 @@ def post_delete():
     req_data['status'] = ''
 
     req_data['status'] = delete_request (queue_incoming, req_id)
+    if req_data['status'] == 0:
+      store.remove(req_id, store.CANCELLED)
 
   except Exception as e:
     req_data['status'] += str(e) + '\n'
@@ -318,19 +331,95 @@ def post_status():
     req_id   = str(req_data['req_id'])
     req_data['status'] = ''
 
-    ret = dequeue_request_byid (queue_outgoing, req_id)
+    req_data['status'] = job_state(req_id)
 
-    if ret == None:
-      req_data['status'] = position_request (queue_incoming, req_id)
-    else:
-      req_data['status'] = ret['status']
+  except Exception as e:
+    req_data['status'] += str(e) + '\n'
+
+  return jsonify(req_data)
+
+# (5g) POST /wait -> status, answered once it differs from 'last' (long-poll)
+@app.route("/wait", methods=["POST"])
+@cross_origin()
+def post_wait():
+  if not streams.acquire(blocking=False):
+    return streams_full()
+
+  try:
+    req_data = request.get_json()
+    req_id   = str(req_data['req_id'])
+    last     = req_data.get('last')
+    deadline = time.time() + min(float(req_data.get('timeout', 25)), 60)
+    req_data['status'] = ''
+
+    version = change_version(changes)
+    state   = job_state(req_id)
+    while state == last and time.time() < deadline:
+      version = wait_change(changes, version, deadline - time.time())
+      state   = job_state(req_id)
+
+    req_data['status'] = state
 
   except Exception as e:
     req_data['status'] += str(e) + '\n'
 
+  finally:
+    streams.release()
+
   return jsonify(req_data)
 
+# (5h) GET /events/<req_id> -> status changes as Server-Sent Events
+@app.route("/events/<req_id>", methods=["GET"])
+@cross_origin()
+def get_events(req_id):
+  if not streams.acquire(blocking=False):
+    return streams_full()
+
+  def stream():
+    last = None
+    yield "retry: 5000\n\n"
+
+    while 1:
+      version = change_version(changes)
+      state   = job_state(req_id)
+
+      # the same values /status returns, once per change
+      if state != last:
+        yield "data: " + json.dumps(state) + "\n\n"
+        last = state
+        if state in FINAL_STATES or state == -1:
+          return
+
+      if wait_change(changes, version, 15) == version:
+        yield ": keep-alive\n\n"
+
+  # the server closes the response once the stream ends or the client goes away
+  response = Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+  response.call_on_close(streams.release)
+  return response
+
+# (5i) GET /jobs -> one page of the queued (or completed) jobs, without assembly
+@app.route("/jobs", methods=["GET"])
+@cross_origin()
+def get_jobs():
+  queue  = queue_outgoing if request.args.get('queue') == 'completed' else queue_incoming
+  offset = max(0, request.args.get('offset', 0, type=int))
+  limit  = min(max(1, request.args.get('limit', 50, type=int)), 500)
+
+  jobs = list_requests(queue, request.args.get('board'), offset, limit)
+  return jsonify({ 'offset': offset, 'limit': limit, 'jobs': jobs })
+
 
 
 # Run
-app.run(host='0.0.0.0', port=port, use_reloader=False, debug=True)
+if args.server == 'waitress':
+  try:
+    from waitress import serve
+  except ImportError:
+    print("waitress is not installed (pip3 install waitress), using the Flask development server")
+    args.server = 'flask'
+
+if args.server == 'waitress':
+  serve(app, host='0.0.0.0', port=port, threads=args.threads, connection_limit=4096)
+else:
+  app.run(host='0.0.0.0', port=port, use_reloader=False, debug=False, threaded=True)
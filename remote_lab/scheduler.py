@@ -0,0 +1,286 @@
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+from collections import OrderedDict
+
+
+
+
+## Rank tracking ##
+
+class RankTree:
+  """Fenwick tree over the arrival slots of one board queue.
+
+  Every queued job owns a slot (its arrival order); the rank of a job is the
+  number of still-queued slots up to and including its own, so positions are
+  answered in O(log n) while jobs ahead are dequeued or cancelled.
+  """
+
+  def __init__(self, capacity=64):
+    self.reset(capacity)
+
+  def reset(self, capacity=64):
+    self.capacity = capacity
+    self.tree     = [0] * (capacity + 1)
+    self.alive    = bytearray(capacity + 1)
+    self.next     = 1
+
+  def build(self, capacity, alive):
+    # the tree of the alive slots in O(n)
+    tree = list(alive)
+    for i in range(1, capacity + 1):
+      j = i + (i & -i)
+      if j <= capacity:
+        tree[j] += tree[i]
+
+    self.capacity, self.tree, self.alive = capacity, tree, alive
+
+  def grow(self):
+    # double the capacity
+    capacity = self.capacity * 2
+    self.build(capacity, self.alive + bytearray(capacity - self.capacity))
+
+  def fill(self, count):
+    # slots 1..count alive, the rest free (compaction)
+    capacity = 64
+    while capacity < 2 * count:
+      capacity = capacity * 2
+    self.build(capacity, bytearray([0]) + bytearray([1]) * count + bytearray(capacity - count))
+    self.next = count + 1
+
+  def dead(self, count):
+    # used slots no longer alive, given the count of alive ones
+    return self.next - 1 - count
+
+  def update(self, slot, delta):
+    self.alive[slot] = 1 if delta > 0 else 0
+    while slot <= self.capacity:
+      self.tree[slot] += delta
+      slot += slot & -slot
+
+  def add(self):
+    if self.next > self.capacity:
+      self.grow()
+
+    slot = self.next
+    self.next += 1
+    self.update(slot, 1)
+    return slot
+
+  def remove(self, slot):
+    self.update(slot, -1)
+
+  def rank(self, slot):
+    total = 0
+    while slot > 0:
+      total += self.tree[slot]
+      slot  -= slot & -slot
+    return total
+
+
+
+
+## Policies ##
+
+# A policy decides which queued job of a target board runs next. It keeps
+# its own per-board state (new_state) and job_queue calls it, with the
+# queue lock held, to add, remove (cancel) and take jobs, and to answer the
+# position the job would be dispatched at if nothing else is enqueued
+
+class FifoPolicy:
+  """First come, first served (the former behaviour)."""
+
+  name = 'fifo'
+
+  def new_state(self):
+    return {'jobs': OrderedDict(), 'ranks': RankTree()}
+
+  def size(self, state):
+    return len(state['jobs'])
+
+  def add(self, state, request):
+    state['jobs'][request['request_id']] = state['ranks'].add()
+
+  def remove(self, state, request):
+    slot = state['jobs'].pop(request['request_id'])
+    self.release(state, slot)
+
+  def take(self, state):
+    request_id, slot = state['jobs'].popitem(last=False)
+    self.release(state, slot)
+    return request_id
+
+  def release(self, state, slot):
+    # a board that never drains would grow the tree one slot per job: once
+    # dead slots outnumber the queued jobs, these are renumbered 1..n (in
+    # arrival order), amortized O(1) per job
+    jobs  = state['jobs']
+    ranks = state['ranks']
+    if len(jobs) == 0:
+      ranks.reset()
+      return
+
+    ranks.remove(slot)
+    if ranks.dead(len(jobs)) > len(jobs):
+      ranks.fill(len(jobs))
+      for i, request_id in enumerate(jobs):
+        jobs[request_id] = i + 1
+
+  def position(self, state, request):
+    return state['ranks'].rank(state['jobs'][request['request_id']])
+
+
+class FairSharePolicy:
+  """Round-robin between users ('result_email'), FIFO for each user.
+
+  A user with many queued jobs gets one board turn per round, so a single
+  student submitting in a loop no longer delays everybody else.
+  """
+
+  name = 'fair'
+
+  def __init__(self, key='result_email'):
+    self.key  = key
+    self.fifo = FifoPolicy()
+
+  def new_state(self):
+    # users in round order: the user served last goes to the end
+    return {'users': OrderedDict(), 'size': 0}
+
+  def user(self, request):
+    return request.get(self.key, '')
+
+  def size(self, state):
+    return state['size']
+
+  def add(self, state, request):
+    user = state['users'].get(self.user(request))
+    if user == None:
+      user = self.fifo.new_state()
+      state['users'][self.user(request)] = user
+
+    self.fifo.add(user, request)
+    state['size'] = state['size'] + 1
+
+  def remove(self, state, request):
+    user = state['users'][self.user(request)]
+    self.fifo.remove(user, request)
+    state['size'] = state['size'] - 1
+    if self.fifo.size(user) == 0:
+      del state['users'][self.user(request)]
+
+  def take(self, state):
+    name, user = next(iter(state['users'].items()))
+    request_id = self.fifo.take(user)
+    state['size'] = state['size'] - 1
+
+    if self.fifo.size(user) == 0:
+      del state['users'][name]
+    else:
+      state['users'].move_to_end(name)
+
+    return request_id
+
+  def position(self, state, request):
+    # the k-th job of a user runs after k turns of the users ahead of it in
+    # the round and k - 1 turns of those behind: O(users + log n)
+    name = self.user(request)
+    k    = self.fifo.position(state['users'][name], request)
+
+    position = 0
+    turns    = k
+    for other, user in state['users'].items():
+      if other == name:
+        position = position + k
+        turns    = k - 1
+      else:
+        position = position + min(self.fifo.size(user), turns)
+
+    return position
+
+
+class PriorityPolicy:
+  """Strict priority classes (lower class first), another policy inside.
+
+  classify(request) returns the class of a job, e.g. 0 for instructors and
+  1 for everybody else; jobs of the same class are ordered by 'inner'.
+  """
+
+  name = 'priority'
+
+  def __init__(self, classify, inner=None):
+    self.classify = classify
+    self.inner    = inner if inner != None else FairSharePolicy()
+
+  def new_state(self):
+    return {'classes': {}, 'size': 0}
+
+  def size(self, state):
+    return state['size']
+
+  def add(self, state, request):
+    # the class is fixed when the job is queued
+    request['priority'] = self.classify(request)
+    queue = state['classes'].get(request['priority'])
+    if queue == None:
+      queue = self.inner.new_state()
+      state['classes'][request['priority']] = queue
+
+    self.inner.add(queue, request)
+    state['size'] = state['size'] + 1
+
+  def remove(self, state, request):
+    queue = state['classes'][request['priority']]
+    self.inner.remove(queue, request)
+    state['size'] = state['size'] - 1
+    if self.inner.size(queue) == 0:
+      del state['classes'][request['priority']]
+
+  def take(self, state):
+    priority = min(state['classes'])
+    queue    = state['classes'][priority]
+    state['size'] = state['size'] - 1
+
+    request_id = self.inner.take(queue)
+    if self.inner.size(queue) == 0:
+      del state['classes'][priority]
+
+    return request_id
+
+  def position(self, state, request):
+    ahead = sum(self.inner.size(queue) for priority, queue in state['classes'].items() if priority < request['priority'])
+    return ahead + self.inner.position(state['classes'][request['priority']], request)
+
+
+POLICIES = ('fifo', 'fair', 'priority')
+
+def new_policy (name, priority_users=()):
+  # 'priority' puts the jobs of priority_users (e.g. the instructors'
+  # e-mails) in class 0, before everybody else, and shares fairly inside
+  # each class
+  if name == 'fifo':
+    return FifoPolicy()
+  if name == 'fair':
+    return FairSharePolicy()
+  if name == 'priority':
+    priority_users = frozenset(priority_users)
+    return PriorityPolicy(lambda request: 0 if request.get('result_email') in priority_users else 1)
+
+  raise ValueError('Unknown scheduling policy: ' + name)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Board pool simulation: the remote lab workers and pool manager against a
+# stub gateway with simulated boards, some of them dead. With a "target_port":
+# "auto" entry the workers follow the boards the gateway reports, jobs that
+# meet a dead board are tried again on another one and the dead boards are
+# parked once quarantined; --static runs the former fixed deployment (one
+# entry per port, no retries nor pauses) for comparison.
+#
+# Use: python3 simulate_pool.py [--jobs N] [--boards ok,ok,ok,dead] [--static]
+#
+
+
+import argparse, threading, time
+from collections import Counter
+
+from job_queue import new_queue, enqueue_request
+from stub_gateway import StubGateway
+import worker as lab_worker
+
+
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Remote lab board pool simulation')
+  parser.add_argument('--jobs', type=int, default=200, help='Number of jobs to enqueue')
+  parser.add_argument('--boards', default='ok,ok,ok,dead', help='Modes of the simulated boards (ok or dead)')
+  parser.add_argument('--job-seconds', type=float, default=0.05, help='Seconds a job takes on a board')
+  parser.add_argument('--static', action='store_true', help='One fixed entry per port, no retries nor pauses (former behaviour)')
+  args = parser.parse_args()
+
+  modes   = args.boards.split(',')
+  gateway = StubGateway(0, args.job_seconds, modes).start()
+
+  # short pauses, the simulation lasts seconds
+  lab_worker.BACKOFF_MIN = 0.2
+  lab_worker.BACKOFF_MAX = 2
+
+  if args.static:
+    lab_worker.JOB_ATTEMPTS = 1
+    lab_worker.BACKOFF_MIN  = 0
+    lab_worker.BACKOFF_MAX  = 0
+    deployment = {'target_' + str(i): {'target_board': 'esp32c3', 'target_port': '/dev/ttyUSB' + str(i), 'target_url': gateway.url}
+                  for i in range(len(modes))}
+  else:
+    deployment = {'lab': {'target_board': 'esp32c3', 'target_port': 'auto', 'target_url': gateway.url}}
+
+  queue_incoming = new_queue()
+  queue_outgoing = new_queue(queue_incoming['changes'])
+
+  def start_worker(item):
+    deployment[item]['status'] = 'free'
+    wargs = (deployment, item, queue_incoming, queue_outgoing, lambda ret: None)
+    threading.Thread(target=lab_worker.worker, args=wargs, daemon=True).start()
+
+  for item in list(deployment):
+    if deployment[item]['target_port'] != 'auto':
+      start_worker(item)
+
+  if not args.static:
+    threading.Thread(target=lab_worker.pool_manager, args=(deployment, start_worker, 0.2), daemon=True).start()
+
+  time.sleep(0.5)
+
+  start = time.perf_counter()
+  for i in range(args.jobs):
+    enqueue_request (queue_incoming, {'request_id': str(i), 'result_email': 'sim@localhost', 'target_board': 'esp32c3', 'asm_code': '# job ' + str(i) + '\n'})
+
+  while queue_outgoing['size'] < args.jobs:
+    time.sleep(0.01)
+  elapsed = time.perf_counter() - start
+
+  results  = [queue_outgoing['boards']['esp32c3']['jobs'][str(i)] for i in range(args.jobs)]
+  ok       = sum(1 for ret in results if 'done' in ret['result'])
+  attempts = Counter(ret.get('attempts', 0) for ret in results)
+  healthy  = modes.count('ok')
+
+  print("Mode:      " + ("static deployment, no retries" if args.static else "board pool (auto)"))
+  print("Boards:    " + args.boards + " (" + str(healthy) + " usable)")
+  print("Workers:   " + str(sum(1 for target in deployment.values() if target['target_port'] != 'auto')))
+  for item, target in sorted(deployment.items()):
+    if target['target_port'] != 'auto':
+      print("  %-24s health %-12s jobs sent %d" % (item, target.get('health', 'unknown'), gateway.boards[target['target_port']]['jobs']))
+  print("Jobs:      %d, %d ran on a board, %d failed" % (args.jobs, ok, args.jobs - ok))
+  print("Met a failing board: " + (", ".join(str(count) + " jobs " + str(n) + " times" for n, count in sorted(attempts.items()) if n > 0) or "none"))
+  print("Time:      %.2f s (all on the usable boards: %.2f s)" % (elapsed, args.jobs * args.job_seconds / max(1, healthy)))
+
+
+if __name__ == "__main__":
+  main()
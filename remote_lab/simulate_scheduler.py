@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Scheduling simulator: replays an arrival trace (synthetic, or a JSON file
+# saved with --save-trace) through job_queue with every scheduling policy,
+# in virtual time, and compares makespan and wait-time percentiles.
+#
+# Use: python3 simulate_scheduler.py [--trace FILE] [--boards N] [--quota N]
+#
+
+
+import argparse, heapq, json, random
+
+from job_queue import new_queue, enqueue_request, dequeue_request
+from scheduler import POLICIES, new_policy
+
+
+
+
+def synthetic_trace(args):
+  # a lab session: students submit now and then, a few "flood" the lab with
+  # a burst of jobs early on, and instructors check a few programs
+  rnd   = random.Random(args.seed)
+  trace = []
+
+  def job(t, user, kind):
+    trace.append({'time': round(t, 3), 'user': user, 'kind': kind, 'target_board': rnd.choice(args.models),
+                  'duration': round(rnd.lognormvariate(0, 0.5) * args.job_seconds, 3)})
+
+  for i in range(args.students):
+    t = rnd.uniform(0, args.session / 4)
+    while t < args.session:
+      job(t, 'student' + str(i) + '@uc3m.es', 'student')
+      t = t + rnd.expovariate(1.0 / args.think)
+
+  for i in range(args.flooders):
+    t = rnd.uniform(0, args.session / 4)
+    for j in range(args.flood):
+      job(t + j * 0.5, 'flooder' + str(i) + '@uc3m.es', 'flooder')
+
+  for i in range(args.instructors):
+    for j in range(3):
+      job(rnd.uniform(0, args.session), 'teacher' + str(i) + '@uc3m.es', 'instructor')
+
+  trace.sort(key=lambda entry: entry['time'])
+  return trace
+
+
+def percentile(values, p):
+  if len(values) == 0:
+    return 0
+  values = sorted(values)
+  index  = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+  return values[index]
+
+
+def simulate(trace, policy, boards, quota):
+  # discrete-event replay: arrivals and board releases in time order, each
+  # free board taking the job the policy picks for its target board
+  queue  = new_queue(policy=policy)
+  idle   = {}
+  for i in range(boards):
+    for model in sorted(set(entry['target_board'] for entry in trace)):
+      idle[model] = idle.get(model, 0) + 1
+
+  events   = [(entry['time'], 1, i) for i, entry in enumerate(trace)]
+  heapq.heapify(events)
+  started  = {}
+  rejected = 0
+  end      = 0
+
+  def dispatch(now, model):
+    while idle[model] > 0:
+      request = dequeue_request(queue, model)
+      if request == None:
+        return
+      idle[model] = idle[model] - 1
+      started[request['request_id']] = now
+      heapq.heappush(events, (now + trace[request['request_id']]['duration'], 0, request['request_id']))
+
+  while len(events) > 0:
+    now, kind, i = heapq.heappop(events)
+    entry = trace[i]
+
+    if kind == 1:
+      # arrival
+      if enqueue_request(queue, {'request_id': i, 'result_email': entry['user'], 'target_board': entry['target_board'], 'enqueued': now}, max_user=quota) == -3:
+        rejected = rejected + 1
+        continue
+    else:
+      # a board of this model is free again
+      idle[entry['target_board']] = idle[entry['target_board']] + 1
+      end = max(end, now)
+
+    dispatch(now, entry['target_board'])
+
+  waits = {}
+  for i, start in started.items():
+    waits.setdefault(trace[i]['kind'], []).append(start - trace[i]['time'])
+  waits['all'] = [wait for kind in list(waits) for wait in waits[kind]]
+
+  return {'makespan': end - trace[0]['time'], 'rejected': rejected, 'waits': waits}
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Remote lab scheduling policy simulator')
+  parser.add_argument('--trace', default=None, help='JSON trace to replay (list of {time, user, kind, target_board, duration})')
+  parser.add_argument('--save-trace', default=None, help='Save the synthetic trace to this file')
+  parser.add_argument('--boards', type=int, default=2, help='Boards of each model')
+  parser.add_argument('--models', nargs='+', default=['esp32c3', 'esp32c6'], help='Board models')
+  parser.add_argument('--students', type=int, default=40, help='Students submitting now and then')
+  parser.add_argument('--flooders', type=int, default=2, help='Students submitting a burst of jobs')
+  parser.add_argument('--flood', type=int, default=60, help='Jobs in each burst')
+  parser.add_argument('--instructors', type=int, default=2, help='Instructors (priority class)')
+  parser.add_argument('--session', type=float, default=7200, help='Session length (seconds)')
+  parser.add_argument('--think', type=float, default=900, help='Mean seconds between the jobs of a student')
+  parser.add_argument('--job-seconds', type=float, default=60, help='Median job duration (seconds)')
+  parser.add_argument('--quota', type=int, default=0, help='Maximum queued jobs per user (0: no limit)')
+  parser.add_argument('--seed', type=int, default=1, help='Random seed of the synthetic trace')
+  args = parser.parse_args()
+
+  if args.trace != None:
+    with open(args.trace, 'r') as trace_file:
+      trace = json.load(trace_file)
+  else:
+    trace = synthetic_trace(args)
+
+  if args.save_trace != None:
+    with open(args.save_trace, 'w') as trace_file:
+      json.dump(trace, trace_file, indent=1)
+
+  instructors = sorted(set(entry['user'] for entry in trace if entry.get('kind') == 'instructor'))
+  kinds       = sorted(set(entry.get('kind', 'student') for entry in trace))
+  for entry in trace:
+    entry.setdefault('kind', 'student')
+
+  print("Trace:    " + str(len(trace)) + " jobs, " + str(len(set(entry['user'] for entry in trace))) + " users, " +
+        str(args.boards) + " board(s) per model")
+  print("Quota:    " + (str(args.quota) + " queued jobs per user" if args.quota > 0 else "none"))
+  print("")
+  print("%-9s %10s %9s %-11s %9s %9s %9s %9s" % ("policy", "makespan", "rejected", "jobs", "mean", "p50", "p90", "p99"))
+
+  for name in POLICIES:
+    result = simulate(trace, new_policy(name, instructors), args.boards, args.quota)
+    first  = True
+    for kind in ['all'] + kinds:
+      waits = result['waits'].get(kind, [])
+      mean  = sum(waits) / len(waits) if len(waits) > 0 else 0
+      print("%-9s %10s %9s %-11s %9.1f %9.1f %9.1f %9.1f" % (
+            name if first else '', "%.1f" % result['makespan'] if first else '', result['rejected'] if first else '',
+            kind, mean, percentile(waits, 50), percentile(waits, 90), percentile(waits, 99)))
+      first = False
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Stand-in for gateway/<board>/gateway.py: answers POST /job (and the event
+# stream of /job/stream) without any board attached, so the remote lab can
+# be exercised and benchmarked. Given simulated boards it also answers
+# GET /boards: jobs for a 'dead' board fail with a board error and, after
+# QUARANTINE_FAILURES of them, the board is reported quarantined.
+#
+# Use: python3 stub_gateway.py [port] [job_seconds] [board_modes]
+#      (board_modes, e.g. ok,ok,dead: boards /dev/ttyUSB0, /dev/ttyUSB1...)
+#
+
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import sys, json, threading, time
+
+
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+  # keep-alive, as the remote lab reuses its connections
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+
+  def do_POST(self):
+    length   = int(self.headers.get('Content-Length', 0))
+    req_data = json.loads(self.rfile.read(length) or b'{}')
+
+    # record when the job reached the "board"
+    self.server.record(self.path, req_data)
+
+    if self.path.endswith('/stream'):
+      return self.stream(req_data)
+
+    time.sleep(self.server.job_seconds)
+
+    self.server.run(self.path, req_data)
+    self.reply(req_data)
+
+  def do_GET(self):
+    if self.path != '/boards' or self.server.boards == None:
+      self.send_error(404)
+      return
+
+    self.reply({'boards': self.server.report()})
+
+  def reply(self, req_data):
+    body = json.dumps(req_data).encode('utf-8')
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def stream(self, req_data):
+    # the same stages as the gateway, split over job_seconds (chunked)
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/event-stream')
+    self.send_header('Transfer-Encoding', 'chunked')
+    self.end_headers()
+
+    stages = ['adapt', 'build', 'flash', 'monitor']
+    for stage in stages:
+      self.chunk({'stage': stage})
+      self.chunk({'line': 'stub gateway: ' + stage})
+      time.sleep(self.server.job_seconds / len(stages))
+
+    self.server.run(self.path, req_data)
+    self.chunk({'result': req_data})
+    self.wfile.write(b'0\r\n\r\n')
+
+  def chunk(self, event):
+    data = ('data: ' + json.dumps(event) + '\n\n').encode('utf-8')
+    self.wfile.write(('%x\r\n' % len(data)).encode('ascii') + data + b'\r\n')
+    self.wfile.flush()
+
+  def log_message(self, format, *args):
+    pass
+
+
+class StubGateway(ThreadingHTTPServer):
+  daemon_threads = True
+
+  QUARANTINE_FAILURES = 3
+
+  def __init__(self, port=0, job_seconds=0.0, board_modes=None):
+    super().__init__(('127.0.0.1', port), StubGatewayHandler)
+    self.job_seconds = job_seconds
+    self.received    = []
+    self.lock        = threading.Lock()
+
+    # port -> {'mode': 'ok' or 'dead', 'failures', 'jobs'} (None: no /boards)
+    self.boards = None
+    if board_modes != None:
+      self.boards = {'/dev/ttyUSB' + str(i): {'mode': mode, 'failures': 0, 'jobs': 0} for i, mode in enumerate(board_modes)}
+
+  def record(self, path, req_data):
+    with self.lock:
+      self.received.append((time.perf_counter(), path, req_data))
+
+  def run(self, path, req_data):
+    # the reply of the job on its (simulated) board
+    board = None
+    if self.boards != None:
+      board = self.boards.get(req_data.get('target_port'))
+
+    if board == None or board['mode'] != 'dead':
+      req_data['status'] = 'stub gateway: ' + path + ' done\n'
+      req_data['error']  = 0
+      if board != None:
+        with self.lock:
+          board['jobs'] += 1
+      return
+
+    with self.lock:
+      board['jobs'] += 1
+      if board['failures'] >= self.QUARANTINE_FAILURES:
+        req_data['quarantined'] = True
+      else:
+        board['failures'] += 1
+        req_data['board_error'] = 'flash'
+
+    req_data['status'] = 'stub gateway: ' + path + ' failed, the board does not answer\n'
+    req_data['error']  = -1
+
+  def report(self):
+    with self.lock:
+      return [{'port': port, 'board': None, 'attached': True, 'busy': False, 'failures': board['failures'], 'jobs': board['jobs'],
+               'health': 'quarantined' if board['failures'] >= self.QUARANTINE_FAILURES else 'ok'} for port, board in sorted(self.boards.items())]
+
+  @property
+  def url(self):
+    return 'http://127.0.0.1:' + str(self.server_address[1])
+
+  def start(self):
+    t = threading.Thread(target=self.serve_forever, daemon=True)
+    t.start()
+    return self
+
+
+# Main
+if __name__ == "__main__":
+  port = 8080
+  if len(sys.argv) > 1:
+    port = int(sys.argv[1])
+
+  job_seconds = 0.0
+  if len(sys.argv) > 2:
+    job_seconds = float(sys.argv[2])
+
+  board_modes = None
+  if len(sys.argv) > 3:
+    board_modes = sys.argv[3].split(',')
+
+  print("Stub gateway on port " + str(port))
+  StubGateway(port, job_seconds, board_modes).serve_forever()
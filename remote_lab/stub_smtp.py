@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Local stand-in for the SMTP server used by mailer.py: accepts (and keeps)
+# every message, can be slowed down and can reject the next N messages with
+# a transient (451) or a permanent (550) error so retries can be exercised
+# without a real mail server.
+#
+# Use: python3 stub_smtp.py [port] [seconds_per_message]
+#
+
+
+import socketserver, sys, threading, time
+
+
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+
+  def reply(self, line):
+    self.wfile.write((line + "\r\n").encode('utf-8'))
+
+  def handle(self):
+    server = self.server
+    server.count('connections')
+
+    self.reply("220 stub ESMTP")
+    while 1:
+      line = self.rfile.readline()
+      if not line:
+        return
+
+      cmd = line.decode('utf-8', 'replace').strip()
+      verb = cmd.split(' ')[0].upper()
+
+      if verb == 'EHLO':
+        self.reply("250-stub")
+        self.reply("250 AUTH PLAIN LOGIN")
+      elif verb == 'AUTH':
+        server.count('logins')
+        if cmd.upper().startswith('AUTH LOGIN'):
+          self.reply("334 VXNlcm5hbWU6")
+          self.rfile.readline()
+          self.reply("334 UGFzc3dvcmQ6")
+          self.rfile.readline()
+        self.reply("235 Authentication successful")
+      elif verb == 'MAIL':
+        if server.take_failure():
+          self.reply("451 Try again later")
+        elif server.take_rejection():
+          self.reply("550 Mailbox unavailable")
+        else:
+          self.reply("250 OK")
+      elif verb == 'DATA':
+        self.reply("354 End data with <CR><LF>.<CR><LF>")
+        data = []
+        while 1:
+          line = self.rfile.readline()
+          if not line or line in (b".\r\n", b".\n"):
+            break
+          data.append(line)
+        time.sleep(server.message_seconds)
+        server.store(b"".join(data))
+        self.reply("250 OK")
+      elif verb == 'QUIT':
+        self.reply("221 Bye")
+        return
+      else:
+        # HELO, RCPT, RSET, NOOP...
+        self.reply("250 OK")
+
+
+class StubSMTP(socketserver.ThreadingTCPServer):
+  daemon_threads      = True
+  allow_reuse_address = True
+
+  def __init__(self, port=0, message_seconds=0.0):
+    super().__init__(('127.0.0.1', port), StubSMTPHandler)
+    self.message_seconds = message_seconds
+    self.fail_next       = 0
+    self.reject_next     = 0
+    self.messages        = []
+    self.stats           = {'connections': 0, 'logins': 0}
+    self.lock            = threading.Lock()
+
+  def count(self, key):
+    with self.lock:
+      self.stats[key] = self.stats[key] + 1
+
+  def take_failure(self):
+    with self.lock:
+      if self.fail_next > 0:
+        self.fail_next = self.fail_next - 1
+        return True
+      return False
+
+  def take_rejection(self):
+    with self.lock:
+      if self.reject_next > 0:
+        self.reject_next = self.reject_next - 1
+        return True
+      return False
+
+  def store(self, data):
+    with self.lock:
+      self.messages.append(data)
+
+  @property
+  def port(self):
+    return self.server_address[1]
+
+  def start(self):
+    t = threading.Thread(target=self.serve_forever, daemon=True)
+    t.start()
+    return self
+
+
+# Main
+if __name__ == "__main__":
+  port = 2525
+  if len(sys.argv) > 1:
+    port = int(sys.argv[1])
+
+  message_seconds = 0.0
+  if len(sys.argv) > 2:
+    message_seconds = float(sys.argv[2])
+
+  print("Stub SMTP server on port " + str(port))
+  StubSMTP(port, message_seconds).serve_forever()
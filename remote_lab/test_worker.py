@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+# Worker tests against stub_gateway.py: a job whose board fails every
+# attempt ends as an Error (stored and e-mailed as such), not Completed.
+#
+# Use: python3 test_worker.py
+#
+
+
+import threading, unittest
+
+import worker
+from job_queue import new_queue, new_changes, enqueue_request, peek_request
+from stub_gateway import StubGateway
+
+
+
+
+class RecordingStore:
+  # the calls of the worker to the job store
+  QUEUED  = 'Queued'
+  RUNNING = 'Running'
+
+  def __init__(self):
+    self.statuses  = []
+    self.completed = []
+
+  def set_status(self, request_id, status):
+    self.statuses.append((request_id, status))
+
+  def complete(self, request_id, result, status):
+    self.completed.append((request_id, result, status))
+
+
+class WorkerTest(unittest.TestCase):
+
+  def setUp(self):
+    # no pause between the attempts
+    self.backoff = (worker.BACKOFF_MIN, worker.BACKOFF_MAX)
+    worker.BACKOFF_MIN = worker.BACKOFF_MAX = 0
+
+  def tearDown(self):
+    worker.BACKOFF_MIN, worker.BACKOFF_MAX = self.backoff
+
+  def run_job(self, board_mode):
+    gateway = StubGateway(board_modes=[board_mode]).start()
+    self.addCleanup(gateway.server_close)
+    self.addCleanup(gateway.shutdown)
+
+    changes        = new_changes()
+    queue_incoming = new_queue(changes)
+    queue_outgoing = new_queue(changes)
+    deployment     = {'target_0': {'target_board': 'esp32c3', 'target_port': '/dev/ttyUSB0', 'target_url': gateway.url, 'stream': False}}
+    store          = RecordingStore()
+    notified       = []
+    done           = threading.Event()
+
+    def notify(ret):
+      notified.append(ret)
+      done.set()
+
+    threading.Thread(target=worker.worker, args=(deployment, 'target_0', queue_incoming, queue_outgoing, notify, store), daemon=True).start()
+    enqueue_request(queue_incoming, {'request_id': '0', 'result_email': 'student@localhost', 'target_board': 'esp32c3', 'asm_code': 'nop\n'})
+
+    self.assertTrue(done.wait(10), 'the job never finished')
+    return gateway, store, notified, peek_request(queue_outgoing, '0')
+
+  def test_board_failing_every_attempt(self):
+    gateway, store, notified, ret = self.run_job('dead')
+
+    # JOB_ATTEMPTS tries, then an error with the board error in the result
+    self.assertEqual(len(gateway.received), worker.JOB_ATTEMPTS)
+    self.assertEqual(ret['status'], 'Error')
+    self.assertIn('board error: flash', ret['result'])
+    self.assertEqual(store.completed, [('0', ret['result'], 'Error')])
+    self.assertEqual([ret['request_id'] for ret in notified], ['0'])
+    self.assertEqual(notified[0]['status'], 'Error')
+    self.assertEqual(store.statuses.count(('0', 'Queued')), worker.JOB_ATTEMPTS - 1)
+
+  def test_working_board(self):
+    gateway, store, notified, ret = self.run_job('ok')
+
+    self.assertEqual(len(gateway.received), 1)
+    self.assertEqual(ret['status'], 'Completed')
+    self.assertEqual(store.completed, [('0', ret['result'], 'Completed')])
+
+
+if __name__ == "__main__":
+  unittest.main()
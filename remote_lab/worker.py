@@ -0,0 +1,260 @@
+#
+#  Copyright 2022-2024 Felix Garcia Carballeira, Diego Carmarmas Alonso, Alejandro Calderon Mateos
+#
+#  This file is part of CREATOR.
+#
+#  CREATOR is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CREATOR is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with CREATOR.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import time, json, threading
+import requests
+
+from job_queue import enqueue_request, wait_request, finish_request, notify_change
+
+
+
+
+## Gateway client ##
+
+# Timeouts (seconds) unless the deployment entry sets its own
+# 'connect_timeout' / 'job_timeout': a job builds, flashes and monitors the
+# board, so the reply can take minutes
+CONNECT_TIMEOUT = 5
+JOB_TIMEOUT     = 600
+
+# an event stream sends at least a keep-alive every 15 s
+STREAM_TIMEOUT  = 60
+
+def gateway_session():
+  # keep-alive connections to the gateway, reused for every job
+  session = requests.Session()
+  adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  return session
+
+def read_stream(res, progress, job_timeout):
+  # events of /job/stream as they arrive: stage markers go to progress(),
+  # the last event is the reply /job would have sent
+  deadline = time.time() + job_timeout
+
+  with res:
+    for line in res.iter_lines(decode_unicode=True):
+      if time.time() > deadline:
+        raise requests.Timeout('job timeout')
+      if not line.startswith('data: '):
+        continue
+
+      event = json.loads(line[6:])
+      if 'result' in event:
+        return event['result']
+      if 'stage' in event:
+        progress(event['stage'])
+
+  raise ValueError('the gateway stream ended without a result')
+
+def post_job(session, target, job, progress=None):
+  # Sent to the target post; with progress, the gateway streams the job
+  # (/job/stream) unless the deployment entry sets "stream": false or the
+  # gateway is older (404)
+  msg = {'target_port': target['target_port'], 'target_board': job['target_board'], 'assembly': job['asm_code']}
+  connect_timeout = target.get('connect_timeout', CONNECT_TIMEOUT)
+  job_timeout     = target.get('job_timeout', JOB_TIMEOUT)
+
+  if progress != None and target.get('stream', True):
+    res = session.post(target['target_url'] + "/job/stream", json = msg, timeout = (connect_timeout, STREAM_TIMEOUT), stream = True)
+    if res.status_code not in (404, 405):
+      res.raise_for_status()
+      return read_stream(res, progress, job_timeout)
+
+    res.close()
+    target['stream'] = False
+
+  res = session.post(target['target_url'] + "/job", json = msg, timeout = (connect_timeout, job_timeout))
+  res.raise_for_status()
+  return res.json()
+
+
+
+
+## Board pool ##
+
+# A deployment entry with "target_port": "auto" stands for every board its
+# gateway reports in GET /boards: pool_manager() polls the gateways every
+# POOL_INTERVAL seconds, adds an entry (and its worker) for each new board
+# and parks the workers of the boards quarantined or gone, so there are as
+# many workers taking jobs as usable boards. Entries with a fixed port are
+# parked as well while their board is quarantined
+POOL_INTERVAL = 30
+
+def new_enabled():
+  # set while the worker of a deployment entry takes jobs
+  enabled = threading.Event()
+  enabled.set()
+  return enabled
+
+def gateway_boards(session, target_url):
+  # the boards of GET /boards (None if the gateway cannot tell)
+  try:
+    res = session.get(target_url + '/boards', timeout=(CONNECT_TIMEOUT, CONNECT_TIMEOUT))
+    if res.status_code != 200:
+      return None
+    return res.json()['boards']
+  except (requests.RequestException, ValueError, KeyError):
+    return None
+
+def pool_update(deployment, reports, start_worker):
+  # reports: target_url -> boards of GET /boards (None: unknown)
+  for item, target in list(deployment.items()):
+    boards = reports.get(target['target_url'])
+    if target['target_port'] != 'auto' or boards == None:
+      continue
+
+    for board in boards:
+      name = item + ':' + board['port']
+      if name in deployment or not board['attached'] or board.get('board') not in (None, target['target_board']):
+        continue
+      entry = {key: value for key, value in target.items() if key not in ('status', 'health')}
+      entry.update({'target_port': board['port'], 'pool': item, 'enabled': new_enabled()})
+      deployment[name] = entry
+      start_worker(name)
+
+  for item, target in list(deployment.items()):
+    boards = reports.get(target['target_url'])
+    if target['target_port'] == 'auto' or boards == None:
+      continue
+
+    report = [board for board in boards if board['port'] == target['target_port']]
+    if len(report) == 0:
+      # a discovered board is gone, a fixed port may just not be listed
+      health = 'offline' if 'pool' in target else 'unknown'
+    elif report[0]['health'] == 'quarantined':
+      health = 'quarantined'
+    else:
+      health = 'ok'
+
+    target['health'] = health
+    if health in ('ok', 'unknown'):
+      target['enabled'].set()
+    else:
+      target['enabled'].clear()
+
+def pool_manager(deployment, start_worker, interval=POOL_INTERVAL):
+  session = gateway_session()
+
+  while 1:
+    urls    = set(target['target_url'] for target in list(deployment.values()))
+    reports = {url: gateway_boards(session, url) for url in urls}
+    pool_update(deployment, reports, start_worker)
+    time.sleep(interval)
+
+
+
+
+## Thread ##
+
+# A worker whose board fails (the gateway reports a board error, or cannot
+# be reached) gives the job back to the queue, for any board, up to
+# JOB_ATTEMPTS times, and waits BACKOFF_MIN seconds, doubled with every
+# failure in a row up to BACKOFF_MAX, before taking the next one
+BACKOFF_MIN  = 5
+BACKOFF_MAX  = 300
+JOB_ATTEMPTS = 3
+
+def requeue_request(queue_incoming, ret, store):
+  # back to the tail of the queue for another try; 'enqueued' keeps its
+  # arrival time, for the waiting times reported
+  for key in ('stage', 'result', 'status'):
+    ret.pop(key, None)
+  enqueue_request (queue_incoming, ret, restore=True)
+  finish_request (queue_incoming, ret['request_id'])
+  if store != None:
+    store.set_status(ret['request_id'], store.QUEUED)
+
+def worker(deployment, item, queue_incoming, queue_outgoing, notify, store=None):
+  target  = deployment[item]
+  enabled = target.setdefault('enabled', new_enabled())
+  session = gateway_session()
+  backoff = 0
+
+  while 1:
+
+    # parked while its board is quarantined or gone
+    enabled.wait()
+
+    # sleeps until an /enqueue for this board wakes it up
+    ret = wait_request (queue_incoming, target['target_board'])
+    if ret == None:
+      continue
+
+    if not enabled.is_set():
+      requeue_request(queue_incoming, ret, store)
+      continue
+
+    target['status'] = 'busy'
+    if store != None:
+      store.set_status(ret['request_id'], store.RUNNING)
+
+    # the stage the gateway is in shows in /status and /events
+    def progress(stage):
+      ret['stage'] = stage
+      notify_change(queue_incoming['changes'])
+
+    board_error = None
+    try:
+      jres = post_job(session, target, ret, progress)
+      ret['result'] = jres['status']
+      ret["status"] = 'Completed'
+      if jres.get('board_error') != None or jres.get('quarantined'):
+        board_error = jres.get('board_error', 'quarantined')
+    except (requests.RequestException, ValueError, KeyError) as e:
+      ret['result'] = 'Error sending the job to the gateway: ' + str(e) + '\n'
+      ret["status"] = 'Error'
+      board_error = 'gateway'
+
+    # a failing board: another try of the job, and a pause for the board
+    if board_error != None:
+      backoff = min(BACKOFF_MAX, max(BACKOFF_MIN, backoff * 2))
+      ret['attempts'] = ret.get('attempts', 0) + 1
+      if ret['attempts'] < JOB_ATTEMPTS:
+        requeue_request(queue_incoming, ret, store)
+        target['status'] = 'backoff'
+        time.sleep(backoff)
+        target['status'] = 'free'
+        continue
+
+      # out of attempts: the job never ran on a board
+      ret['result'] = 'The job could not run on a board after ' + str(ret['attempts']) + ' attempts (board error: ' + board_error + ')\n' + ret['result']
+      ret["status"] = 'Error'
+    else:
+      backoff = 0
+
+    # the board is free as soon as the gateway replies
+    target['status'] = 'free'
+    if store != None:
+      store.complete(ret['request_id'], ret['result'], ret['status'])
+
+    # results stay readable in queue_outgoing until they expire
+    ret['completed'] = time.time()
+    enqueue_request (queue_outgoing, ret)
+    finish_request (queue_incoming, ret['request_id'])
+
+    # Queue the email with the results (sent by the delivery stage)
+    notify(ret)
+
+    if board_error != None:
+      target['status'] = 'backoff'
+      time.sleep(backoff)
+      target['status'] = 'free'
@@ -300,6 +300,7 @@ export function assembly_compiler() {
 
   pc = 4;
 
+  tokenIndex = 0;
   nEnters = 0;
 
   if (update_binary.instructions_binary != null) {
@@ -135,7 +135,9 @@ import {
 
 import { logger } from './utils/creator_logger.mjs'
 import { assembly_compiler } from './compiler/compiler'
-import { executeProgramOneShot } from './executor/executor'
+import { executeProgramOneShot, reset } from './executor/executor'
+import { creator_callstack_clear } from './sentinel/sentinel'
+import { track_stack_clear } from './memory/stackTracker'
 import { main_memory_get_addresses, main_memory_read_value, main_memory_read_default_value } from './memory/memoryCore'
 
 var creator_debug = false
@@ -263,6 +265,20 @@ function execute_program(limit_n_instructions) {
     return ret
 }
 
+function reset_execution() {
+    var ret = {
+        status: 'ok',
+        msg: '',
+    }
+
+    // registers, memory, stats and console back to the initial state,
+    // and no call stack yet (as in a newly loaded engine)
+    reset()
+    creator_callstack_clear()
+    track_stack_clear()
+    return ret
+}
+
 // state management
 
 function get_state() {
@@ -543,6 +559,7 @@ export {
     load_library,
     assembly_compile,
     execute_program,
+    reset_execution,
     get_state,
     compare_states,
     help_instructions,
@@ -950,7 +950,7 @@ export function executeProgramOneShot(limit_n_instructions) {
     )
 }
 
-function reset() {
+export function reset() {
     // Google Analytics
     creator_ga('execute', 'execute.reset')
 
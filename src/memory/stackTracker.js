@@ -212,6 +212,14 @@ export function track_stack_setsp(value) {
     elto.end_callee = value
 }
 //
+// Clear (no stack limits, as before the first reset)
+// Example: track_stack_clear() ;
+//
+export function track_stack_clear() {
+    track_stack_names = []
+    track_stack_limits = []
+}
+//
 // Reset
 // Example: track_stack_reset() ;
 //
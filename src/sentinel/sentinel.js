@@ -389,6 +389,14 @@ export function creator_callstack_writeRegister(indexComponent, indexElement) {
   creator_callstack_do_transition("wr", indexComponent, indexElement, address);
 }
 //
+// Clear (no call stack, as before the first reset)
+// Example: creator_callstack_clear() ;
+//
+export function creator_callstack_clear() {
+  stack_call_names = [];
+  stack_call_register = [];
+}
+//
 // Reset
 // Example: creator_callstack_reset() ;
 //
@@ -19,6 +19,11 @@
 
 import subprocess
 import sys
+import os
+import json
+import math
+import hashlib
+import xml.etree.ElementTree as ET
 import time
 import argparse
 import asyncio
@@ -104,6 +109,33 @@ test_categories = {
     
 file_cache = {}
 
+# The engine, started once per test (--oneshot) or once per worker
+ENGINE_CMD = ["bun", "creator.mjs"]
+
+# Wall time (seconds) of every test in the last run, so the longest start first
+DURATIONS_FILE = ".test_durations.json"
+
+# Key and result of every test in the last run: a passed test is not run
+# again while its files and the engine sources stay the same
+CACHE_FILE = ".test_cache.json"
+ENGINE_SOURCES = ["src", "creator.mjs"]
+
+# Wall time of every test (from merged reports, see --merge): shards are
+# balanced with it, so it is the same file on every machine
+SHARD_DURATIONS_FILE = "./test/durations.json"
+
+# Benchmark (--bench): the metrics are compared with a baseline (of this
+# machine), a change over BENCH_THRESHOLD being a regression. A program
+# takes a few ms, where a GC pause is enough to double it, so times are
+# compared for all the programs together, instruction counts (exact) for
+# every program
+BENCH_BASELINE_FILE = ".bench_baseline.json"
+BENCH_THRESHOLD = 0.2
+EXAMPLE_SETS_FILE = "./examples/example_set.json"
+ARCHITECTURES_FILE = "./architecture/available_arch.json"
+
+hash_cache = {}
+
 
 class Colors:
     """ANSI color codes"""
@@ -151,6 +183,178 @@ def create_diff(expected, actual):
     output.append("└" + "─" * width + "┴" + "─" * width + "┘")
     return "\n".join(output)
 
+class EnginePool:
+    """Warm creator.mjs workers (--worker), one per core, each running one test at a time"""
+
+    def __init__(self, size=None):
+        self.size = size or os.cpu_count() or 1
+        self.idle = None
+        self.request_id = 0
+
+    async def start_worker(self):
+        return await asyncio.create_subprocess_exec(
+            *ENGINE_CMD, "--worker",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            limit=1 << 24)
+
+    async def start(self):
+        self.idle = asyncio.Queue()
+        for _ in range(self.size):
+            self.idle.put_nowait(await self.start_worker())
+
+    async def close(self):
+        while not self.idle.empty():
+            worker = self.idle.get_nowait()
+            worker.stdin.close()
+            await worker.wait()
+
+    async def call(self, request, cmd):
+        """Send one request to a free worker, returning its reply"""
+        self.request_id += 1
+        request = dict(request, id=self.request_id)
+
+        worker = await self.idle.get()
+        try:
+            worker.stdin.write((json.dumps(request) + "\n").encode())
+            await worker.stdin.drain()
+            line = await worker.stdout.readline()
+            if not line:
+                raise subprocess.CalledProcessError(await worker.wait(), cmd)
+            reply = json.loads(line)
+        except Exception:
+            # a dead (or confused) worker is replaced by a new one
+            if worker.returncode is None:
+                worker.kill()
+                await worker.wait()
+            worker = await self.start_worker()
+            raise
+        finally:
+            self.idle.put_nowait(worker)
+
+        return reply
+
+    async def run(self, request, cmd):
+        """Run one request, returning its output as the one-shot cmd would print it"""
+        reply = await self.call(dict(request, output="min"), cmd)
+
+        # the status the one-shot run would exit with (-1, i.e. 255)
+        if reply["status"] != 0:
+            raise subprocess.CalledProcessError(reply["status"] & 0xff, cmd)
+        return reply["output"]
+
+def load_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+
+def test_name(base_path, test_num):
+    return f"{base_path}_{test_num:03d}"
+
+def hash_file(path):
+    if path in hash_cache:
+        return hash_cache[path]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    hash_cache[path] = digest
+    return digest
+
+def engine_digest():
+    """Digest of the engine sources: any change in them invalidates every cached result"""
+    digest = hashlib.sha256()
+    for source in ENGINE_SOURCES:
+        paths = [source]
+        if os.path.isdir(source):
+            paths = sorted(os.path.join(root, name) for root, dirs, names in os.walk(source) for name in names)
+        for path in paths:
+            digest.update(f"{path}\0{hash_file(path)}\0".encode())
+    return digest.hexdigest()
+
+def test_key(engine, config, test_num):
+    """Cache key of a test: its source, expected output, architecture, library and the engine"""
+    base = test_name(config["path"], test_num)
+    files = [base + ".s", base + ".out", config["arch"]]
+    if config.get("has_lib"):
+        files.append(base + ".o")
+
+    digest = hashlib.sha256(engine.encode())
+    try:
+        for path in files:
+            digest.update(hash_file(path).encode())
+    except OSError:
+        # missing files: the test always runs (and reports the error)
+        return None
+    return digest.hexdigest()
+
+def parse_shard(text):
+    """Parse --shard i/N (i from 1 to N)"""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{text}', expected i/N")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"invalid shard '{text}', i must be between 1 and N")
+    return index, count
+
+def shard_tests(categories, shard, durations):
+    """Keep the tests of shard i of N: longest first, every test goes to the shard with the
+    least time so far, so that all shards take about the same time (and every machine
+    computes the same split)"""
+    index, count = shard
+    known = sorted(durations.values())
+    default = known[len(known) // 2] if known else 1.0
+
+    tests = []
+    for category, config in categories.items():
+        for num in config["numbers"]:
+            name = test_name(config["path"], num)
+            tests.append((-durations.get(name, default), name, category, num))
+    tests.sort()
+
+    loads = [0.0] * count
+    numbers = {category: [] for category in categories}
+    for weight, name, category, num in tests:
+        target = loads.index(min(loads))
+        loads[target] -= weight
+        if target == index - 1:
+            numbers[category].append(num)
+
+    return {category: dict(config, numbers=sorted(numbers[category]))
+            for category, config in categories.items() if numbers[category]}
+
+def select_tests(categories, cache, engine, use_cache=True, only_failed=False):
+    """Split the tests of every category in those to run and those passed with the same key
+    (cached), with --only-failed keeping only the tests that failed in the last run"""
+    selected = {}
+    cached = {}
+    keys = {}
+    for category, config in categories.items():
+        numbers = []
+        cached[category] = []
+        for num in config["numbers"]:
+            name = test_name(config["path"], num)
+            last = cache.get(name, {})
+            if only_failed and last.get("passed", True):
+                continue
+
+            keys[name] = test_key(engine, config, num)
+            if use_cache and last.get("passed") and keys[name] is not None and last.get("key") == keys[name]:
+                cached[category].append(num)
+            else:
+                numbers.append(num)
+
+        if numbers or cached[category]:
+            selected[category] = dict(config, numbers=numbers)
+
+    return selected, cached, keys
+
 def read_file(path):
     if path in file_cache:
         return file_cache[path]
@@ -161,62 +365,386 @@ def read_file(path):
 
 async def run_single_test(args):
     """Run a single test with given arguments"""
-    test_num, base_path, lib_path, arch = args
+    test_num, base_path, lib_path, arch, pool = args
     test_num_str = f"{test_num:03d}"
     
-    cmd = ["bun", "creator.mjs",
+    cmd = ENGINE_CMD + [
            "-a", arch,
            "-s", f"{base_path}_{test_num_str}.s",
            "-o", "min"]
+    request = {"architecture": arch, "assembly": f"{base_path}_{test_num_str}.s"}
     
     if lib_path:
         cmd.extend(["-l", f"{lib_path}_{test_num_str}.o"])
+        request["library"] = f"{lib_path}_{test_num_str}.o"
      
+    start_time = time.perf_counter()
     try:
-        # Run command and capture output directly
-        result = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True, check=True)
-        output = result.stdout.lower()
+        if pool:
+            output = (await pool.run(request, cmd)).lower()
+        else:
+            # Run command and capture output directly
+            result = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True, check=True)
+            output = result.stdout.lower()
         
         # Compare with expected
         expected_file = f"{base_path}_{test_num_str}.out"
         expected = read_file(expected_file).lower()
         if output == expected:
-            return (test_num_str, True, None)
+            success, error_msg = True, None
         else:
-            return (test_num_str, False, (expected, output))
+            success, error_msg = False, (expected, output)
     except Exception as e:
-        return (test_num_str, False, str(e))
+        success, error_msg = False, str(e)
+
+    return (test_num_str, success, error_msg, time.perf_counter() - start_time)
+
+async def run_scheduled_tests(categories, jobs, pool=None, durations=None):
+    """Run the tests of every category through one pool of `jobs` slots, the longest known first"""
+    semaphore = asyncio.Semaphore(jobs)
+    if durations is None:
+        durations = {}
 
-async def run_test_category(category_name, test_numbers, base_path, arch, lib_path=None):
-    """Run tests for a specific category using the provided process pool"""
+    tests = []
+    for category, config in categories.items():
+        lib_path = config["path"] if config.get("has_lib") else None
+        for num in config["numbers"]:
+            tests.append((category, (num, config["path"], lib_path, config["arch"], pool)))
+
+    # tests never timed go first: any of them may be the longest one
+    tests.sort(key=lambda test: -durations.get(test_name(test[1][1], test[1][0]), math.inf))
+
+    async def run_bounded(args):
+        async with semaphore:
+            return await run_single_test(args)
+
+    results = await asyncio.gather(*[run_bounded(args) for category, args in tests])
+
+    # results of each category, in test order
+    category_results = {category: [] for category in categories}
+    for (category, args), result in zip(tests, results):
+        category_results[category].append(result)
+        durations[test_name(args[1], args[0])] = round(result[3], 3)
+    for results in category_results.values():
+        results.sort(key=lambda result: result[0])
+
+    return category_results
+
+def report_category(category_name, base_path, results, print_output=print):
+    """Print the failures of a category, returning its error flag and counts"""
     error = 0
     passed = 0
     failed = 0
     
-    # Prepare args for parallel execution
-    tasks = [run_single_test((num, base_path, lib_path, arch)) for num in test_numbers]
-    
-    # Use asyncio.gather for better resource management
-    results = await asyncio.gather(*tasks)
-    
     # Process results
-    for test_num, success, error_msg in results:
+    for test_num, success, error_msg, duration in results:
         if success:
             passed += 1
         else:
-            print(f"[TEST] {category_name} - {base_path}_{test_num}: ", end="")
-            print(ColorFormatter.error("FAIL"))
+            print_output(f"[TEST] {category_name} - {base_path}_{test_num}: " + ColorFormatter.error("FAIL"))
             if isinstance(error_msg, tuple):
                 expected, actual = error_msg
-                print("      Output difference found:")
-                print("      " + create_diff(expected, actual).replace('\n', '\n      '))
+                print_output("      Output difference found:")
+                print_output("      " + create_diff(expected, actual).replace('\n', '\n      '))
             else:
-                print(f"      Error details: {error_msg}")
+                print_output(f"      Error details: {error_msg}")
             failed += 1
             error = 1
             
     return error, passed, failed
 
+def test_records(category_name, base_path, results, cached_numbers):
+    """Per-test entries of the reports: name, category, status (passed, failed or cached), wall time"""
+    records = []
+    for test_num, success, error_msg, duration in results:
+        record = {"name": f"{base_path}_{test_num}", "category": category_name,
+                  "status": "passed" if success else "failed", "time": round(duration, 3)}
+        if isinstance(error_msg, tuple):
+            record["message"] = "Output difference found"
+            record["expected"], record["actual"] = error_msg
+        elif not success:
+            record["message"] = error_msg
+        records.append(record)
+
+    for num in cached_numbers:
+        records.append({"name": test_name(base_path, num), "category": category_name, "status": "cached", "time": 0.0})
+
+    return sorted(records, key=lambda record: record["name"])
+
+def summarize_records(records):
+    """Passed (cached included), failed and cached tests of each category"""
+    category_results = {}
+    for record in records:
+        passed, failed, cached = category_results.get(record["category"], (0, 0, 0))
+        if record["status"] == "failed":
+            failed += 1
+        else:
+            passed += 1
+            cached += record["status"] == "cached"
+        category_results[record["category"]] = (passed, failed, cached)
+    return category_results
+
+def print_summary(category_results, duration, print_output=print):
+    total_passed = sum(passed for passed, failed, cached in category_results.values())
+    total_failed = sum(failed for passed, failed, cached in category_results.values())
+    total_cached = sum(cached for passed, failed, cached in category_results.values())
+
+    print_output("\n╔═════════════════════════════════════════════════════════════════════════╗")
+    print_output("║ Test Results By Category                                                ║")
+    print_output("╠══════════════════════════╦════════════╦════════════╦════════════╦═══════╣")
+    print_output("║ Category                 ║   Passed   ║   Failed   ║   Cached   ║ Total ║")
+    print_output("╠══════════════════════════╬════════════╬════════════╬════════════╬═══════╣")
+    
+    for category, (passed, failed, cached_tests) in sorted(category_results.items()):
+        total = passed + failed
+        passed_str = ColorFormatter.success(f"{passed:^10}") if passed > 0 else f"{passed:^10}"
+        failed_str = ColorFormatter.error(f"{failed:^10}") if failed > 0 else f"{failed:^10}"
+        print_output(f"║ {category:<24} ║ {passed_str} ║ {failed_str} ║ {cached_tests:^10} ║ {total:^6}║")
+    
+    print_output("╠══════════════════════════╩════════════╩════════════╩════════════╩═══════╣")
+    print_output(f"║ Total Tests: {total_passed + total_failed:<59}║")
+    total_passed_str = ColorFormatter.success(total_passed)
+    total_failed_str = ColorFormatter.error(total_failed) if total_failed > 0 else ColorFormatter.success(total_failed)
+    print_output(f"║ Total Passed: {total_passed_str:<67}║")
+    print_output(f"║ Total Failed: {total_failed_str:<67}║")
+    print_output(f"║ Total Cached: {total_cached:<58}║")
+    time_str = f"Total Time: {duration:.2f} seconds"
+    padding = 72 - len(time_str)
+    print_output(f"║ {time_str}{' ' * padding}║")
+    print_output("╚═════════════════════════════════════════════════════════════════════════╝")
+
+def xml_text(text):
+    # characters not allowed in XML 1.0 (the programs may print anything)
+    return "".join(c if c in "\t\n\r" or c >= " " else "?" for c in str(text))
+
+def write_json_report(path, records, duration, shard=None):
+    report = {"shard": f"{shard[0]}/{shard[1]}" if shard else None, "time": round(duration, 3), "tests": records}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+def write_junit_report(path, records, duration):
+    """JUnit XML: one testsuite per category, cached tests as skipped"""
+    failures = sum(record["status"] == "failed" for record in records)
+    skipped = sum(record["status"] == "cached" for record in records)
+    suites = ET.Element("testsuites", name="CREATOR", tests=str(len(records)), failures=str(failures),
+                        skipped=str(skipped), time=f"{duration:.3f}")
+
+    categories = sorted(set(record["category"] for record in records))
+    for category in categories:
+        tests = [record for record in records if record["category"] == category]
+        suite = ET.SubElement(suites, "testsuite", name=category, tests=str(len(tests)),
+                              failures=str(sum(record["status"] == "failed" for record in tests)),
+                              skipped=str(sum(record["status"] == "cached" for record in tests)),
+                              time=f"{sum(record['time'] for record in tests):.3f}")
+        for record in tests:
+            case = ET.SubElement(suite, "testcase", classname=category, name=record["name"], time=f"{record['time']:.3f}")
+            if record["status"] == "failed":
+                failure = ET.SubElement(case, "failure", message=xml_text(record["message"]))
+                if "expected" in record:
+                    failure.text = xml_text(f"Expected:\n{record['expected']}\nActual:\n{record['actual']}")
+            elif record["status"] == "cached":
+                ET.SubElement(case, "skipped", message="cached: passed with the same files and engine")
+
+    ET.indent(suites)
+    ET.ElementTree(suites).write(path, encoding="utf-8", xml_declaration=True)
+
+def write_reports(records, duration, output_lines, output_file=None, json_file=None, junit_file=None, shard=None):
+    if output_file:
+        with open(output_file, 'w') as f:
+            f.write("\n".join(output_lines) + "\n")
+    if json_file:
+        write_json_report(json_file, records, duration, shard)
+    if junit_file:
+        write_junit_report(junit_file, records, duration)
+
+def merge_reports(paths, output_file=None, json_file=None, junit_file=None, update_durations=False):
+    """Combine the JSON reports of several shards (--merge) into one summary and report"""
+    if output_file:
+        ColorFormatter.use_colors = False
+
+    output_lines = []
+    def print_output(*args, **kwargs):
+        output_lines.append(" ".join(str(arg) for arg in args))
+        print(*args, **kwargs)
+
+    # shards run at the same time: the merged run takes as long as the slowest one
+    records = {}
+    duration = 0
+    for path in paths:
+        with open(path, 'r') as f:
+            report = json.load(f)
+        duration = max(duration, report["time"])
+        for record in report["tests"]:
+            if record["name"] in records:
+                print_output(f"[MERGE] {record['name']} is in more than one report, keeping the one of {path}")
+            records[record["name"]] = record
+    records = sorted(records.values(), key=lambda record: record["name"])
+
+    for record in records:
+        if record["status"] == "failed":
+            print_output(f"[TEST] {record['category']} - {record['name']}: " + ColorFormatter.error("FAIL"))
+            print_output(f"      {record['message']}")
+
+    # wall times the shards are balanced with
+    if update_durations:
+        durations = load_json(SHARD_DURATIONS_FILE)
+        durations.update({record["name"]: record["time"] for record in records if record["status"] != "cached"})
+        save_json(SHARD_DURATIONS_FILE, durations)
+
+    print_summary(summarize_records(records), duration, print_output)
+    write_reports(records, duration, output_lines, output_file, json_file, junit_file)
+
+    return int(any(record["status"] == "failed" for record in records))
+
+def example_programs(arch=None):
+    """(set, program) of examples/, with the architecture of their example set"""
+    architectures = {}
+    for architecture in load_json(ARCHITECTURES_FILE):
+        for name in [architecture["name"]] + architecture.get("alias", []):
+            architectures[name] = f"./architecture/{architecture['file']}.json"
+
+    programs = []
+    for example_set in load_json(EXAMPLE_SETS_FILE):
+        arch_file = architectures.get(example_set["architecture"])
+        if arch_file is None or not os.path.exists(example_set["url"]):
+            continue
+        if arch and arch not in example_set["architecture"].lower().replace('-', ''):
+            continue
+
+        set_name = "examples/" + os.path.basename(os.path.dirname(example_set["url"]))
+        for example in load_json(example_set["url"]):
+            if os.path.exists(example["url"]):
+                programs.append((set_name, {"architecture": arch_file, "assembly": "./" + example["url"]}))
+
+    return programs
+
+def bench_programs(categories, with_examples=True, arch=None):
+    """(category, program) of every test of categories, then the examples"""
+    programs = []
+    for category, config in categories.items():
+        for num in config["numbers"]:
+            request = {"architecture": config["arch"], "assembly": test_name(config["path"], num) + ".s"}
+            if config.get("has_lib"):
+                request["library"] = test_name(config["path"], num) + ".o"
+            programs.append((category, request))
+
+    if with_examples:
+        programs += example_programs(arch)
+
+    return programs
+
+def bench_metrics(category, bench):
+    """Best compile and execute time (ms) of the runs, instructions executed and instructions per second"""
+    def best(values):
+        return round(min(values), 4) if values else None
+
+    metrics = {"category": category, "compile_ms": best(bench["compile"]), "execute_ms": best(bench["execute"]),
+               "instructions": bench["instructions"], "ips": None, "status": bench["status"]}
+    if metrics["execute_ms"]:
+        metrics["ips"] = round(bench["instructions"] / (metrics["execute_ms"] / 1000))
+    return metrics
+
+def bench_totals(programs):
+    """Compile time, execute time, instructions and instructions per second of each category and of all programs"""
+    totals = {}
+    for program in programs.values():
+        for group in (program["category"], "all programs"):
+            compile_ms, execute_ms, instructions, count = totals.get(group, (0, 0, 0, 0))
+            totals[group] = (compile_ms + (program["compile_ms"] or 0), execute_ms + (program["execute_ms"] or 0),
+                             instructions + program["instructions"], count + 1)
+
+    return {group: {"compile_ms": round(compile_ms, 4), "execute_ms": round(execute_ms, 4), "instructions": instructions,
+                    "ips": round(instructions / (execute_ms / 1000)) if execute_ms else None, "programs": count}
+            for group, (compile_ms, execute_ms, instructions, count) in totals.items()}
+
+def bench_regressions(baseline, programs, threshold):
+    """Metrics worse than in the baseline by more than threshold, for the programs in both"""
+    regressions = []
+    def check(name, metric, old, new, higher_is_worse=True):
+        if not old or new is None:
+            return
+        if (higher_is_worse and new > old * (1 + threshold)) or (not higher_is_worse and new < old * (1 - threshold)):
+            regressions.append(f"{name}: {metric} {old} -> {new} ({(new - old) / old:+.0%})")
+
+    common = sorted(name for name in programs if name in baseline)
+    for name in common:
+        check(name, "instructions", baseline[name]["instructions"], programs[name]["instructions"])
+
+    if common:
+        old = bench_totals({name: baseline[name] for name in common})["all programs"]
+        new = bench_totals({name: programs[name] for name in common})["all programs"]
+        check("all programs", "compile_ms", old["compile_ms"], new["compile_ms"])
+        check("all programs", "execute_ms", old["execute_ms"], new["execute_ms"])
+        check("all programs", "ips", old["ips"], new["ips"], higher_is_worse=False)
+
+    return regressions
+
+def print_bench_summary(programs, runs, print_output=print):
+    widths = [26, 10, 14, 14, 14, 14]
+    def row(cells):
+        return "║" + "║".join(f" {cell:{'<' if i == 0 else '>'}{width - 2}} " for i, (cell, width) in enumerate(zip(cells, widths))) + "║"
+    def rule(left, middle, right):
+        return left + middle.join("═" * width for width in widths) + right
+
+    print_output("\n" + rule("╔", "═", "╗"))
+    print_output(f"║ Benchmark (best of {runs} runs, times in ms)".ljust(sum(widths) + len(widths) - 1) + " ║")
+    print_output(rule("╠", "╦", "╣"))
+    print_output(row(["Category", "Programs", "Compile", "Execute", "Instructions", "Instr/s"]))
+    print_output(rule("╠", "╬", "╣"))
+    totals = bench_totals(programs)
+    for group in sorted(totals, key=lambda group: (group == "all programs", group)):
+        if group == "all programs":
+            print_output(rule("╠", "╬", "╣"))
+        total = totals[group]
+        print_output(row([group.capitalize() if group == "all programs" else group, total["programs"],
+                          f"{total['compile_ms']:.2f}", f"{total['execute_ms']:.2f}", total["instructions"], total["ips"] or 0]))
+    print_output(rule("╚", "╩", "╝"))
+
+async def run_benchmark(arch=None, category=None, runs=5, baseline_file=BENCH_BASELINE_FILE, save_baseline=False,
+                        threshold=BENCH_THRESHOLD, json_file=None):
+    """Run every program of the selected test categories (and examples/) runs times in one warm
+    engine, and compare its metrics with the baseline"""
+    filtered_categories = filter_test_categories(test_categories, arch, category)
+    programs = bench_programs(filtered_categories, category in (None, "examples"), arch)
+    if not programs:
+        print("No programs match the specified filters.")
+        return 1
+
+    # one worker only: the programs do not compete for the cpu
+    pool = EnginePool(1)
+    await pool.start()
+
+    results = {}
+    for program_category, request in programs:
+        reply = await pool.call(dict(request, bench=runs), ENGINE_CMD + ["--worker"])
+        if "bench" not in reply:
+            print(f"[BENCH] {request['assembly']}: " + ColorFormatter.error("ERROR"))
+            print("      " + reply["output"].replace('\n', '\n      '))
+            continue
+        results[request["assembly"]] = bench_metrics(program_category, reply["bench"])
+
+    await pool.close()
+
+    print_bench_summary(results, runs)
+    report = {"runs": runs, "programs": results}
+    if json_file:
+        save_json(json_file, report)
+
+    baseline = load_json(baseline_file).get("programs")
+    if save_baseline or baseline is None:
+        save_json(baseline_file, report)
+        print(f"Baseline saved in {baseline_file}")
+        return 0
+
+    regressions = bench_regressions(baseline, results, threshold)
+    for regression in regressions:
+        print(f"[BENCH] {regression}: " + ColorFormatter.error("REGRESSION"))
+    if regressions:
+        return 1
+
+    print(ColorFormatter.success(f"No regressions over {baseline_file} (threshold {threshold:.0%})"))
+    return 0
+
 def get_available_categories():
     """Returns lists of available architectures and their categories"""
     categories = {
@@ -251,15 +779,14 @@ def filter_test_categories(test_categories, arch=None, category=None):
         
     return filtered
 
-async def run_all_tests(arch=None, category=None, output_file=None):
+async def run_all_tests(arch=None, category=None, output_file=None, oneshot=False, jobs=None, use_cache=True, only_failed=False,
+                        shard=None, json_file=None, junit_file=None):
     if output_file:
         ColorFormatter.use_colors = False
     
     start_time = time.time()
     error = 0
-    total_passed = 0
-    total_failed = 0
-    category_results = {}
+    records = []
 
     # Capture output for file writing
     output_lines = []
@@ -276,48 +803,47 @@ async def run_all_tests(arch=None, category=None, output_file=None):
         print("No test categories match the specified filters.")
         return 1
 
-    for category, config in filtered_categories.items():
-        try:
-            cat_error, passed, failed = await run_test_category(
-                category,
-                config["numbers"],
-                config["path"],
-                config["arch"],
-                config["path"] if config.get("has_lib") else None
-            )
-            category_results[category] = (passed, failed)
-            error |= cat_error
-            total_passed += passed
-            total_failed += failed
-        except Exception as e:
-            print_output(f"Error running category {category}: {str(e)}")
-            error = 1
-            continue
+    # this machine runs its share of the tests only
+    if shard:
+        filtered_categories = shard_tests(filtered_categories, shard, load_json(SHARD_DURATIONS_FILE))
+
+    # passed tests with the same files and engine are not run again
+    cache = load_json(CACHE_FILE)
+    selected_categories, cached, keys = select_tests(filtered_categories, cache, engine_digest(), use_cache, only_failed)
+
+    if only_failed and not selected_categories:
+        print("No failed tests in the last run.")
+        return 0
+
+    # warm engines, unless every test starts its own
+    jobs = jobs or os.cpu_count() or 1
+    pool = None
+    if not oneshot and any(config["numbers"] for config in selected_categories.values()):
+        pool = EnginePool(jobs)
+        await pool.start()
+
+    # every selected test in one queue, results back per category
+    durations = load_json(DURATIONS_FILE)
+    results = await run_scheduled_tests(selected_categories, jobs, pool, durations)
+    save_json(DURATIONS_FILE, durations)
+
+    if pool:
+        await pool.close()
+
+    for category, config in selected_categories.items():
+        for test_num, success, error_msg, duration in results[category]:
+            name = f"{config['path']}_{test_num}"
+            cache[name] = {"key": keys[name], "passed": success}
+
+        cat_error, passed, failed = report_category(category, config["path"], results[category], print_output)
+        records += test_records(category, config["path"], results[category], cached[category])
+        error |= cat_error
+
+    save_json(CACHE_FILE, cache)
 
-    
-    print_output("\n╔═════════════════════════════════════════════════════════════════════════╗")
-    print_output("║ Test Results By Category                                                ║")
-    print_output("╠═══════════════════════════════════════╦════════════╦════════════╦═══════╣")
-    print_output("║ Category                              ║   Passed   ║   Failed   ║ Total ║")
-    print_output("╠═══════════════════════════════════════╬════════════╬════════════╬═══════╣")
-    
-    for category, (passed, failed) in sorted(category_results.items()):
-        total = passed + failed
-        passed_str = ColorFormatter.success(f"{passed:^10}") if passed > 0 else f"{passed:^10}"
-        failed_str = ColorFormatter.error(f"{failed:^10}") if failed > 0 else f"{failed:^10}"
-        print_output(f"║   {category:<35} ║ {passed_str} ║ {failed_str} ║ {total:^6}║")
-    
-    print_output("╠═══════════════════════════════════════╩════════════╩════════════╩═══════╣")
-    print_output(f"║ Total Tests: {total_passed + total_failed:<59}║")
-    total_passed_str = ColorFormatter.success(total_passed)
-    total_failed_str = ColorFormatter.error(total_failed) if total_failed > 0 else ColorFormatter.success(total_failed)
-    print_output(f"║ Total Passed: {total_passed_str:<67}║")
-    print_output(f"║ Total Failed: {total_failed_str:<67}║")
     duration = time.time() - start_time
-    time_str = f"Total Time: {duration:.2f} seconds"
-    padding = 72 - len(time_str)
-    print_output(f"║ {time_str}{' ' * padding}║")
-    print_output("╚═════════════════════════════════════════════════════════════════════════╝")
+    print_summary(summarize_records(records), duration, print_output)
+    write_reports(records, duration, output_lines, output_file, json_file, junit_file, shard)
     
     return error
 
@@ -333,6 +859,36 @@ def main():
                       help='List available architectures and categories')
     parser.add_argument('--nocolor', action='store_true',
                       help='Disable colored output')
+    parser.add_argument('--output', metavar='FILE',
+                      help='Also write the results (without colors) to FILE')
+    parser.add_argument('--oneshot', action='store_true',
+                      help='Start a new creator.mjs process for every test instead of reusing warm workers')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                      help='Number of tests run at the same time (default: one per core)')
+    parser.add_argument('--no-cache', action='store_true',
+                      help='Run every test, even those passed in the last run with the same files and engine')
+    parser.add_argument('--only-failed', action='store_true',
+                      help='Run only the tests that failed in the last run')
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                      help='Run only the i-th of N parts of the tests (balanced with test/durations.json)')
+    parser.add_argument('--json', metavar='FILE',
+                      help='Write a JSON report (every test with its status and wall time) to FILE')
+    parser.add_argument('--junit', metavar='FILE',
+                      help='Write a JUnit XML report to FILE')
+    parser.add_argument('--merge', nargs='+', metavar='REPORT',
+                      help='Merge the JSON reports of several shards instead of running tests')
+    parser.add_argument('--update-durations', action='store_true',
+                      help='With --merge, store the wall times of the merged tests in test/durations.json')
+    parser.add_argument('--bench', action='store_true',
+                      help='Benchmark the tests and examples/ programs in a warm engine instead of checking them')
+    parser.add_argument('--runs', type=int, default=5,
+                      help='With --bench, runs of every program (default: 5)')
+    parser.add_argument('--baseline', metavar='FILE', default=BENCH_BASELINE_FILE,
+                      help=f'With --bench, baseline to compare with (default: {BENCH_BASELINE_FILE}, saved if missing)')
+    parser.add_argument('--save-baseline', action='store_true',
+                      help='With --bench, save the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=BENCH_THRESHOLD,
+                      help=f'With --bench, relative change counted as a regression (default: {BENCH_THRESHOLD})')
 
     args = parser.parse_args()
 
@@ -344,7 +900,19 @@ def main():
                 print(f"  - {cat}")
         return 0
 
-    return asyncio.run(run_all_tests(args.arch, args.category, args.nocolor))
+    if args.nocolor:
+        ColorFormatter.use_colors = False
+
+    if args.merge:
+        return merge_reports(args.merge, args.output, args.json, args.junit, args.update_durations)
+
+    if args.bench:
+        return asyncio.run(run_benchmark(args.arch, args.category, args.runs, args.baseline, args.save_baseline,
+                                         args.threshold, args.json))
+
+    return asyncio.run(run_all_tests(args.arch, args.category, args.output, args.oneshot, args.jobs,
+                                    not args.no_cache, args.only_failed,
+                                    args.shard, args.json, args.junit))
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())